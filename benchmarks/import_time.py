@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Measures the cost of setting up Django with rest_admin installed, with
+``python -X importtime`` (Python 3.7+), as done by processes that don't
+serve the admin, and then of building the admin site's urls, as done by
+the first admin request. The same apps without rest_admin are the
+baseline.
+
+    PYTHONPATH=.:example python benchmarks/import_time.py
+"""
+import subprocess
+import sys
+
+INSTALLED_APPS = [
+    'django.contrib.admin.apps.SimpleAdminConfig',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+]
+
+SETUP = ('import django; from django.conf import settings; '
+         'settings.configure(INSTALLED_APPS=%r); django.setup()')
+
+BASELINE = SETUP % INSTALLED_APPS
+
+STATEMENTS = [
+    ('django.setup()', SETUP % (INSTALLED_APPS + ['rest_admin'])),
+    ('rest_admin.site.urls', SETUP % (INSTALLED_APPS + ['rest_admin']) +
+     '; import rest_admin; rest_admin.site.urls'),
+]
+
+
+def import_times(statement):
+    """
+    Returns ``{module: (self_us, cumulative_us)}`` for every module imported
+    while running ``statement``.
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        stderr=subprocess.STDOUT, universal_newlines=True)
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        times[module.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main():
+    baseline = import_times(BASELINE)
+    for label, statement in STATEMENTS:
+        times = import_times(statement)
+        extra = set(times) - set(baseline)
+        total = sum(times[module][0] for module in extra)
+        print('%-25s %4d modules %8.1fms' % (label, len(extra), total / 1000.0))
+        for prefix in ('rest_admin', 'restorm', 'django.contrib.admin'):
+            count = len([module for module in extra if module.startswith(prefix)])
+            print('    %-21s %4d modules' % (prefix, count))
+
+
+if __name__ == '__main__':
+    main()
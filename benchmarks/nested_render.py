@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Times the rendering of a tree of nested tabular inlines with and without
+``cache_inline_fragments``. Each of the 3 levels holds 50 rows, the first
+row of a level holds the formset of the next one. Plain Django models are
+used, unsaved, so no database or API is involved.
+
+    PYTHONPATH=. python benchmarks/nested_render.py [--rows 50] [--depth 3]
+"""
+import argparse
+import timeit
+
+import django
+from django.conf import settings
+
+settings.configure(
+    INSTALLED_APPS=[
+        'django.contrib.admin',
+        'django.contrib.auth',
+        'django.contrib.contenttypes',
+        'rest_admin',
+    ],
+    DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+    TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates', 'APP_DIRS': True}],
+    STATIC_URL='/static/',
+)
+django.setup()
+
+from django.contrib.admin import helpers  # noqa: E402
+from django.db import models  # noqa: E402
+from django.forms.models import inlineformset_factory  # noqa: E402
+from django.template.loader import get_template  # noqa: E402
+
+from rest_admin.templatetags import rest_admin_nested  # noqa: E402
+
+TEMPLATE = 'admin/edit_inline/tabular-nested.html'
+
+
+def make_model(name, parent=None):
+    attrs = {
+        '__module__': __name__,
+        'Meta': type('Meta', (), {'app_label': 'benchmarks'}),
+        'name': models.CharField(max_length=100, help_text='Name'),
+        'position': models.IntegerField(default=0),
+    }
+    if parent is not None:
+        attrs['parent'] = models.ForeignKey(parent, on_delete=models.CASCADE)
+    return type(name, (models.Model,), attrs)
+
+
+class InlineOptions(object):
+    template = TEMPLATE
+
+    def __init__(self, model):
+        self.verbose_name = model._meta.verbose_name
+        self.verbose_name_plural = model._meta.verbose_name_plural
+
+
+class ModelAdminStub(object):
+    cache_inline_fragments = False
+
+
+def build_tree(models_, rows, model_admin, prefix=None, depth=0):
+    parent, model = models_[depth], models_[depth + 1]
+    formset_class = inlineformset_factory(
+        parent, model, fields=('name', 'position'), extra=rows)
+    formset = formset_class(instance=parent(), prefix=prefix)
+    fieldsets = [(None, {'fields': ['name', 'position']})]
+    admin_formset = helpers.InlineAdminFormSet(
+        type('Inline%d' % depth, (InlineOptions,), {})(model), formset,
+        fieldsets, {}, [], model_admin=model_admin)
+    for form in formset.forms:
+        form.nested_admin_formsets = []
+    if depth + 2 < len(models_):
+        form = formset.forms[0]
+        form.nested_admin_formsets = [
+            build_tree(models_, rows, model_admin, '%s-nested' % form.prefix, depth + 1)]
+    return admin_formset
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--number', type=int, default=20)
+    args = parser.parse_args()
+
+    models_ = [make_model('Root')]
+    for level in range(args.depth):
+        models_.append(make_model('Level%d' % level, models_[-1]))
+
+    template = get_template(TEMPLATE)
+    for cached in (False, True):
+        rest_admin_nested._templates.clear()
+        rest_admin_nested._fragments.clear()
+        model_admin = ModelAdminStub()
+        model_admin.cache_inline_fragments = cached
+        tree = build_tree(models_, args.rows, model_admin)
+        context = {'inline_admin_formset': tree}
+
+        def render():
+            return template.render(context)
+
+        size = len(render())
+        seconds = min(timeit.repeat(render, number=args.number, repeat=3)) / args.number
+        print('cache_inline_fragments=%-5s %8.1fms per render, %d bytes' % (
+            cached, seconds * 1000, size))
+
+
+if __name__ == '__main__':
+    main()
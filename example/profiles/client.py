@@ -1,7 +1,9 @@
 from restorm.clients.jsonclient import JSONClient
 
+from rest_admin.clients import FastJSONClientMixin
 
-class ApiAuthJSONClient(JSONClient):
+
+class ApiAuthJSONClient(FastJSONClientMixin, JSONClient):
     api_credentials = {
         'ApiAuth_ApiUser': 'automation',
         'ApiAuth-ApiKey': 'test',
@@ -1,9 +1,21 @@
-from django.utils.module_loading import autodiscover_modules
+import sys
+from importlib import import_module
+from types import ModuleType
 
-from rest_admin.options import RestAdmin, StackedRestInline, TabularRestInline
-from rest_admin.nested import NestedRestAdmin, NestedStackedInline, NestedTabularInline
-from rest_admin.sites import RestAdminSite, site
 
+# Public names are imported on first access so that importing the package
+# doesn't pull in restorm and django.contrib.admin for processes that never
+# serve the admin (management commands, workers, etc.).
+_lazy_names = {
+    "RestAdminSite": "rest_admin.sites",
+    "site": "rest_admin.sites",
+    "RestAdmin": "rest_admin.options",
+    "StackedRestInline": "rest_admin.options",
+    "TabularRestInline": "rest_admin.options",
+    "NestedRestAdmin": "rest_admin.nested",
+    "NestedStackedInline": "rest_admin.nested",
+    "NestedTabularInline": "rest_admin.nested",
+}
 
 __all__ = [
     "RestAdminSite", "autodiscover",
@@ -13,7 +25,36 @@ __all__ = [
 
 
 def autodiscover():
+    from django.utils.module_loading import autodiscover_modules
+    from rest_admin.sites import site
+
     autodiscover_modules('admin', register_to=site)
 
 
 default_app_config = 'rest_admin.apps.RestAdminConfig'
+
+
+class LazyModule(ModuleType):
+    """
+    Module type resolving the names in ``_lazy_names`` on first access. Works
+    on Python versions without module level ``__getattr__``.
+    """
+
+    def __getattr__(self, name):
+        if name not in _lazy_names:
+            raise AttributeError(
+                "module %r has no attribute %r" % (self.__name__, name))
+        value = getattr(import_module(_lazy_names[name]), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_lazy_names))
+
+
+_module = LazyModule(__name__)
+_module.__dict__.update(sys.modules[__name__].__dict__)
+# Keep a reference to the original module, on Python 2 its globals are
+# cleared when it is garbage collected.
+_module._original_module = sys.modules[__name__]
+sys.modules[__name__] = _module
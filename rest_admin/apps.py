@@ -1,23 +1,84 @@
-from django.contrib.admin.apps import SimpleAdminConfig
-from django.core.exceptions import FieldDoesNotExist
-from django.contrib.admin import checks
-from django.db import models
+import threading
 
-from restorm.resource import Resource
-from restorm.fields.related import RelatedResource
-from restorm import forms as restorm_forms
+from django.apps import AppConfig, apps
+from django.conf import settings
+from django.core.checks import register, Tags
 
 
-class RestAdminConfig(SimpleAdminConfig):
-    """Custom AppConfig for rest_admin which does autodiscovery."""
+def setup():
+    """
+    Runs the deferred setup of the rest_admin app, if it's installed.
+    """
+    try:
+        config = apps.get_app_config('rest_admin')
+    except LookupError:
+        return
+    config.setup()
+
+
+def check_admin_site(app_configs, **kwargs):
+    setup()
+    from rest_admin.sites import site
+    return site.check(app_configs)
+
+
+class RestAdminConfig(AppConfig):
+    """
+    Custom AppConfig for rest_admin which does autodiscovery.
+
+    Patching django.contrib.admin and importing the admin modules pulls in
+    restorm and the whole admin, which processes that never serve it
+    (workers, most management commands) can do without. Unless the
+    ``REST_ADMIN_EAGER_SETUP`` setting is True, that's deferred until the
+    site's urls are built or the system checks run.
+    """
     name = 'rest_admin'
     verbose_name = 'Rest Admin'
 
+    def __init__(self, *args, **kwargs):
+        super(RestAdminConfig, self).__init__(*args, **kwargs)
+        self._setup_done = False
+        self._setup_running = False
+        self._setup_lock = threading.RLock()
+
     def patch_default_admin_site(self):
         from django.contrib import admin
         admin.site = self.module.site
 
+    def patch_formfield_defaults(self):
+        from django.contrib.admin import widgets
+        from django.contrib.admin.options import FORMFIELD_FOR_DBFIELD_DEFAULTS
+        from restorm import fields as rest_fields
+
+        # Defaults for restorm fields. ModelAdmin subclasses can change this
+        # by adding to ModelAdmin.formfield_overrides.
+        # Leaving commented lines for currently unsupported fields
+        FORMFIELD_FOR_DBFIELD_DEFAULTS.update({
+            rest_fields.DateTimeField: {
+                # 'form_class': forms.SplitDateTimeField,
+                'widget': widgets.AdminSplitDateTime
+            },
+            rest_fields.DateField: {'widget': widgets.AdminDateWidget},
+            # rest_fields.TimeField: {'widget': widgets.AdminTimeWidget},
+            rest_fields.TextField: {'widget': widgets.AdminTextareaWidget},
+            rest_fields.URLField: {'widget': widgets.AdminURLFieldWidget},
+            rest_fields.IntegerField: {'widget': widgets.AdminIntegerFieldWidget},
+            # rest_fields.BigIntegerField: {'widget': widgets.AdminBigIntegerFieldWidget},
+            rest_fields.CharField: {'widget': widgets.AdminTextInputWidget},
+            rest_fields.JSONField: {'widget': widgets.AdminTextareaWidget},
+            # rest_fields.ImageField: {'widget': widgets.AdminFileWidget},
+            # rest_fields.FileField: {'widget': widgets.AdminFileWidget},
+            # rest_fields.EmailField: {'widget': widgets.AdminEmailInputWidget},
+        })
+
     def patch_system_checks(self):
+        from django.contrib.admin import checks
+        from django.core.exceptions import FieldDoesNotExist
+        from django.db import models
+        from restorm import forms as restorm_forms
+        from restorm.fields.related import RelatedResource
+        from restorm.resource import Resource
+
         def _check_raw_id_fields_item(self, cls, model, field_name, label):
             """ Check an item of `raw_id_fields`, i.e. check that field named
             `field_name` exists in model `model` and is a ForeignKey or a
@@ -106,8 +167,26 @@ class RestAdminConfig(SimpleAdminConfig):
                     return []
         checks.InlineModelAdminChecks._check_relation = _check_relation
 
+    def setup(self):
+        if self._setup_done:
+            return
+        # Other threads wait for the setup to finish, it's retried if it
+        # failed.
+        with self._setup_lock:
+            # The admin modules use the site while autodiscovered.
+            if self._setup_done or self._setup_running:
+                return
+            self._setup_running = True
+            try:
+                self.patch_default_admin_site()
+                self.patch_formfield_defaults()
+                self.patch_system_checks()
+                self.module.autodiscover()
+            finally:
+                self._setup_running = False
+            self._setup_done = True
+
     def ready(self):
-        self.patch_default_admin_site()
-        self.patch_system_checks()
-        super(RestAdminConfig, self).ready()
-        self.module.autodiscover()
+        register(check_admin_site, Tags.admin)
+        if getattr(settings, 'REST_ADMIN_EAGER_SETUP', False):
+            self.setup()
@@ -0,0 +1,194 @@
+"""
+Circuit breakers for the upstream APIs, see
+``rest_admin.clients.CircuitBreakerClientMixin``. Breakers are shared by
+the clients of a process and looked up by name.
+"""
+import sys
+import threading
+import time
+
+from django.utils import six
+
+from .exceptions import CallTimedOut, TooManyCalls
+
+
+class CircuitBreaker(object):
+    """
+    Opens after ``failure_threshold`` consecutive failures, rejecting calls
+    for ``reset_timeout`` seconds. A single trial call is let through after
+    that, closing the circuit again if it succeeds.
+
+    The timeout of calls adapts to the observed latency like TCP's
+    retransmission timeout: the smoothed latency plus four times its mean
+    deviation, bounded by ``min_timeout`` and ``max_timeout``.
+
+    At most ``max_calls`` calls run at once, see ``call_with_timeout``.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30,
+                 min_timeout=1.0, max_timeout=30.0, max_calls=20):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.slots = threading.BoundedSemaphore(max_calls)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.latency = None
+        self.latency_deviation = 0.0
+        self.counters = dict.fromkeys(
+            ('calls', 'failures', 'rejected', 'timeouts', 'stale'), 0)
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        if self.latency is None:
+            return self.max_timeout
+        timeout = self.latency + 4 * self.latency_deviation
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.time() - self.opened_at < self.reset_timeout:
+                    self.counters['rejected'] += 1
+                    return False
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._trial:
+                    self.counters['rejected'] += 1
+                    return False
+                self._trial = True
+            self.counters['calls'] += 1
+            return True
+
+    def record_success(self, elapsed):
+        with self._lock:
+            if self.latency is None:
+                self.latency = elapsed
+                self.latency_deviation = elapsed / 2
+            else:
+                self.latency_deviation += (abs(elapsed - self.latency) - self.latency_deviation) / 4
+                self.latency += (elapsed - self.latency) / 8
+            self.failures = 0
+            self.state = self.CLOSED
+            self._trial = False
+
+    def record_failure(self, timeout=False):
+        with self._lock:
+            self.failures += 1
+            self.counters['failures'] += 1
+            if timeout:
+                self.counters['timeouts'] += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.time()
+            self._trial = False
+
+    def record_cancel(self):
+        """
+        Ends a call cut short by the caller, without judging the resource.
+        """
+        with self._lock:
+            self._trial = False
+
+    def record_stale(self):
+        with self._lock:
+            self.counters['stale'] += 1
+
+    def metrics(self):
+        with self._lock:
+            metrics = dict(self.counters)
+            metrics.update({
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'latency': self.latency,
+                'timeout': self.timeout,
+            })
+        return metrics
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, **options):
+    """
+    Returns the breaker called ``name``, creating it with ``options``.
+    """
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(name, **options)
+    return breaker
+
+
+def get_metrics():
+    """
+    Returns the state and counters of every breaker, keyed by name.
+    """
+    return dict((name, breaker.metrics()) for name, breaker in list(_breakers.items()))
+
+
+def call_with_timeout(func, timeout, slots=None):
+    """
+    Runs ``func`` on a thread of its own and gives up waiting for it after
+    ``timeout`` seconds, raising ``CallTimedOut``. Exceptions raised by
+    ``func`` are raised again as they are.
+
+    A call that hangs keeps its thread until the connection times out.
+    ``slots``, a semaphore held until ``func`` returns, bounds the number of
+    such threads so that a hanging resource doesn't hold up calls to the
+    others: when no slot is free, ``TooManyCalls`` is raised right away.
+    """
+    if slots is not None and not slots.acquire(False):
+        raise TooManyCalls("too many calls in progress")
+    outcome = {}
+
+    def run():
+        try:
+            outcome['result'] = func()
+        except BaseException:
+            outcome['error'] = sys.exc_info()
+        finally:
+            if slots is not None:
+                slots.release()
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise CallTimedOut("no response within %.1f seconds" % timeout)
+    if 'error' in outcome:
+        six.reraise(*outcome['error'])
+    return outcome['result']
+
+
+_local = threading.local()
+
+
+def reset_stale():
+    _local.stale = []
+
+
+def add_stale(uri):
+    if getattr(_local, 'stale', None) is None:
+        _local.stale = []
+    _local.stale.append(uri)
+
+
+def get_stale():
+    """
+    Returns the uris served from stale copies since ``reset_stale`` was
+    called by the current thread.
+    """
+    return list(getattr(_local, 'stale', None) or ())
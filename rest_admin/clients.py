@@ -0,0 +1,405 @@
+"""
+Mixins for the restorm clients used by the admin. Mix them in before the
+restorm client class, e.g.::
+
+    class ProfilesClient(FastJSONClientMixin, JSONClient):
+        pass
+"""
+import copy
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.utils.six.moves.urllib.parse import urlparse
+
+try:
+    import ujson as fast_json
+except ImportError:
+    try:
+        import simplejson as fast_json
+    except ImportError:
+        fast_json = None
+
+from . import deadlines
+from .circuits import add_stale, call_with_timeout, get_breaker
+from .exceptions import CallTimedOut, DeadlineExceeded, ResourceUnavailable, TooManyCalls
+from .ratelimit import get_bucket, get_priority
+
+logger = logging.getLogger(__name__)
+
+
+def get_resource_name(client, uri):
+    """
+    Returns the root uri of ``client`` followed by the first segment of the
+    resource path of ``uri``.
+    """
+    root_uri = getattr(client, 'root_uri', None) or ''
+    if root_uri and uri.startswith(root_uri):
+        path = uri[len(root_uri):]
+    else:
+        parsed = urlparse(uri)
+        root_uri = '%s://%s/' % (parsed.scheme, parsed.netloc)
+        path = parsed.path
+    return root_uri + path.lstrip('/').split('/', 1)[0].split('?', 1)[0]
+
+
+class FastJSONClientMixin(object):
+    """
+    Decodes response bodies with ``ujson`` or ``simplejson`` when one of them
+    is installed, falling back to the client's own decoding otherwise.
+    """
+
+    def create_response_content(self, response_content):
+        if fast_json is None:
+            return super(FastJSONClientMixin, self).create_response_content(
+                response_content)
+        try:
+            return fast_json.loads(response_content)
+        except ValueError:
+            return response_content
+
+
+_etags_local = threading.local()
+
+
+def get_etags():
+    """
+    Returns a copy of the ETags recorded by the current thread, for
+    ``set_etags`` to hand them to another thread.
+    """
+    etags = getattr(_etags_local, 'etags', None) or {}
+    return dict((key, dict(client_etags)) for key, client_etags in etags.items())
+
+
+def set_etags(etags):
+    _etags_local.etags = etags
+
+
+class ETagClientMixin(object):
+    """
+    Remembers the ``ETag`` of the resources fetched by the current thread so
+    it can be sent back in an ``If-Match`` header when saving them.
+    """
+    max_etags = 1000
+
+    @property
+    def _etags(self):
+        etags = getattr(_etags_local, 'etags', None)
+        if etags is None:
+            etags = _etags_local.etags = {}
+        return etags.setdefault(id(self), {})
+
+    def get_etag_key(self, uri):
+        # The query string, e.g. a sparse fieldset, doesn't change the
+        # resource the ETag is for.
+        return uri.split('?', 1)[0]
+
+    def get_etag(self, uri):
+        return self._etags.get(self.get_etag_key(uri))
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5,
+                connection_type=None):
+        response = super(ETagClientMixin, self).request(
+            uri, method, body, headers, redirections, connection_type)
+        if method == 'GET' and response.get('etag'):
+            etags = self._etags
+            if len(etags) >= self.max_etags:
+                etags.clear()
+            etags[self.get_etag_key(uri)] = response['etag']
+        return response
+
+
+def _copy_error(error):
+    """
+    Returns a copy of ``error`` to raise in another thread, or ``error``
+    itself if it can't be copied.
+    """
+    try:
+        return copy.copy(error)
+    except Exception:
+        return error
+
+
+class _Flight(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class SingleFlightClientMixin(object):
+    """
+    Coalesces identical concurrent GET requests. While a GET for a uri (with
+    the same headers) is in flight, other threads asking for it wait for it
+    and get a copy of its response, or error, instead of requesting it again.
+    They request it themselves when it ran out of the time of the thread
+    that sent it.
+
+    With ``single_flight_cache`` set to the alias of a cache shared by the
+    processes of a host, e.g. a file based or local memcached one, the
+    processes coalesce their requests too: the first one to take the lock in
+    the cache fetches the resource and stores the response there for the
+    others, falling back to fetching it themselves after
+    ``single_flight_timeout`` seconds. Responses must be picklable for that.
+
+    Mix it in after ``ETagClientMixin``, so every thread records the ETag of
+    the shared responses.
+    """
+    single_flight_cache = None
+    single_flight_timeout = 10
+    single_flight_result_ttl = 5
+    single_flight_poll_interval = 0.05
+
+    @property
+    def _single_flight(self):
+        return self.__dict__.setdefault('_single_flight_state', ({}, threading.Lock()))
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5,
+                connection_type=None):
+        def fetch():
+            return super(SingleFlightClientMixin, self).request(
+                uri, method, body, headers, redirections, connection_type)
+
+        if method != 'GET':
+            return fetch()
+
+        key = (uri, tuple(sorted((headers or {}).items())))
+        flights, lock = self._single_flight
+        while True:
+            with lock:
+                flight = flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = flights[key] = _Flight()
+            if leader:
+                break
+            flight.event.wait()
+            if flight.error is None:
+                return copy.deepcopy(flight.response)
+            # The leader ran out of its own time, this thread may have more.
+            if not isinstance(flight.error, (CallTimedOut, DeadlineExceeded)):
+                raise _copy_error(flight.error)
+
+        try:
+            if self.single_flight_cache is None:
+                flight.response = fetch()
+            else:
+                flight.response = self._cross_process_request(key, fetch)
+        except Exception as err:
+            flight.error = err
+            raise
+        finally:
+            with lock:
+                del flights[key]
+            flight.event.set()
+        return flight.response
+
+    def _cross_process_request(self, key, fetch):
+        from django.core.cache import caches
+        cache = caches[self.single_flight_cache]
+        digest = hashlib.md5(repr(key).encode('utf-8')).hexdigest()
+        lock_key = 'rest_admin:flight:lock:%s' % digest
+        result_key = 'rest_admin:flight:result:%s' % digest
+
+        if cache.add(lock_key, 1, self.single_flight_timeout):
+            cache.delete(result_key)
+            try:
+                response = fetch()
+                try:
+                    cache.set(result_key, response, self.single_flight_result_ttl)
+                except Exception:
+                    logger.warning("Could not share the response of %s.", key[0], exc_info=True)
+                return response
+            finally:
+                cache.delete(lock_key)
+
+        deadline = time.time() + self.single_flight_timeout
+        while time.time() < deadline:
+            response = cache.get(result_key)
+            if response is not None:
+                return response
+            if cache.get(lock_key) is None:
+                # The request failed or its response could not be shared.
+                break
+            time.sleep(self.single_flight_poll_interval)
+        return fetch()
+
+
+class CircuitBreakerClientMixin(object):
+    """
+    Guards every resource of the API with a circuit breaker (see
+    ``rest_admin.circuits``). Calls run with a timeout adapted to the
+    resource's latency. While its circuit is open, calls to a resource fail
+    right away with ``ResourceUnavailable``, which the admin site shows as
+    an error page. GET requests are then answered with the last response
+    fetched for the uri instead when ``stale_responses`` is set to the
+    number of responses to keep.
+
+    Calls run on threads of their own to be timed out, at most
+    ``circuit_max_calls`` at once per resource, so mix it in last, after
+    ``ETagClientMixin`` and ``SingleFlightClientMixin``. Their timeout is
+    cut short by the deadline of the admin request, like with
+    ``DeadlineClientMixin``, which isn't needed along with it.
+    ``ResourceUnavailable`` raised by the client it's mixed into is passed
+    on as it is, without counting against the circuit.
+    """
+    circuit_failure_threshold = 5
+    circuit_reset_timeout = 30
+    circuit_min_timeout = 1.0
+    circuit_max_timeout = 30.0
+    circuit_max_calls = 20
+    stale_responses = 0
+
+    @property
+    def _stale(self):
+        return self.__dict__.setdefault('_stale_state', (OrderedDict(), threading.Lock()))
+
+    def get_circuit_name(self, uri):
+        """
+        Returns the name of the breaker guarding ``uri``, one per resource.
+        """
+        return get_resource_name(self, uri)
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5,
+                connection_type=None):
+        def fetch():
+            return super(CircuitBreakerClientMixin, self).request(
+                uri, method, body, headers, redirections, connection_type)
+
+        budget = deadlines.check()
+        breaker = get_breaker(
+            self.get_circuit_name(uri),
+            failure_threshold=self.circuit_failure_threshold,
+            reset_timeout=self.circuit_reset_timeout,
+            min_timeout=self.circuit_min_timeout,
+            max_timeout=self.circuit_max_timeout,
+            max_calls=self.circuit_max_calls)
+        if not breaker.allow():
+            return self.get_stale_response(
+                breaker, uri, method, headers,
+                ResourceUnavailable("%s is unavailable" % breaker.name))
+
+        timeout = breaker.timeout
+        cut_short = budget is not None and budget < timeout
+        start = time.time()
+        try:
+            response = call_with_timeout(
+                fetch, budget if cut_short else timeout, breaker.slots)
+        except CallTimedOut as err:
+            if cut_short:
+                breaker.record_cancel()
+                raise DeadlineExceeded("the request ran out of time waiting for %s" % uri)
+            breaker.record_failure(timeout=True)
+            return self.get_stale_response(breaker, uri, method, headers, err)
+        except TooManyCalls as err:
+            # The calls in progress will be judged when they time out.
+            breaker.record_cancel()
+            return self.get_stale_response(breaker, uri, method, headers, err)
+        except ResourceUnavailable:
+            breaker.record_cancel()
+            raise
+        except Exception as err:
+            breaker.record_failure()
+            return self.get_stale_response(breaker, uri, method, headers, err)
+
+        if getattr(response, 'status', 200) >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success(time.time() - start)
+            if method == 'GET' and self.stale_responses:
+                self.store_stale_response(uri, headers, response)
+        return response
+
+    def _stale_key(self, uri, headers):
+        return (uri, tuple(sorted((headers or {}).items())))
+
+    def store_stale_response(self, uri, headers, response):
+        responses, lock = self._stale
+        copied = copy.deepcopy(response)
+        with lock:
+            key = self._stale_key(uri, headers)
+            responses.pop(key, None)
+            responses[key] = copied
+            while len(responses) > self.stale_responses:
+                responses.popitem(last=False)
+
+    def get_stale_response(self, breaker, uri, method, headers, error):
+        """
+        Returns a copy of the last response to the GET request of ``uri``,
+        raising ``error`` if there is none.
+        """
+        if method == 'GET' and self.stale_responses:
+            responses, lock = self._stale
+            with lock:
+                response = responses.get(self._stale_key(uri, headers))
+            if response is not None:
+                breaker.record_stale()
+                add_stale(uri)
+                return copy.deepcopy(response)
+        raise error
+
+
+class RateLimitClientMixin(object):
+    """
+    Sends at most ``rate_limit`` requests a second, in bursts of up to
+    ``rate_limit_burst``, to the API or, with ``rate_limit_per_resource``, to
+    each of its resources (see ``rest_admin.ratelimit``). Requests made by
+    background work wait behind the ones of page loads. A request waiting
+    longer than ``rate_limit_timeout`` seconds fails with ``RateLimited``.
+
+    Mix it in before ``CircuitBreakerClientMixin``, so the time spent
+    waiting doesn't count towards the request's timeout.
+    """
+    rate_limit = None
+    rate_limit_burst = None
+    rate_limit_per_resource = False
+    rate_limit_timeout = 30
+
+    def get_rate_limit_name(self, uri):
+        if self.rate_limit_per_resource:
+            return get_resource_name(self, uri)
+        return getattr(self, 'root_uri', None) or get_resource_name(self, uri)
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5,
+                connection_type=None):
+        if self.rate_limit:
+            bucket = get_bucket(
+                self.get_rate_limit_name(uri), self.rate_limit, self.rate_limit_burst)
+            timeout = self.rate_limit_timeout
+            budget = deadlines.check()
+            if budget is not None:
+                timeout = min(timeout, budget)
+            bucket.acquire(get_priority(), timeout)
+        return super(RateLimitClientMixin, self).request(
+            uri, method, body, headers, redirections, connection_type)
+
+
+class DeadlineClientMixin(object):
+    """
+    Times requests out when the deadline of the admin request they're made
+    for passes (see ``rest_admin.deadlines``), raising ``DeadlineExceeded``.
+    Requests run on threads of their own to be timed out, at most
+    ``deadline_max_calls`` at once per client, so mix it in last.
+    """
+    deadline_max_calls = 20
+
+    @property
+    def _deadline_slots(self):
+        return self.__dict__.setdefault(
+            '_deadline_slots_state', threading.BoundedSemaphore(self.deadline_max_calls))
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5,
+                connection_type=None):
+        def fetch():
+            return super(DeadlineClientMixin, self).request(
+                uri, method, body, headers, redirections, connection_type)
+
+        budget = deadlines.check()
+        if budget is None:
+            return fetch()
+        try:
+            return call_with_timeout(fetch, budget, self._deadline_slots)
+        except CallTimedOut:
+            raise DeadlineExceeded("the request ran out of time waiting for %s" % uri)
@@ -0,0 +1,89 @@
+"""
+Deadlines of admin requests. A deadline is set for the thread serving a
+request by ``rest_admin.middleware.DeadlineMiddleware``, from the
+``REST_ADMIN_REQUEST_DEADLINE`` setting, and by the admin site for the
+views of admins with a ``request_deadline``, the earliest one winning.
+Background jobs get their own deadline, see ``rest_admin.jobs``.
+
+Upstream calls made by the thread get the time left as their timeout, see
+``rest_admin.clients.DeadlineClientMixin``. Optional work, e.g. counts,
+facets or prefetches, is skipped when less than
+``REST_ADMIN_OPTIONAL_WORK_BUDGET`` seconds (1 by default) are left.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .exceptions import DeadlineExceeded
+
+_local = threading.local()
+
+
+def get_deadline():
+    return getattr(_local, 'deadline', None)
+
+
+def set_deadline(seconds):
+    """
+    Sets the deadline of the current thread ``seconds`` from now, unless
+    it has an earlier one. Returns the previous deadline.
+    """
+    previous = get_deadline()
+    deadline = time.time() + seconds
+    _local.deadline = deadline if previous is None else min(previous, deadline)
+    return previous
+
+
+def clear_deadline(previous=None):
+    _local.deadline = previous
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Runs the block with a deadline ``seconds`` from now, if not None.
+    """
+    if seconds is None:
+        yield
+        return
+    previous = set_deadline(seconds)
+    try:
+        yield
+    finally:
+        clear_deadline(previous)
+
+
+def remaining():
+    """
+    Returns the seconds left until the current thread's deadline, None if
+    it has none.
+    """
+    deadline = get_deadline()
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def check():
+    """
+    Raises ``DeadlineExceeded`` if the current thread's deadline passed,
+    otherwise returns the seconds left (None if it has no deadline).
+    """
+    budget = remaining()
+    if budget is not None and budget <= 0:
+        raise DeadlineExceeded("the request ran out of time")
+    return budget
+
+
+def has_budget(seconds=None):
+    """
+    Returns whether at least ``seconds`` are left for optional work.
+    """
+    budget = remaining()
+    if budget is None:
+        return True
+    if seconds is None:
+        seconds = getattr(settings, 'REST_ADMIN_OPTIONAL_WORK_BUDGET', 1.0)
+    return budget >= seconds
@@ -0,0 +1,229 @@
+import logging
+from collections import OrderedDict
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+from django.contrib.admin.utils import quote
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.utils.encoding import force_text
+from django.utils.html import format_html
+from django.utils.text import capfirst
+from django.utils.translation import ugettext as _
+
+from restorm.fields.related import ToManyField
+from restorm.forms import _get_foreign_key
+from restorm.resource import Resource
+
+from .ratelimit import BULK, priority
+
+logger = logging.getLogger(__name__)
+
+
+class DeleteStopped(Exception):
+    """
+    A resource of the cascade could not be deleted. ``deleted`` lists the
+    resources deleted before the cascade stopped.
+    """
+
+    def __init__(self, message, deleted=()):
+        super(DeleteStopped, self).__init__(message)
+        self.deleted = list(deleted)
+
+
+class DeletePlanner(object):
+    """
+    Finds the resources that have to be deleted along with a resource and
+    deletes them bottom-up.
+
+    A ``ToManyField`` is followed when the related resource has a
+    ``ToOneField`` back to the resource holding it, i.e. when the related
+    resources are owned by it. Each level of the cascade is fetched with one
+    list request per relation, filtering on ``<to one field>__in``.
+    """
+
+    def __init__(self, model_admin, request, cascade=True, concurrency=4,
+                 progress=None):
+        self.model_admin = model_admin
+        self.admin_site = model_admin.admin_site
+        self.request = request
+        self.cascade = cascade
+        self.concurrency = concurrency
+        self.progress = progress
+        # Resources to delete, one list per level of the cascade.
+        self.levels = []
+        self.children = {}
+        self.perms_needed = set()
+        # Resources deleted so far by delete().
+        self.deleted = []
+        self._seen = set()
+
+    def _key(self, obj):
+        return (obj.__class__, obj.pk)
+
+    def get_relations(self, model):
+        """
+        Returns ``(related_model, to_one_field)`` pairs for the relations of
+        ``model`` the deletion cascades into.
+        """
+        relations = []
+        if not self.cascade:
+            return relations
+        for field in model._meta.fields:
+            if not isinstance(field, ToManyField):
+                continue
+            related_model = field.rel.to
+            try:
+                fk = _get_foreign_key(model, related_model)
+            except ValueError:
+                continue
+            relations.append((related_model, fk))
+        return relations
+
+    def collect(self, objs):
+        level = []
+        for obj in objs:
+            self._seen.add(self._key(obj))
+            level.append(obj)
+        while level:
+            self.levels.append(level)
+            level = self.collect_related(level)
+        return self
+
+    def collect_related(self, objs):
+        by_model = OrderedDict()
+        for obj in objs:
+            by_model.setdefault(obj.__class__, []).append(obj)
+
+        related = []
+        for model, model_objs in by_model.items():
+            parents = OrderedDict((force_text(obj.pk), obj) for obj in model_objs)
+            for related_model, fk in self.get_relations(model):
+                queryset = related_model.objects.filter(**{
+                    '%s__in' % fk.name: ','.join(parents)})
+                for child in queryset:
+                    key = self._key(child)
+                    if key in self._seen:
+                        continue
+                    self._seen.add(key)
+                    parent = getattr(child, fk.name)
+                    if isinstance(parent, Resource):
+                        parent = parent.pk
+                    parent = parents.get(force_text(parent))
+                    if parent is not None:
+                        self.children.setdefault(self._key(parent), []).append(child)
+                    related.append(child)
+        return related
+
+    def format_object(self, obj):
+        opts = obj._meta
+        no_edit_link = '%s: %s' % (capfirst(opts.verbose_name), force_text(obj))
+        model_admin = self.admin_site._registry.get(obj.__class__)
+        if model_admin is None:
+            return no_edit_link
+        if not model_admin.has_delete_permission(self.request):
+            self.perms_needed.add(opts.verbose_name)
+        try:
+            admin_url = reverse(
+                '%s:%s_%s_change' % (self.admin_site.name, opts.app_label, opts.model_name),
+                None, (quote(obj.pk),))
+        except NoReverseMatch:
+            return no_edit_link
+        return format_html(
+            u'{}: <a href="{}">{}</a>', capfirst(opts.verbose_name), admin_url, obj)
+
+    def _nested(self, obj):
+        children = []
+        for child in self.children.get(self._key(obj), ()):
+            children.extend(self._nested(child))
+        if children:
+            return [self.format_object(obj), children]
+        return [self.format_object(obj)]
+
+    def nested(self):
+        """
+        Returns the cascade as a nested list of strings suitable for display
+        in the template with the ``unordered_list`` filter.
+        """
+        nested = []
+        for obj in self.levels[0] if self.levels else ():
+            nested.extend(self._nested(obj))
+        return nested
+
+    @property
+    def model_count(self):
+        model_count = {}
+        for level in self.levels:
+            for obj in level:
+                name = obj._meta.verbose_name_plural
+                model_count[name] = model_count.get(name, 0) + 1
+        return model_count
+
+    def delete_object(self, obj, failures):
+        # The pool's workers take the queued resources until it is
+        # terminated, these aren't deleted once a delete failed.
+        if failures:
+            return obj, failures[0]
+        try:
+            with priority(BULK):
+                obj.delete()
+        except Exception as err:
+            failures.append((obj, err))
+            return obj, failures[0]
+        return obj, None
+
+    def describe(self, objs, limit=20):
+        names = ['%s "%s"' % (force_text(obj._meta.verbose_name), force_text(obj))
+                 for obj in objs[:limit]]
+        if len(objs) > limit:
+            names.append(_('%(count)d more') % {'count': len(objs) - limit})
+        return ', '.join(names)
+
+    def delete(self):
+        """
+        Deletes the related resources, deepest level first, with at most
+        ``concurrency`` requests in flight. The collected resources
+        themselves (the first level) are left to the caller.
+
+        When a delete fails the cascade stops, the resources not sent yet
+        are left, and ``DeleteStopped`` tells which ones were deleted.
+        """
+        total = sum(len(level) for level in self.levels[1:])
+        if not total:
+            return
+        failures = []
+        pool = ThreadPool(self.concurrency)
+        stopped = True
+        try:
+            for level in reversed(self.levels[1:]):
+                for obj, failure in pool.imap_unordered(
+                        partial(self.delete_object, failures=failures), level):
+                    if failure is None:
+                        self.deleted.append(obj)
+                        self.report_progress(len(self.deleted), total)
+                if failures:
+                    break
+            else:
+                stopped = False
+        finally:
+            if stopped:
+                pool.terminate()
+            else:
+                pool.close()
+            # Waits for the deletes in flight, even after terminate().
+            pool.join()
+        if failures:
+            obj, err = failures[0]
+            if self.deleted:
+                message = _('%(obj)s could not be deleted (%(error)s), the deletion stopped '
+                            'after deleting %(deleted)s.')
+            else:
+                message = _('%(obj)s could not be deleted (%(error)s), nothing was deleted.')
+            raise DeleteStopped(message % {
+                'obj': self.describe([obj]), 'error': force_text(err),
+                'deleted': self.describe(self.deleted)}, deleted=self.deleted)
+
+    def report_progress(self, done, total):
+        if self.progress is not None:
+            self.progress(done, total)
+        elif done == total or done % 100 == 0:
+            logger.info("Deleted %d of %d related resources.", done, total)
@@ -0,0 +1,83 @@
+from django.utils.encoding import force_text, python_2_unicode_compatible
+
+from restorm.exceptions import RestValidationException
+
+NON_FIELD_ERROR_KEYS = ('__all__', 'non_field_errors', 'detail', 'message', 'error')
+
+
+class UpstreamError(Exception):
+    """The upstream API refused a write."""
+
+    def __init__(self, message, status=None):
+        super(UpstreamError, self).__init__(message)
+        self.status = status
+
+
+class ResourceConflict(UpstreamError):
+    """The upstream resource was modified since it was fetched."""
+    pass
+
+
+@python_2_unicode_compatible
+class ResourceValidationError(RestValidationException):
+    """
+    The upstream API rejected a write as invalid. ``errors`` maps field
+    names, or None for errors of the whole resource, to lists of messages.
+    """
+
+    def __init__(self, errors):
+        Exception.__init__(self, errors)
+        self.errors = errors
+
+    @classmethod
+    def from_response(cls, response):
+        content = response.content
+        errors = {}
+        if isinstance(content, dict):
+            for name, messages in content.items():
+                if isinstance(messages, (list, tuple)):
+                    messages = [force_text(message) for message in messages]
+                else:
+                    messages = [force_text(messages)]
+                key = None if name in NON_FIELD_ERROR_KEYS else name
+                errors.setdefault(key, []).extend(messages)
+        else:
+            errors[None] = [force_text(content or response.status)]
+        return cls(errors)
+
+    def __str__(self):
+        return '; '.join(
+            ' '.join(messages) if name is None else '%s: %s' % (name, ' '.join(messages))
+            for name, messages in self.errors.items())
+
+    def add_errors_to_form(self, form):
+        for name, messages in self.errors.items():
+            field = name if name in form.fields else None
+            for message in messages:
+                form.add_error(field, message)
+        return form
+
+
+class ResourceUnavailable(Exception):
+    """The upstream API is failing and calls to it are cut short."""
+    pass
+
+
+class RateLimited(ResourceUnavailable):
+    """No upstream request slot freed up in time."""
+    pass
+
+
+class CallTimedOut(ResourceUnavailable):
+    """An upstream call didn't return in time and was given up on."""
+    pass
+
+
+class TooManyCalls(ResourceUnavailable):
+    """Too many upstream calls to a resource are in progress already."""
+    pass
+
+
+class DeadlineExceeded(ResourceUnavailable):
+    """The admin request ran out of time for upstream calls."""
+    pass
@@ -0,0 +1,101 @@
+"""
+List filters for resources. They filter upstream, passing the selected value
+as a query parameter, and read their choices from a facet endpoint of the
+API (see ``RestAdmin.facets_endpoint``) rather than from the related
+resources. Facets are cached for ``facet_ttl`` seconds.
+
+    class ProfileAdmin(RestAdmin):
+        facets_endpoint = 'profiles/facets/'
+        list_filter = [facet_filter('language', choices_filter=True),
+                       facet_filter('country', show_counts=True)]
+"""
+from django.contrib.admin import SimpleListFilter
+from django.core.cache import caches
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.encoding import force_text
+from django.utils.text import capfirst
+
+from . import deadlines
+
+
+class FacetListFilter(SimpleListFilter):
+    """
+    Filters on ``parameter_name`` upstream. Its choices are the values of
+    ``facet_field`` (``parameter_name`` by default) returned by the facet
+    endpoint, with their counts when ``show_counts`` is set.
+    """
+    facet_field = None
+    facet_ttl = 300
+    facet_cache = 'default'
+    show_counts = False
+
+    def __init__(self, request, params, model, model_admin):
+        if self.title is None:
+            self.title = self.get_default_title(model)
+        super(FacetListFilter, self).__init__(request, params, model, model_admin)
+
+    def get_default_title(self, model):
+        try:
+            return model._meta.get_field(self.parameter_name).verbose_name
+        except FieldDoesNotExist:
+            return self.parameter_name.replace('_', ' ')
+
+    def get_facet_field(self):
+        return self.facet_field or self.parameter_name
+
+    def get_facets(self, request, model_admin):
+        """
+        Returns the cached ``[(value, label, count)]`` facets of the field.
+        """
+        opts = model_admin.model._meta
+        key = 'rest_admin:facets:%s.%s:%s' % (
+            opts.app_label, opts.model_name, self.get_facet_field())
+        cache = caches[self.facet_cache]
+        facets = cache.get(key)
+        if facets is None:
+            if not deadlines.has_budget():
+                return []
+            facets = model_admin.get_facets(request, self.get_facet_field())
+            cache.set(key, facets, self.facet_ttl)
+        return facets
+
+    def format_label(self, label, count):
+        if self.show_counts and count is not None:
+            return '%s (%s)' % (label, count)
+        return label
+
+    def lookups(self, request, model_admin):
+        return [(force_text(value), self.format_label(label, count))
+                for value, label, count in self.get_facets(request, model_admin)]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        return queryset.filter(**{self.parameter_name: self.value()})
+
+
+class ChoicesFacetListFilter(FacetListFilter):
+    """
+    Takes its choices from the ``choices`` of the resource field and only
+    queries the facet endpoint for their counts, if ``show_counts`` is set.
+    """
+
+    def lookups(self, request, model_admin):
+        field = model_admin.model._meta.get_field(self.get_facet_field())
+        counts = {}
+        if self.show_counts:
+            counts = dict((force_text(value), count)
+                          for value, label, count in self.get_facets(request, model_admin))
+        return [(force_text(value), self.format_label(label, counts.get(force_text(value))))
+                for value, label in field.flatchoices]
+
+
+def facet_filter(parameter_name, title=None, choices_filter=False, **attrs):
+    """
+    Returns a ``FacetListFilter`` (or ``ChoicesFacetListFilter``) subclass
+    filtering on ``parameter_name``, for use in ``list_filter``.
+    """
+    base = ChoicesFacetListFilter if choices_filter else FacetListFilter
+    attrs.update({'parameter_name': parameter_name, 'title': title})
+    name = str('%sFacetListFilter' % capfirst(parameter_name.replace('_', ' ')).replace(' ', ''))
+    return type(name, (base,), attrs)
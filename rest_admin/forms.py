@@ -0,0 +1,117 @@
+from django.contrib.admin.utils import quote
+from django.core.urlresolvers import reverse
+from django.forms.fields import ChoiceField
+from django.forms.models import ModelChoiceIterator
+from django.utils.encoding import force_text
+
+from rest_admin.widgets import LAZY_SUFFIX, LazyTextarea
+
+
+class SharedModelChoiceIterator(ModelChoiceIterator):
+    """
+    Iterates over choices that are fetched once and shared, through the
+    ``shared`` dict, by every copy of a field. The forms of a formset each
+    get a copy of the formset's fields, which would otherwise each fetch the
+    choices again to render their select.
+    """
+
+    def __init__(self, field, shared):
+        super(SharedModelChoiceIterator, self).__init__(field)
+        self.shared = shared
+
+    def get_choices(self):
+        if 'choices' not in self.shared:
+            self.shared['choices'] = [self.choice(obj) for obj in self.queryset.all()]
+        return self.shared['choices']
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for choice in self.get_choices():
+            yield choice
+
+    def __len__(self):
+        return len(self.get_choices()) + (1 if self.field.empty_label is not None else 0)
+
+
+class ChoicesIteratorMixin(object):
+    """
+    Builds the choices of a ``ModelChoiceField`` with its ``iterator``, as
+    Django does from 1.10 on.
+    """
+    iterator = ModelChoiceIterator
+
+    def _get_choices(self):
+        if hasattr(self, '_choices'):
+            return self._choices
+        return self.iterator(self)
+
+    choices = property(_get_choices, ChoiceField._set_choices)
+
+
+_iterator_field_classes = {}
+
+
+def with_choices_iterator(form_field):
+    """
+    Makes ``form_field`` build its choices with its ``iterator`` on Django
+    versions without that hook.
+    """
+    field_class = type(form_field)
+    if hasattr(field_class, 'iterator'):
+        return form_field
+    if field_class not in _iterator_field_classes:
+        _iterator_field_classes[field_class] = type(
+            field_class.__name__, (ChoicesIteratorMixin, field_class),
+            {'__module__': field_class.__module__})
+    form_field.__class__ = _iterator_field_classes[field_class]
+    return form_field
+
+
+class LazyFieldsFormMixin(object):
+    """
+    Points the ``LazyTextarea`` widgets of the form to the admin site's
+    endpoint serving their value. Lazy fields submitted without having been
+    loaded keep the instance's value and are left out of ``changed_data``.
+    The admin doesn't send them upstream, see ``RestAdmin.full_update``.
+    """
+    admin_site = None
+
+    def __init__(self, *args, **kwargs):
+        super(LazyFieldsFormMixin, self).__init__(*args, **kwargs)
+        lazy_fields = [(name, field) for name, field in self.fields.items()
+                       if isinstance(field.widget, LazyTextarea)]
+        self.unloaded_fields = set()
+        if self.is_bound:
+            for name, field in lazy_fields:
+                html_name = self.add_prefix(name)
+                if html_name + LAZY_SUFFIX in self.data and html_name not in self.data:
+                    self.unloaded_fields.add(name)
+        if self.unloaded_fields:
+            # Bind the initial values, for the form to render the fields
+            # lazily again if it has errors, to a copy of the submitted data:
+            # the request's QueryDict is shared with the other forms.
+            self.data = self.data.copy()
+            for name in self.unloaded_fields:
+                field = self.fields[name]
+                value = field.prepare_value(self.initial.get(name, field.initial))
+                self.data[self.add_prefix(name)] = '' if value is None else force_text(value)
+        if self.instance.pk is not None:
+            for name, field in lazy_fields:
+                field.widget.load_url = self.get_lazy_field_url(name)
+
+    def get_lazy_field_url(self, name):
+        opts = self.instance._meta
+        return reverse('%s:rest_admin_lazy_field' % self.admin_site.name, args=(
+            opts.app_label, opts.model_name, quote(self.instance.pk), name))
+
+    @property
+    def changed_data(self):
+        return [name for name in super(LazyFieldsFormMixin, self).changed_data
+                if name not in self.unloaded_fields]
+
+    def clean(self):
+        cleaned_data = super(LazyFieldsFormMixin, self).clean()
+        for name in self.unloaded_fields:
+            self.cleaned_data.pop(name, None)
+        return cleaned_data
@@ -0,0 +1,85 @@
+"""
+Stand-ins for ``django.contrib.admin.helpers.InlineAdminFormSet``, for the
+inlines of a change form that are rendered without building their formset.
+"""
+from django.contrib.admin.utils import label_for_field
+from django.core.exceptions import ObjectDoesNotExist
+
+from .utils import lookup_field
+
+EMPTY_VALUE = '-'
+
+
+class InlineOptions(object):
+    """
+    Proxies an inline, rendering it with another template.
+    """
+
+    def __init__(self, inline, template):
+        self.inline = inline
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.inline, name)
+
+
+class InlineRows(object):
+    """
+    An inline rendered without forms. Either read-only, from ``rows`` of
+    ``fields``, or collapsed, in which case the inline is fetched from
+    ``load_url`` when the user expands it, needing the media of the forms of
+    ``form_class`` then.
+    """
+    readonly_template = 'admin/edit_inline/rest_readonly.html'
+    collapsed_template = 'admin/edit_inline/rest_collapsed.html'
+
+    def __init__(self, inline, prefix, rows=(), fields=(), load_url=None, form_class=None):
+        template = self.readonly_template if load_url is None else self.collapsed_template
+        self.opts = InlineOptions(inline, template)
+        self.prefix = prefix
+        self.rows = rows
+        self.fields = fields
+        self.load_url = load_url
+        self.form_class = form_class
+
+    def __iter__(self):
+        # There are no forms, e.g. for ``prepopulated_fields_js`` to go through.
+        return iter(())
+
+    @property
+    def headers(self):
+        return [label_for_field(name, self.opts.model, self.opts.inline)
+                for name in self.fields]
+
+    def results(self):
+        for row in self.rows:
+            yield [self.display_value(name, row) for name in self.fields]
+
+    def display_value(self, name, row):
+        try:
+            field, attr, value = lookup_field(name, row, self.opts.inline)
+        except (AttributeError, ObjectDoesNotExist):
+            return EMPTY_VALUE
+        if field is not None and getattr(field, 'flatchoices', None):
+            return dict(field.flatchoices).get(value, EMPTY_VALUE)
+        if value is None:
+            return EMPTY_VALUE
+        return value
+
+    @property
+    def media(self):
+        media = self.opts.inline.media
+        if self.form_class is not None:
+            media = media + get_form_class_media(self.form_class)
+        return media
+
+
+def get_form_class_media(form_class):
+    """
+    Returns the media of the forms of ``form_class``, i.e. of its ``Media``
+    and of the widgets of its declared fields, without constructing one.
+    """
+    # The media properties only read the fields, skip the form's __init__.
+    form = form_class.__new__(form_class)
+    form.fields = form_class.base_fields
+    return form.media
@@ -0,0 +1,269 @@
+"""
+Bulk import of CSV or JSON lines files into resources, run as a background
+job from ``RestAdmin.import_view``. The file is read a row at a time and
+handled in chunks: the rows of a chunk are validated with the admin's form,
+then written upstream in a single request to the batch endpoint if there is
+one, or one request per row with bounded concurrency otherwise.
+"""
+import csv
+import io
+import json
+import os
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+from django import forms
+from django.utils import six
+from django.utils.encoding import force_text
+from django.utils.translation import ugettext as _, ugettext_lazy
+
+from restorm.exceptions import RestValidationException
+
+from .ratelimit import BULK, priority
+
+CSV = 'csv'
+JSONL = 'jsonl'
+
+
+class ImportForm(forms.Form):
+    file = forms.FileField(label=ugettext_lazy('File'))
+    format = forms.ChoiceField(
+        label=ugettext_lazy('Format'),
+        choices=((CSV, 'CSV'), (JSONL, ugettext_lazy('JSON lines'))))
+    start_row = forms.IntegerField(
+        label=ugettext_lazy('Start at row'), min_value=1, initial=1,
+        help_text=ugettext_lazy('Rows are numbered from 1, not counting the CSV header.'))
+    skip_rows = forms.CharField(
+        label=ugettext_lazy('Skip rows'), required=False,
+        help_text=ugettext_lazy('Comma separated numbers of rows that were already imported.'))
+
+    def clean_skip_rows(self):
+        try:
+            return sorted(set(int(value) for value in
+                              self.cleaned_data['skip_rows'].replace(' ', '').split(',') if value))
+        except ValueError:
+            raise forms.ValidationError(_('Enter row numbers separated by commas.'))
+
+
+class ImportStopped(Exception):
+    """
+    The import failed before the end of the file, at ``row`` if known. The
+    rows after it in ``skip_rows`` were written nonetheless.
+    """
+
+    def __init__(self, message, row=None, skip_rows=()):
+        super(ImportStopped, self).__init__(message)
+        self.row = row
+        self.skip_rows = list(skip_rows)
+
+
+def read_csv(path):
+    if six.PY2:
+        with open(path, 'rb') as f:
+            for row in csv.DictReader(f):
+                yield dict((force_text(k), force_text(v or '')) for k, v in row.items())
+    else:
+        with io.open(path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                yield row
+
+
+def read_jsonl(path):
+    with io.open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class ResourceImporter(object):
+    """
+    Imports the rows of the file at ``path``, from row ``start_row`` on, as
+    resources of ``model_admin``'s model, except for ``skip_rows``. At most
+    ``max_errors`` row errors are reported. If writing fails, the import
+    stops and its error tells the row to start at and the rows to skip to
+    resume it.
+    """
+    readers = {CSV: read_csv, JSONL: read_jsonl}
+
+    def __init__(self, model_admin, request, path, file_format, start_row=1,
+                 chunk_size=100, concurrency=4, batch_endpoint=None, max_errors=100,
+                 skip_rows=()):
+        self.model_admin = model_admin
+        self.model = model_admin.model
+        self.request = request
+        self.path = path
+        self.read = self.readers[file_format]
+        self.start_row = start_row
+        self.skip_rows = frozenset(skip_rows)
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.batch_endpoint = batch_endpoint
+        self.max_errors = max_errors
+        self.errors = []
+        self.error_count = 0
+        self.imported = 0
+
+    def rows(self):
+        for row_number, data in enumerate(self.read(self.path), 1):
+            if row_number >= self.start_row and row_number not in self.skip_rows:
+                yield row_number, data
+
+    def chunks(self):
+        chunk = []
+        for row in self.rows():
+            chunk.append(row)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def add_error(self, row_number, error):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(_('Row %(row)d: %(error)s') % {
+                'row': row_number, 'error': error})
+
+    def format_form_errors(self, form):
+        return '; '.join(
+            '%s: %s' % (name, ' '.join(force_text(e) for e in errors))
+            for name, errors in form.errors.items())
+
+    def validate(self, chunk):
+        """
+        Returns the ``(row_number, resource)`` pairs of the valid rows of
+        ``chunk``, recording the errors of the others.
+        """
+        ModelForm = self.model_admin.get_form(self.request)
+        valid = []
+        for row_number, data in chunk:
+            form = ModelForm(data=data)
+            if form.is_valid():
+                valid.append((row_number, form.save(commit=False)))
+            else:
+                self.add_error(row_number, self.format_form_errors(form))
+        return valid
+
+    def write_batch(self, objs):
+        client = self.model._meta.client
+        uri = '%s%s' % (client.root_uri, self.batch_endpoint)
+        response = client.request(uri, 'POST', body=[obj.data for row_number, obj in objs])
+        if response.status >= 400:
+            raise ImportStopped(_('the batch endpoint answered with status %(status)s') % {
+                'status': response.status})
+        self.imported += len(objs)
+
+    def save_object(self, row, written, failures):
+        row_number, obj = row
+        # The pool's workers take the queued rows until it is terminated,
+        # these aren't written once a write failed.
+        if failures:
+            return row_number, None, failures[0]
+        try:
+            with priority(BULK):
+                obj.save()
+        except RestValidationException as err:
+            return row_number, force_text(err), None
+        except Exception as err:
+            failures.append(err)
+            return row_number, None, err
+        written.add(row_number)
+        return row_number, None, None
+
+    def write_each(self, objs):
+        """
+        Writes ``objs`` with up to ``concurrency`` requests in flight. When a
+        write fails, the rows not sent yet are dropped and the import stops
+        once the requests in flight are done, telling which rows after the
+        failed one were written.
+        """
+        written = set()
+        failures = []
+        pool = ThreadPool(min(self.concurrency, len(objs)))
+        failed = None
+        stopped = True
+        try:
+            # Results come back in row order, so the rows before the first
+            # failure were all handled.
+            for row_number, error, failure in pool.imap(
+                    partial(self.save_object, written=written, failures=failures), objs):
+                if failure is not None:
+                    failed = row_number, failure
+                    break
+                if error is not None:
+                    self.add_error(row_number, error)
+            else:
+                stopped = False
+        finally:
+            if stopped:
+                pool.terminate()
+            else:
+                pool.close()
+            # Waits for the writes in flight, even after terminate().
+            pool.join()
+            self.imported += len(written)
+        if failed is not None:
+            row_number, failure = failed
+            raise ImportStopped(
+                _('row %(row)d could not be written: %(error)s') % {
+                    'row': row_number, 'error': force_text(failure)},
+                row=row_number, skip_rows=sorted(row for row in written if row > row_number))
+
+    def run(self, job=None):
+        """
+        Runs the import, reporting progress to ``job``. Returns a summary.
+        """
+        try:
+            return self._run(job)
+        finally:
+            # The written resources are fetched by the next mirror refresh.
+            mirror = getattr(self.model_admin, 'get_mirror', lambda: None)()
+            if mirror is not None and self.imported:
+                mirror.invalidate()
+
+    def _run(self, job):
+        total = None
+        if job is not None:
+            total = sum(1 for row in self.rows())
+        done = 0
+        for chunk in self.chunks():
+            objs = self.validate(chunk)
+            if objs:
+                try:
+                    if self.batch_endpoint:
+                        self.write_batch(objs)
+                    else:
+                        self.write_each(objs)
+                except Exception as err:
+                    resume_row = getattr(err, 'row', None) or chunk[0][0]
+                    skip_rows = sorted(self.skip_rows.union(getattr(err, 'skip_rows', ())))
+                    skip_rows = [row for row in skip_rows if row > resume_row]
+                    if skip_rows:
+                        message = _(
+                            'The import stopped (%(error)s) after %(imported)d rows were '
+                            'imported. Upload the file again starting at row %(row)d and '
+                            'skipping rows %(skip_rows)s to resume.')
+                    else:
+                        message = _(
+                            'The import stopped (%(error)s) after %(imported)d rows were '
+                            'imported. Upload the file again starting at row %(row)d to '
+                            'resume.')
+                    raise ImportStopped(message % {
+                        'error': force_text(err), 'imported': self.imported,
+                        'row': resume_row,
+                        'skip_rows': ', '.join(str(row) for row in skip_rows)},
+                        row=resume_row, skip_rows=skip_rows)
+            done += len(chunk)
+            if job is not None:
+                job.report_progress(done, total)
+        return _('%(imported)d %(name)s were imported, %(errors)d rows had errors.') % {
+            'imported': self.imported,
+            'name': force_text(self.model._meta.verbose_name_plural),
+            'errors': self.error_count}
+
+    def cleanup(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,153 @@
+"""
+Background jobs for long running admin writes. The backend is set with the
+``REST_ADMIN_JOB_BACKEND`` setting, by default jobs run on a thread pool in
+the web process itself.
+
+The default backend keeps jobs in the memory of the process that runs
+them: with several worker processes per host and no sticky sessions, the
+job pages answer 404 when served by another process. Only use it with a
+single process, or set a backend sharing jobs between processes.
+
+Jobs run with the ETags of the request that submitted them and the bulk
+request priority (see ``rest_admin.clients`` and ``rest_admin.ratelimit``).
+They outlive the request, so instead of its deadline they get
+``REST_ADMIN_JOB_DEADLINE`` seconds for their upstream calls, none by
+default (see ``rest_admin.deadlines``).
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.utils.encoding import force_text
+from django.utils.module_loading import import_string
+
+from . import deadlines
+from .clients import get_etags, set_etags
+from .ratelimit import BULK, priority
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOB_BACKEND = 'rest_admin.jobs.ThreadJobBackend'
+
+
+class Job(object):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, description, user_id=None, redirect_url=None):
+        self.id = uuid.uuid4().hex
+        self.description = description
+        self.user_id = user_id
+        self.redirect_url = redirect_url
+        self.state = self.PENDING
+        self.message = ''
+        # Details reported along with the message, e.g. per-row errors.
+        self.errors = []
+        self.done = 0
+        self.total = None
+        self.created = time.time()
+        # Context of the submitting request's thread, see capture_context.
+        self.etags = {}
+        self.priority = BULK
+        self.deadline = getattr(settings, 'REST_ADMIN_JOB_DEADLINE', None)
+
+    def capture_context(self):
+        """
+        Records the ETags of the current thread for the job to run with.
+        """
+        self.etags = get_etags()
+
+    @property
+    def finished(self):
+        return self.state in (self.DONE, self.FAILED)
+
+    def report_progress(self, done, total):
+        self.done, self.total = done, total
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'description': force_text(self.description),
+            'state': self.state,
+            'message': force_text(self.message),
+            'done': self.done,
+            'total': self.total,
+            'error_count': len(self.errors),
+        }
+
+
+class BaseJobBackend(object):
+    def submit(self, job, func, *args, **kwargs):
+        """
+        Queues ``func(job, *args, **kwargs)``. Its return value becomes the
+        job's message.
+        """
+        raise NotImplementedError
+
+    def get(self, job_id):
+        """
+        Returns the job with ``job_id`` or None.
+        """
+        raise NotImplementedError
+
+    def run(self, job, func, args, kwargs):
+        job.state = Job.RUNNING
+        set_etags(job.etags)
+        try:
+            with priority(job.priority), deadlines.deadline(job.deadline):
+                message = func(job, *args, **kwargs)
+        except Exception as err:
+            logger.exception("Job %s failed.", job.id)
+            job.state = Job.FAILED
+            job.message = force_text(err)
+        else:
+            job.state = Job.DONE
+            job.message = message or job.message
+        finally:
+            set_etags({})
+
+
+class ThreadJobBackend(BaseJobBackend):
+    """
+    Runs jobs on a thread pool of the current process and keeps the last
+    ``max_jobs`` of them in memory. Job pages have to be served by the same
+    process, so it's meant for a single process per host, or sticky
+    sessions.
+    """
+
+    def __init__(self, workers=4, max_jobs=1000):
+        self.pool = ThreadPool(workers)
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, job, func, *args, **kwargs):
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+        self.pool.apply_async(self.run, (job, func, args, kwargs))
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_job_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend = getattr(settings, 'REST_ADMIN_JOB_BACKEND', DEFAULT_JOB_BACKEND)
+                _backend = import_string(backend)()
+    return _backend
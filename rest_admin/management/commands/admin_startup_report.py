@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from rest_admin.apps import setup
+from rest_admin.sites import site
+
+
+class Command(BaseCommand):
+    help = "Shows the time spent registering and instantiating each admin."
+
+    def handle(self, *args, **options):
+        setup()
+        report = site.get_startup_report()
+        total = 0.0
+        for model, register_time, instantiate_time in report:
+            total += register_time + instantiate_time
+            self.stdout.write("%-50s %8.2fms %8.2fms" % (
+                '%s.%s' % (model.__module__, model.__name__),
+                register_time * 1000, instantiate_time * 1000))
+        self.stdout.write("%d admins, %.2fms total" % (len(report), total * 1000))
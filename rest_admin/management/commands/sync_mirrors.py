@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_admin.apps import setup
+from rest_admin.ratelimit import BULK, priority
+from rest_admin.sites import site
+
+
+class Command(BaseCommand):
+    help = ("Syncs the local copies of the resources of the admins with a mirror, "
+            "see rest_admin.mirror.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true', dest='full', default=False,
+            help="Fetch every resource instead of the ones modified since the last sync.")
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'REST_ADMIN_MIRROR_DIR', None):
+            raise CommandError(
+                "Set REST_ADMIN_MIRROR_DIR for the web processes to share the mirrors "
+                "synced by this command.")
+        setup()
+        for model, model_admin in site._registry.items():
+            get_mirror = getattr(model_admin, 'get_mirror', None)
+            mirror = get_mirror() if get_mirror is not None else None
+            if mirror is None:
+                continue
+            start = time.time()
+            with priority(BULK):
+                mirror.sync(full=options['full'])
+            self.stdout.write("%-50s %8.2fs" % (
+                '%s.%s' % (model._meta.app_label, model._meta.model_name),
+                time.time() - start))
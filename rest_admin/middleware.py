@@ -0,0 +1,30 @@
+from django.conf import settings
+
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:
+    MiddlewareMixin = object
+
+from .deadlines import clear_deadline, set_deadline
+
+
+class DeadlineMiddleware(MiddlewareMixin):
+    """
+    Gives every request ``REST_ADMIN_REQUEST_DEADLINE`` seconds to make its
+    upstream calls, see ``rest_admin.deadlines``.
+    """
+
+    def process_request(self, request):
+        # Drop the deadline a previous request of the thread may have left
+        # behind, e.g. when a middleware's response bypassed ours.
+        clear_deadline()
+        seconds = getattr(settings, 'REST_ADMIN_REQUEST_DEADLINE', None)
+        if seconds:
+            set_deadline(seconds)
+
+    def process_exception(self, request, exception):
+        clear_deadline()
+
+    def process_response(self, request, response):
+        clear_deadline()
+        return response
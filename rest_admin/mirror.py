@@ -0,0 +1,386 @@
+"""
+Local read-through copy of a resource in SQLite, serving the changelist of
+admins with ``RestAdmin.mirror`` enabled. Only the fields the changelist
+needs are kept. When read, the copy is refreshed at most every
+``poll_interval`` seconds with the resources modified since the last
+refresh. It's rebuilt from scratch every ``full_sync_interval`` seconds to
+drop the resources deleted upstream by others.
+
+Refreshes run as background jobs (see ``rest_admin.jobs``), never in the
+request reading the copy, which is answered upstream until the first sync
+is done. The ``sync_mirrors`` management command syncs the mirrors from
+outside the web processes, e.g. from cron.
+
+The database lives in memory unless the ``REST_ADMIN_MIRROR_DIR`` setting
+names a directory, in which case the processes of a host share it.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import six
+from django.utils.encoding import force_text
+
+from .jobs import Job, get_job_backend
+
+logger = logging.getLogger(__name__)
+
+
+# Fields whose columns get NUMERIC affinity, the others get TEXT affinity
+# for their values to be compared as they are, e.g. codes with leading zeros.
+NUMERIC_FIELDS = (
+    'AutoField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+    'PositiveIntegerField', 'PositiveSmallIntegerField', 'FloatField',
+    'DecimalField', 'BooleanField',
+)
+
+
+class UnsupportedLookup(Exception):
+    """The lookup cannot be answered from the mirror."""
+    pass
+
+
+class MirrorNotReady(UnsupportedLookup):
+    """The mirror wasn't synced yet."""
+    pass
+
+
+class MirrorQuery(object):
+    # Stands in for ``QuerySet.query`` for ``ChangeList.get_ordering``.
+    def __init__(self, order_by):
+        self.order_by = list(order_by)
+
+
+class MirrorQuerySet(object):
+    """
+    The subset of the queryset API the changelist uses, over a mirror.
+    Results are read-only rows (see ``rest_admin.views.ResourceRow``).
+    """
+    operators = {
+        'exact': '= ?',
+        'iexact': '= ? COLLATE NOCASE',
+        'gt': '> ?',
+        'gte': '>= ?',
+        'lt': '< ?',
+        'lte': '<= ?',
+    }
+
+    def __init__(self, mirror, where=(), params=(), ordering=()):
+        self.mirror = mirror
+        self.model = mirror.model
+        self.where = list(where)
+        self.params = list(params)
+        self.ordering = list(ordering)
+        self.query = MirrorQuery(self.ordering)
+
+    def _clone(self, **kwargs):
+        options = {'where': self.where, 'params': self.params, 'ordering': self.ordering}
+        options.update(kwargs)
+        return self.__class__(self.mirror, **options)
+
+    def all(self):
+        return self._clone()
+
+    def distinct(self):
+        return self._clone()
+
+    def _column(self, name):
+        if name == 'pk':
+            name = self.mirror.pk_name
+        if name not in self.mirror.fields:
+            raise UnsupportedLookup(name)
+        return '"%s"' % name
+
+    def filter(self, **lookups):
+        where, params = list(self.where), list(self.params)
+        for lookup, value in lookups.items():
+            name, _, operator = lookup.partition('__')
+            column = self._column(name)
+            operator = operator or 'exact'
+            if operator in self.operators:
+                where.append('%s %s' % (column, self.operators[operator]))
+                params.append(value)
+            elif operator == 'in':
+                if isinstance(value, six.string_types):
+                    value = value.split(',')
+                value = list(value)
+                where.append('%s IN (%s)' % (column, ', '.join('?' * len(value))) if value else '0')
+                params.extend(value)
+            elif operator in ('contains', 'icontains', 'startswith', 'istartswith'):
+                pattern = '%%%s%%' if 'contains' in operator else '%s%%'
+                where.append("%s LIKE ? ESCAPE '\\'" % column)
+                params.append(pattern % _escape_like(value))
+            elif operator == 'isnull':
+                where.append('%s IS %sNULL' % (column, '' if value not in (False, 'False', '0', 0) else 'NOT '))
+            else:
+                raise UnsupportedLookup(lookup)
+        return self._clone(where=where, params=params)
+
+    def search(self, search_term, search_fields):
+        """
+        Keeps the rows containing every word of ``search_term`` in one of
+        ``search_fields``.
+        """
+        where, params = list(self.where), list(self.params)
+        columns = [self._column(name.lstrip('^=@')) for name in search_fields]
+        for bit in search_term.split():
+            where.append('(%s)' % ' OR '.join("%s LIKE ? ESCAPE '\\'" % column for column in columns))
+            params.extend(['%%%s%%' % _escape_like(bit)] * len(columns))
+        return self._clone(where=where, params=params)
+
+    def order_by(self, *fields):
+        ordering = []
+        for name in fields:
+            if not isinstance(name, six.string_types):
+                continue
+            try:
+                self._column(name.lstrip('-'))
+            except UnsupportedLookup:
+                continue
+            ordering.append(name)
+        return self._clone(ordering=ordering)
+
+    def _sql(self, select):
+        sql = 'SELECT %s FROM "%s"' % (select, self.mirror.table)
+        if self.where:
+            sql += ' WHERE %s' % ' AND '.join(self.where)
+        return sql
+
+    def count(self):
+        return self.mirror.execute(self._sql('COUNT(*)'), self.params)[0][0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, k):
+        if isinstance(k, slice):
+            offset, stop = k.start or 0, k.stop
+        else:
+            offset, stop = k, k + 1
+        sql = self._sql('_data')
+        if self.ordering:
+            sql += ' ORDER BY %s' % ', '.join(
+                '%s %s' % (self._column(name.lstrip('-')), 'DESC' if name.startswith('-') else 'ASC')
+                for name in self.ordering)
+        sql += ' LIMIT %d OFFSET %d' % (-1 if stop is None else stop - offset, offset)
+        rows = [self.mirror.make_row(data) for data, in self.mirror.execute(sql, self.params)]
+        if isinstance(k, slice):
+            return rows
+        if not rows:
+            raise IndexError(k)
+        return rows[0]
+
+    def __iter__(self):
+        return iter(self[:])
+
+
+def _escape_like(value):
+    return force_text(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _column_value(value):
+    if value is None or isinstance(value, (six.integer_types, float) + six.string_types):
+        return value
+    return json.dumps(value)
+
+
+class ResourceMirror(object):
+    """
+    SQLite copy of the ``fields`` of the resources of ``model``, indexed on
+    ``indexed_fields``. ``modified_field`` holds the modification time of a
+    resource, its latest value is sent in the ``modified_since_param`` query
+    parameter to fetch the resources changed since the last refresh.
+    """
+
+    def __init__(self, model, fields, indexed_fields=(), modified_field='modified_at',
+                 modified_since_param='modified_since', poll_interval=60,
+                 full_sync_interval=3600):
+        opts = model._meta
+        self.model = model
+        self.pk_name = opts.pk.name
+        self.modified_field = modified_field
+        self.fields = sorted(set(fields) | set([self.pk_name, modified_field]))
+        self.indexed_fields = [name for name in indexed_fields if name in self.fields]
+        self.modified_since_param = modified_since_param
+        self.poll_interval = poll_interval
+        self.full_sync_interval = full_sync_interval
+        self.columns = [(name, self.get_column_type(name)) for name in self.fields]
+        digest = hashlib.md5(','.join(
+            '%s %s' % column for column in self.columns).encode('utf-8')).hexdigest()[:8]
+        self.table = '%s_%s_%s' % (opts.app_label, opts.model_name, digest)
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._sync_scheduled = False
+        self._connection = None
+
+    def get_column_type(self, name):
+        """
+        Returns the type of the column of the field ``name``, NUMERIC for
+        numbers and TEXT for anything else.
+        """
+        try:
+            field = self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return 'TEXT'
+        if any(cls.__name__ in NUMERIC_FIELDS for cls in type(field).__mro__):
+            return 'NUMERIC'
+        return 'TEXT'
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            directory = getattr(settings, 'REST_ADMIN_MIRROR_DIR', None)
+            path = os.path.join(directory, '%s.sqlite3' % self.table) if directory else ':memory:'
+            connection = sqlite3.connect(path, check_same_thread=False)
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS "%s" (%s, _data TEXT, PRIMARY KEY ("%s"))' % (
+                    self.table, ', '.join('"%s" %s' % column for column in self.columns),
+                    self.pk_name))
+            for name in self.indexed_fields:
+                connection.execute('CREATE INDEX IF NOT EXISTS "%s_%s" ON "%s" ("%s")' % (
+                    self.table, name, self.table, name))
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS _mirror_state (name TEXT PRIMARY KEY, value TEXT)')
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def make_row(self, data):
+        from rest_admin.views import row_class_factory
+        return row_class_factory(self.model, self.fields)(json.loads(data))
+
+    def get_state(self, name):
+        rows = self.execute('SELECT value FROM _mirror_state WHERE name = ?', (
+            '%s:%s' % (self.table, name),))
+        return rows[0][0] if rows else None
+
+    def _set_state(self, name, value):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO _mirror_state (name, value) VALUES (?, ?)',
+            ('%s:%s' % (self.table, name), value))
+
+    def _store(self, values_list):
+        columns = ', '.join('"%s"' % name for name in self.fields)
+        sql = 'INSERT OR REPLACE INTO "%s" (%s, _data) VALUES (%s)' % (
+            self.table, columns, ', '.join('?' * (len(self.fields) + 1)))
+        latest = None
+        for values in values_list:
+            data = dict((name, values.get(name)) for name in self.fields)
+            modified = data.get(self.modified_field)
+            if modified is not None and (latest is None or force_text(modified) > latest):
+                latest = force_text(modified)
+            self.connection.execute(
+                sql, [_column_value(data[name]) for name in self.fields] + [json.dumps(data)])
+        return latest
+
+    def sync(self, full=False):
+        """
+        Fetches the resources modified since the last sync, or all of them.
+        """
+        queryset = self.model.objects.all()
+        last_modified = None if full else self.get_state('last_modified')
+        if last_modified is not None:
+            queryset = queryset.filter(**{self.modified_since_param: last_modified})
+        values_list = list(queryset.values(*self.fields))
+        now = repr(time.time())
+        with self._lock:
+            try:
+                if last_modified is None:
+                    self.connection.execute('DELETE FROM "%s"' % self.table)
+                    self._set_state('full_synced_at', now)
+                latest = self._store(values_list)
+                if latest is not None and (last_modified is None or latest > last_modified):
+                    self._set_state('last_modified', latest)
+                self._set_state('synced_at', now)
+                self.connection.commit()
+            except Exception:
+                self.connection.rollback()
+                raise
+        logger.debug("Mirrored %d %s.", len(values_list), self.model._meta.verbose_name_plural)
+
+    def is_stale(self):
+        synced_at = self.get_state('synced_at')
+        return synced_at is None or time.time() - float(synced_at) >= self.poll_interval
+
+    def refresh(self, blocking=True):
+        """
+        Syncs when the copy is older than ``poll_interval``, fully when the
+        last full sync is older than ``full_sync_interval``. Without
+        ``blocking``, the sync is skipped while another thread runs one.
+        """
+        if not self.is_stale():
+            return
+        if not self._sync_lock.acquire(blocking):
+            return
+        try:
+            if not self.is_stale():
+                return
+            full_synced_at = self.get_state('full_synced_at')
+            full = (full_synced_at is None or
+                    time.time() - float(full_synced_at) >= self.full_sync_interval)
+            self.sync(full=full)
+        finally:
+            self._sync_lock.release()
+
+    def schedule_refresh(self):
+        """
+        Refreshes the copy in a background job, unless one is pending.
+        """
+        with self._lock:
+            if self._sync_scheduled:
+                return
+            self._sync_scheduled = True
+        job = Job("Sync the mirror of %s" % force_text(self.model._meta.verbose_name_plural))
+        try:
+            get_job_backend().submit(job, self._refresh_job)
+        except Exception:
+            self._sync_scheduled = False
+            raise
+
+    def _refresh_job(self, job):
+        try:
+            self.refresh(blocking=False)
+        finally:
+            self._sync_scheduled = False
+
+    def queryset(self):
+        """
+        Returns the copy, scheduling a refresh when it's stale. Raises
+        ``MirrorNotReady`` until the first sync is done.
+        """
+        if self.is_stale():
+            self.schedule_refresh()
+            if self.get_state('synced_at') is None:
+                raise MirrorNotReady(self.table)
+        return MirrorQuerySet(self)
+
+    def invalidate(self):
+        """
+        Marks the copy as stale, for the next read to refresh it, e.g. after
+        writes that can't be applied to it one by one.
+        """
+        with self._lock:
+            self.connection.execute(
+                'DELETE FROM _mirror_state WHERE name = ?', ('%s:synced_at' % self.table,))
+            self.connection.commit()
+
+    def update_object(self, obj):
+        with self._lock:
+            self._store([obj.data])
+            self.connection.commit()
+
+    def remove_object(self, obj):
+        with self._lock:
+            self.connection.execute(
+                'DELETE FROM "%s" WHERE "%s" = ?' % (self.table, self.pk_name), (obj.pk,))
+            self.connection.commit()
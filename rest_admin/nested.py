@@ -1,18 +1,23 @@
 """
 Most of the code in this module is from https://github.com/s-block/django-nested-inline
 """
+from collections import defaultdict, deque, OrderedDict
+
 from django import VERSION, forms
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import (
+    ImproperlyConfigured, PermissionDenied, SuspiciousOperation
+)
+from django.core import checks
 from django.core.urlresolvers import reverse
 from django.conf import settings
 from django.contrib.admin import helpers
+from django.contrib.admin.checks import ModelAdminChecks
 from django.contrib.admin.options import TO_FIELD_VAR, IS_POPUP_VAR
 from django.contrib.admin.templatetags.admin_static import static
 from django.contrib.admin.templatetags.admin_urls import add_preserved_filters
 from django.contrib.admin.utils import unquote
 from django.db import models, transaction
-from django.forms.formsets import all_valid
-from django.http import Http404
+from django.http import Http404, QueryDict
 from django.template.response import SimpleTemplateResponse, TemplateResponse
 from django.utils.decorators import method_decorator
 from django.utils.encoding import force_text
@@ -22,7 +27,10 @@ from django.views.decorators.csrf import csrf_protect
 
 from restorm.exceptions import RestValidationException
 
+from .exceptions import UpstreamError
+from .helpers import InlineRows
 from .options import InlineRestAdmin, RestAdmin
+from .utils import get_request_cache
 
 csrf_protect_m = method_decorator(csrf_protect)
 
@@ -34,15 +42,22 @@ def get_content_type_for_model(obj):
     return ContentType.objects.get_for_model(obj, for_concrete_model=False)
 
 
-class NestedRestAdmin(RestAdmin):
-
-    class Media:
-        css = {
-            "all": ('admin/css/forms-nested.css',)
-        }
-        js = ('admin/js/inlines-nested.js',)
+class NestedInlinesMixin(object):
+    """
+    Builds the inline instances once per request and object, the nested
+    views ask for them for every form of every formset.
+    """
 
     def get_inline_instances(self, request, obj=None):
+        if request:
+            cache = get_request_cache(request, 'inline_instances')
+            key = (self, getattr(obj, 'pk', None))
+            if key not in cache:
+                cache[key] = self._get_inline_instances(request, obj)
+            return cache[key]
+        return self._get_inline_instances(request, obj)
+
+    def _get_inline_instances(self, request, obj=None):
         inline_instances = []
         for inline_class in self.inlines:
             inline = inline_class(self.model, self.admin_site)
@@ -54,14 +69,65 @@ class NestedRestAdmin(RestAdmin):
                 if not inline.has_add_permission(request):
                     inline.max_num = 0
             inline_instances.append(inline)
-
         return inline_instances
 
+
+def _nested_too_deep(inlines, depth, max_depth):
+    if not inlines:
+        return False
+    if depth > max_depth:
+        return True
+    return any(_nested_too_deep(getattr(inline, 'inlines', None), depth + 1, max_depth)
+               for inline in inlines)
+
+
+class NestedRestAdminChecks(ModelAdminChecks):
+    def check(self, admin, *args, **kwargs):
+        errors = super(NestedRestAdminChecks, self).check(admin, *args, **kwargs)
+        errors.extend(self._check_nesting_depth(admin))
+        return errors
+
+    def _check_nesting_depth(self, admin):
+        if not _nested_too_deep(admin.inlines, 1, admin.max_nesting_depth):
+            return []
+        return [
+            checks.Error(
+                "The inlines are nested more than %d levels deep." % admin.max_nesting_depth,
+                hint="Raise max_nesting_depth or remove a level of inlines.",
+                obj=admin,
+                id='rest_admin.E001',
+            )
+        ]
+
+
+class NestedRestAdmin(NestedInlinesMixin, RestAdmin):
+    # Levels of inlines, counting the top level ones, and total number of
+    # forms a submission may contain.
+    max_nesting_depth = 7
+    max_nested_forms = 1000
+    checks_class = NestedRestAdminChecks
+    # Keep the compiled inline templates and the rendered headers and empty
+    # forms of the inlines across requests.
+    cache_inline_fragments = False
+
+    def __init__(self, model, admin_site):
+        super(NestedRestAdmin, self).__init__(model, admin_site)
+        # Media of the inline trees rendered so far, keyed by the inlines and
+        # form fields they contain.
+        self._nested_media = {}
+
+    class Media:
+        css = {
+            "all": ('admin/css/forms-nested.css',)
+        }
+        js = ('admin/js/inlines-nested.js',)
+
     def save_formset(self, request, form, formset, change):
         """
-        Given an inline formset save it to the database.
+        Given an inline formset save it upstream along with its nested
+        formsets.
         """
-        instances = formset.save()
+        super(NestedRestAdmin, self).save_formset(request, form, formset, change)
 
         for form in formset.forms:
             if hasattr(form, 'nested_formsets') and form not in formset.deleted_forms:
@@ -119,93 +185,17 @@ class NestedRestAdmin(RestAdmin):
         ], context)
 
 
-    def add_nested_inline_formsets(self, request, inline, formset, depth=0):
-        if depth > 5:
-            raise Exception("Maximum nesting depth reached (5)")
-        for form in formset.forms:
-            nested_formsets = []
-            for nested_inline in inline.get_inline_instances(request):
-                InlineFormSet = nested_inline.get_formset(request, form.instance)
-                prefix = "%s-%s" % (form.prefix, InlineFormSet.get_default_prefix())
-
-                if request.method == 'POST' and \
-                        any(s.startswith(prefix) for s in request.POST.keys()):
-                    nested_formset = InlineFormSet(
-                        request.POST, request.FILES,
-                        instance=form.instance,
-                        prefix=prefix, queryset=nested_inline.get_queryset(request))
-                else:
-                    nested_formset = InlineFormSet(
-                        instance=form.instance,
-                        prefix=prefix, queryset=nested_inline.get_queryset(request))
-                nested_formsets.append(nested_formset)
-                if nested_inline.inlines:
-                    self.add_nested_inline_formsets(
-                        request, nested_inline, nested_formset, depth=depth+1)
-            form.nested_formsets = nested_formsets
-
-    def wrap_nested_inline_formsets(self, request, inline, formset):
-        media = None
-
-        def get_media(extra_media):
-            if media:
-                return media + extra_media
-            else:
-                return extra_media
-
-        for form in formset.forms:
-            wrapped_nested_formsets = []
-            for nested_inline, nested_formset in zip(
-                    inline.get_inline_instances(request), form.nested_formsets):
-                if form.instance.pk:
-                    instance = form.instance
-                else:
-                    instance = None
-                fieldsets = list(nested_inline.get_fieldsets(request))
-                readonly = list(nested_inline.get_readonly_fields(request))
-                prepopulated = dict(nested_inline.get_prepopulated_fields(request))
-                wrapped_nested_formset = helpers.InlineAdminFormSet(
-                    nested_inline, nested_formset,
-                    fieldsets, prepopulated, readonly, model_admin=self)
-                wrapped_nested_formsets.append(wrapped_nested_formset)
-                media = get_media(wrapped_nested_formset.media)
-                if nested_inline.inlines:
-                    media = get_media(
-                        self.wrap_nested_inline_formsets(request, nested_inline, nested_formset))
-            form.nested_formsets = wrapped_nested_formsets
-        return media
-
-    def formset_has_nested_data(self, formsets):
-        for formset in formsets:
-            if not formset.is_bound:
-                pass
-            for form in formset:
-                if hasattr(form, 'cleaned_data') and form.cleaned_data:
-                    return True
-                elif hasattr(form, 'nested_formsets'):
-                    if self.formset_has_nested_data(form.nested_formsets):
-                        return True
-
-    def all_valid_with_nesting(self, formsets):
-        "Recursively validate all nested formsets"
-        if not all_valid(formsets):
-            return False
+    def get_nested_formset_tree(self, request, inline_instances, formsets, obj=None):
+        """
+        Builds, wraps and validates the nested formsets below ``formsets``.
+        """
+        tree = NestedFormsetTree(self, request, obj)
+        tree.build(zip(inline_instances, formsets))
+        return tree
 
-        for formset in formsets:
-            if not formset.is_bound:
-                pass
-            for form in formset:
-                if hasattr(form, 'nested_formsets'):
-                    if not self.all_valid_with_nesting(form.nested_formsets):
-                        return False
-
-                    # TODO - find out why this breaks when extra = 1 and just adding new item with no sub items  # NOQA
-                    if (not hasattr(form, 'cleaned_data') or not form.cleaned_data) and \
-                            self.formset_has_nested_data(form.nested_formsets):
-                        form._errors["__all__"] = form.error_class(
-                            [u"Parent object must be created when creating nested inlines."])
-                        return False
-        return True
+    def get_inline_formsets(self, request, formsets, inline_instances, obj=None):
+        tree = self.get_nested_formset_tree(request, inline_instances, formsets, obj)
+        return self.add_deferred_inlines(request, tree.admin_formsets)
 
     @csrf_protect_m
     @transaction.atomic
@@ -218,8 +208,6 @@ class NestedRestAdmin(RestAdmin):
             raise PermissionDenied
 
         ModelForm = self.get_form(request)
-        formsets = []
-        inline_instances = self.get_inline_instances(request, None)
         if request.method == 'POST':
             form = ModelForm(request.POST, request.FILES)
             if form.is_valid():
@@ -228,32 +216,30 @@ class NestedRestAdmin(RestAdmin):
             else:
                 form_validated = False
                 new_object = self.model()
-            prefixes = {}
-            for FormSet, inline in self.get_formsets_with_inlines(request):
-                prefix = FormSet.get_default_prefix()
-                prefixes[prefix] = prefixes.get(prefix, 0) + 1
-                if prefixes[prefix] != 1 or not prefix:
-                    prefix = "%s-%s" % (prefix, prefixes[prefix])
-                formset = FormSet(
-                    data=request.POST, files=request.FILES,
-                    instance=new_object,
-                    save_as_new="_saveasnew" in request.POST,
-                    prefix=prefix, queryset=inline.get_queryset(request))
-                formsets.append(formset)
-                if inline.inlines:
-                    self.add_nested_inline_formsets(request, inline, formset)
-            if self.all_valid_with_nesting(formsets) and form_validated:
+            formsets, inline_instances = self._create_formsets(
+                request, new_object, change=False)
+            tree = self.get_nested_formset_tree(request, inline_instances, formsets)
+            if tree.is_valid() and form_validated:
+                if self.background_jobs:
+                    return self.save_in_background(
+                        request, new_object, form, formsets, False)
                 server_errors = False
                 try:
                     self.save_model(request, new_object, form, False)
                 except RestValidationException as err:
                     form = err.add_errors_to_form(form)
                     server_errors = True
+                except UpstreamError as err:
+                    form.add_error(None, force_text(err))
+                    server_errors = True
                 if not server_errors:
                     try:
                         self.save_related(request, form, formsets, False)
                     except RestValidationException:
                         server_errors = True
+                    except UpstreamError as err:
+                        form.add_error(None, force_text(err))
+                        server_errors = True
                 if not server_errors:
                     args = ()
                     # Provide `add_message` argument to ModelAdmin.log_addition for
@@ -279,37 +265,16 @@ class NestedRestAdmin(RestAdmin):
                 if isinstance(f, models.ManyToManyField):
                     initial[k] = initial[k].split(",")
             form = ModelForm(initial=initial)
-            prefixes = {}
-            for FormSet, inline in self.get_formsets_with_inlines(request):
-                prefix = FormSet.get_default_prefix()
-                prefixes[prefix] = prefixes.get(prefix, 0) + 1
-                if prefixes[prefix] != 1 or not prefix:
-                    prefix = "%s-%s" % (prefix, prefixes[prefix])
-                formset = FormSet(
-                    instance=self.model(), prefix=prefix,
-                    queryset=inline.get_queryset(request))
-                formsets.append(formset)
-                if hasattr(inline, 'inlines') and inline.inlines:
-                    self.add_nested_inline_formsets(request, inline, formset)
+            formsets, inline_instances = self._create_formsets(
+                request, self.model(), change=False)
+            tree = self.get_nested_formset_tree(request, inline_instances, formsets)
 
         adminForm = helpers.AdminForm(
             form, list(self.get_fieldsets(request)),
             self.get_prepopulated_fields(request),
             self.get_readonly_fields(request),
             model_admin=self)
-        media = self.media + adminForm.media
-
-        inline_admin_formsets = []
-        for inline, formset in zip(inline_instances, formsets):
-            fieldsets = list(inline.get_fieldsets(request))
-            readonly = list(inline.get_readonly_fields(request))
-            prepopulated = dict(inline.get_prepopulated_fields(request))
-            inline_admin_formset = helpers.InlineAdminFormSet(
-                inline, formset, fieldsets, prepopulated, readonly, model_admin=self)
-            inline_admin_formsets.append(inline_admin_formset)
-            media = media + inline_admin_formset.media
-            if hasattr(inline, 'inlines') and inline.inlines:
-                media += self.wrap_nested_inline_formsets(request, inline, formset)
+        media = self.media + adminForm.media + tree.media
 
         context = {
             'title': _('Add %s') % force_text(opts.verbose_name),
@@ -317,7 +282,7 @@ class NestedRestAdmin(RestAdmin):
             'is_popup': "_popup" in request.GET,
             'show_delete': False,
             'media': media,
-            'inline_admin_formsets': inline_admin_formsets,
+            'inline_admin_formsets': tree.admin_formsets,
             'errors': helpers.AdminErrorList(form, formsets),
             'app_label': opts.app_label,
             }
@@ -346,8 +311,6 @@ class NestedRestAdmin(RestAdmin):
                 current_app=self.admin_site.name))
 
         ModelForm = self.get_form(request, obj)
-        formsets = []
-        inline_instances = self.get_inline_instances(request, obj)
         if request.method == 'POST':
             form = ModelForm(request.POST, request.FILES, instance=obj)
             if form.is_valid():
@@ -356,32 +319,32 @@ class NestedRestAdmin(RestAdmin):
             else:
                 form_validated = False
                 new_object = obj
-            prefixes = {}
-            for FormSet, inline in self.get_formsets_with_inlines(request, new_object):
-                prefix = FormSet.get_default_prefix()
-                prefixes[prefix] = prefixes.get(prefix, 0) + 1
-                if prefixes[prefix] != 1 or not prefix:
-                    prefix = "%s-%s" % (prefix, prefixes[prefix])
-                formset = FormSet(
-                    request.POST, request.FILES,
-                    instance=new_object, prefix=prefix,
-                    queryset=inline.get_queryset(request))
-                formsets.append(formset)
-                if hasattr(inline, 'inlines') and inline.inlines:
-                    self.add_nested_inline_formsets(request, inline, formset)
-
-            if self.all_valid_with_nesting(formsets) and form_validated:
+            formsets, inline_instances = self._create_formsets(
+                request, new_object, change=True)
+            tree = self.get_nested_formset_tree(
+                request, inline_instances, formsets, obj)
+
+            if tree.is_valid() and form_validated:
+                if self.background_jobs:
+                    return self.save_in_background(
+                        request, new_object, form, formsets, True)
                 server_errors = False
                 try:
                     self.save_model(request, new_object, form, True)
                 except RestValidationException as err:
                     form = err.add_errors_to_form(form)
                     server_errors = True
+                except UpstreamError as err:
+                    form.add_error(None, force_text(err))
+                    server_errors = True
                 if not server_errors:
                     try:
                         self.save_related(request, form, formsets, True)
                     except RestValidationException:
                         server_errors = True
+                    except UpstreamError as err:
+                        form.add_error(None, force_text(err))
+                        server_errors = True
                 if not server_errors:
                     change_message = self.construct_change_message(request, form, formsets)
                     self.log_change(request, new_object, change_message)
@@ -389,37 +352,20 @@ class NestedRestAdmin(RestAdmin):
 
         else:
             form = ModelForm(instance=obj)
-            prefixes = {}
-            for FormSet, inline in self.get_formsets_with_inlines(request, obj):
-                prefix = FormSet.get_default_prefix()
-                prefixes[prefix] = prefixes.get(prefix, 0) + 1
-                if prefixes[prefix] != 1 or not prefix:
-                    prefix = "%s-%s" % (prefix, prefixes[prefix])
-                formset = FormSet(
-                    instance=obj, prefix=prefix,
-                    queryset=inline.get_queryset(request))
-                formsets.append(formset)
-                if hasattr(inline, 'inlines') and inline.inlines:
-                    self.add_nested_inline_formsets(request, inline, formset)
+            formsets, inline_instances = self._create_formsets(request, obj, change=True)
+            tree = self.get_nested_formset_tree(
+                request, inline_instances, formsets, obj)
 
         adminForm = helpers.AdminForm(
             form, self.get_fieldsets(request, obj),
             self.get_prepopulated_fields(request, obj),
             self.get_readonly_fields(request, obj),
             model_admin=self)
-        media = self.media + adminForm.media
-
-        inline_admin_formsets = []
-        for inline, formset in zip(inline_instances, formsets):
-            fieldsets = list(inline.get_fieldsets(request, obj))
-            readonly = list(inline.get_readonly_fields(request, obj))
-            prepopulated = dict(inline.get_prepopulated_fields(request, obj))
-            inline_admin_formset = helpers.InlineAdminFormSet(
-                inline, formset, fieldsets, prepopulated, readonly, model_admin=self)
-            inline_admin_formsets.append(inline_admin_formset)
-            media = media + inline_admin_formset.media
-            if hasattr(inline, 'inlines') and inline.inlines:
-                media += self.wrap_nested_inline_formsets(request, inline, formset)
+        media = self.media + adminForm.media + tree.media
+        inline_admin_formsets = self.add_deferred_inlines(request, tree.admin_formsets)
+        for inline_admin_formset in inline_admin_formsets:
+            if isinstance(inline_admin_formset, InlineRows):
+                media = media + inline_admin_formset.media
 
         context = {
             'title': _('Change %s') % force_text(opts.verbose_name),
@@ -436,34 +382,208 @@ class NestedRestAdmin(RestAdmin):
         return self.render_change_form(request, context, change=True, obj=obj, form_url=form_url)
 
 
-class NestedInline(InlineRestAdmin):
+class SubmittedDataIndex(object):
+    """
+    Index of submitted data keys by each of their '-' separated prefixes,
+    e.g. ``a-0-b-1-name`` is indexed under ``a``, ``a-0``, ``a-0-b`` and
+    ``a-0-b-1``. Built once per request, it answers whether a formset prefix
+    was submitted and slices the data for it without scanning every key.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.keys = defaultdict(list)
+        for key in data.keys():
+            prefix = None
+            for part in key.split('-')[:-1]:
+                prefix = part if prefix is None else '%s-%s' % (prefix, part)
+                self.keys[prefix].append(key)
+
+    def __contains__(self, prefix):
+        return prefix in self.keys
+
+    def get_data(self, prefix):
+        """
+        Returns a QueryDict with only the submitted keys under ``prefix``.
+        """
+        data = QueryDict('', mutable=True)
+        for key in self.keys.get(prefix, ()):
+            data.setlist(key, self.data.getlist(key))
+        data._mutable = False
+        return data
+
+
+class NestedFormsetTree(object):
+    """
+    Builds the nested formsets of a change form in a single breadth-first
+    pass. Each formset is constructed, wrapped for rendering and, when the
+    request is a POST, validated as it is visited, so validity and media are
+    known without walking the tree again.
+
+    Forms with nested inlines get a ``nested_formsets`` attribute with the
+    formsets used for saving and a ``nested_admin_formsets`` attribute with
+    the wrapped formsets used by the templates.
+    """
+
+    def __init__(self, model_admin, request, obj=None):
+        self.model_admin = model_admin
+        self.request = request
+        self.obj = obj
+        self.bound = request.method == 'POST'
+        self.submitted = SubmittedDataIndex(request.POST) if self.bound else None
+        self.admin_formsets = []
+        self.form_count = 0
+        self.valid = True
+        self._formsets = []
+        self._media_formsets = OrderedDict()
+
+    def build(self, inline_formsets):
+        queue = deque()
+        for inline, formset in inline_formsets:
+            self.admin_formsets.append(self.visit(inline, formset, self.obj))
+            queue.append((inline, formset, 1))
+
+        while queue:
+            inline, formset, depth = queue.popleft()
+            if not getattr(inline, 'inlines', None):
+                continue
+            # Caught by the system checks unless the inlines vary per request.
+            if depth >= self.model_admin.max_nesting_depth:
+                raise ImproperlyConfigured(
+                    "Maximum nesting depth reached (%d)" %
+                    self.model_admin.max_nesting_depth)
+            nested_inlines = inline.get_inline_instances(self.request)
+            for form in formset.forms:
+                form.nested_formsets = []
+                form.nested_admin_formsets = []
+                for nested_inline in nested_inlines:
+                    nested_formset = self.construct_formset(nested_inline, form)
+                    form.nested_formsets.append(nested_formset)
+                    form.nested_admin_formsets.append(
+                        self.visit(nested_inline, nested_formset, form.instance))
+                    queue.append((nested_inline, nested_formset, depth + 1))
+
+        if self.bound:
+            self.validate_parents()
+        return self
+
+    def construct_formset(self, inline, form):
+        request = self.request
+        InlineFormSet = inline.get_formset(request, form.instance)
+        prefix = "%s-%s" % (form.prefix, InlineFormSet.get_default_prefix())
+        kwargs = {
+            'instance': form.instance,
+            'prefix': prefix,
+            'queryset': inline.get_queryset(request),
+        }
+        if self.bound and prefix in self.submitted:
+            kwargs.update({
+                'data': self.submitted.get_data(prefix),
+                'files': request.FILES,
+            })
+        return InlineFormSet(**kwargs)
+
+    def visit(self, inline, formset, obj=None):
+        """
+        Validates ``formset`` and returns it wrapped for rendering.
+        """
+        if self.bound:
+            if formset.is_bound:
+                self.form_count += formset.total_form_count()
+                if self.form_count > self.model_admin.max_nested_forms:
+                    raise SuspiciousOperation(
+                        "Too many nested forms submitted (more than %d)" %
+                        self.model_admin.max_nested_forms)
+            if not formset.is_valid():
+                self.valid = False
+            self._formsets.append(formset)
+
+        # Memoized per request for the inline and parent object (see
+        # ``RestAdminBase._memoize``).
+        admin_formset = helpers.InlineAdminFormSet(
+            inline, formset, list(inline.get_fieldsets(self.request, obj)),
+            inline.get_prepopulated_fields(self.request, obj),
+            inline.get_readonly_fields(self.request, obj),
+            model_admin=self.model_admin)
+        self._media_formsets.setdefault(self.get_media_key(admin_formset), admin_formset)
+        return admin_formset
+
+    def get_media_key(self, admin_formset):
+        """
+        Returns what the media of ``admin_formset`` depends on: its inline
+        class and the widget classes of its form's fields, which vary with
+        the user's permissions and the readonly fields.
+        """
+        fields = []
+        for name, field in admin_formset.formset.form.base_fields.items():
+            widget = field.widget
+            # Related widgets are wrapped for the add and change links.
+            fields.append((name, type(widget), type(getattr(widget, 'widget', None))))
+        return type(admin_formset.opts), tuple(fields)
+
+    @property
+    def media(self):
+        """
+        Media of every inline in the tree. Computed from one formset of each
+        inline with a given set of form fields and cached on the admin, so
+        that only the first request rendering a given tree pays for merging
+        it.
+        """
+        key = tuple(self._media_formsets)
+        cache = self.model_admin._nested_media
+        if key not in cache:
+            media = forms.Media()
+            for admin_formset in self._media_formsets.values():
+                media = media + admin_formset.media
+            cache[key] = media
+        return cache[key]
+
+    def validate_parents(self):
+        """
+        Flags forms left empty while their nested formsets hold data. Walks
+        the visited formsets backwards so children are seen before parents.
+        """
+        has_data = {}
+        for formset in reversed(self._formsets):
+            formset_has_data = False
+            for form in formset.forms:
+                form_has_data = bool(getattr(form, 'cleaned_data', None))
+                nested_has_data = any(
+                    has_data.get(id(nested_formset))
+                    for nested_formset in getattr(form, 'nested_formsets', ()))
+                if nested_has_data and not form_has_data:
+                    form._errors["__all__"] = form.error_class(
+                        [u"Parent object must be created when creating nested inlines."])
+                    self.valid = False
+                formset_has_data = formset_has_data or form_has_data or nested_has_data
+            has_data[id(formset)] = formset_has_data
+
+    def is_valid(self):
+        return self.valid
+
+
+# NestedInline media, keyed by inline class and the options and settings it
+# depends on.
+_inline_media = {}
+
+
+class NestedInline(NestedInlinesMixin, InlineRestAdmin):
     inlines = []
     new_objects = []
 
     @property
     def media(self):
-
-        extra = '' if settings.DEBUG else '.min'
-        js = ['jquery%s.js' % extra, 'jquery.init.js', 'inlines-nested%s.js' % extra]
-        if self.prepopulated_fields:
-            js.extend(['urlify.js', 'prepopulate%s.js' % extra])
-        if self.filter_vertical or self.filter_horizontal:
-            js.extend(['SelectBox.js', 'SelectFilter2.js'])
-        return forms.Media(js=[static('admin/js/%s' % url) for url in js])
-
-    def get_inline_instances(self, request, obj=None):
-        inline_instances = []
-        for inline_class in self.inlines:
-            inline = inline_class(self.model, self.admin_site)
-            if request:
-                if not (inline.has_add_permission(request) or
-                        inline.has_change_permission(request, obj) or
-                        inline.has_delete_permission(request, obj)):
-                    continue
-                if not inline.has_add_permission(request):
-                    inline.max_num = 0
-            inline_instances.append(inline)
-        return inline_instances
+        key = (type(self), settings.DEBUG, settings.STATIC_URL, bool(self.prepopulated_fields),
+               bool(self.filter_vertical or self.filter_horizontal))
+        if key not in _inline_media:
+            extra = '' if settings.DEBUG else '.min'
+            js = ['jquery%s.js' % extra, 'jquery.init.js', 'inlines-nested%s.js' % extra]
+            if self.prepopulated_fields:
+                js.extend(['urlify.js', 'prepopulate%s.js' % extra])
+            if self.filter_vertical or self.filter_horizontal:
+                js.extend(['SelectBox.js', 'SelectFilter2.js'])
+            _inline_media[key] = forms.Media(js=[static('admin/js/%s' % url) for url in js])
+        return _inline_media[key]
 
     def get_formsets_with_inlines(self, request, obj=None):
         for inline in self.get_inline_instances(request):
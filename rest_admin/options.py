@@ -1,30 +1,41 @@
 # -*- coding: utf-8 -*-
 import base64
-from functools import partial
+import copy
+from functools import partial, update_wrapper
 import json
+import os
+import tempfile
 
 from django import forms
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import (
+    FieldDoesNotExist, ImproperlyConfigured, PermissionDenied, ValidationError
+)
 from django.core.urlresolvers import reverse
 from django.contrib.admin import helpers, widgets
-from django.contrib.admin.exceptions import DisallowedModelAdminToField
+from django.contrib.admin.exceptions import (
+    DisallowedModelAdminLookup, DisallowedModelAdminToField
+)
 from django.contrib.admin.options import (
-    ModelAdmin, TO_FIELD_VAR, IS_POPUP_VAR, InlineModelAdmin, get_ul_class,
-    FORMFIELD_FOR_DBFIELD_DEFAULTS
+    ModelAdmin, TO_FIELD_VAR, IS_POPUP_VAR, InlineModelAdmin, get_ul_class
 )
-from django.contrib.admin.utils import flatten_fieldsets, unquote
+from django.contrib.admin.utils import flatten_fieldsets, quote, unquote
+from django.contrib.admin.views.main import IGNORED_PARAMS, PAGE_VAR, SEARCH_VAR
 from django.db import transaction
 from django.forms.formsets import DELETION_FIELD_NAME, all_valid
-from django.forms.models import modelform_defines_fields
+from django.forms.models import ModelChoiceField, modelform_defines_fields
 from django.forms.widgets import SelectMultiple, CheckboxSelectMultiple
-from django.http import Http404
+from django.contrib import messages
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.template.loader import render_to_string
+from django.template.response import TemplateResponse
+from django.utils import six
 from django.utils.decorators import method_decorator
 from django.utils.encoding import force_text
 from django.utils.html import escape
+from django.utils.http import urlencode
 from django.utils.translation import string_concat, ugettext as _
 from django.views.decorators.csrf import csrf_protect
 
-from restorm import fields as rest_fields
 from restorm.fields.related import ToOneField, ToManyField
 from restorm.forms import (
     RestForm, restform_factory, BaseInlineRestFormSet, inlinerestformset_factory
@@ -33,37 +44,194 @@ from restorm.exceptions import RestValidationException
 from restorm.utils import patch
 
 from rest_admin import widgets as rest_admin_widgets
+from rest_admin.deletion import DeletePlanner, DeleteStopped
+from rest_admin.exceptions import ResourceConflict, ResourceValidationError, UpstreamError
+from rest_admin.forms import (
+    LazyFieldsFormMixin, SharedModelChoiceIterator, with_choices_iterator
+)
+from rest_admin.helpers import InlineRows
+from rest_admin.importer import ImportForm, ResourceImporter
+from rest_admin.jobs import Job, get_job_backend
+from rest_admin.mirror import MirrorQuerySet, ResourceMirror
+from rest_admin.utils import get_request_cache
 
 csrf_protect_m = method_decorator(csrf_protect)
 
-# Defaults for restorm fields. ModelAdmin subclasses can change this
-# by adding to ModelAdmin.formfield_overrides.
-# Leaving commented lines for currently unsupported fields
-FORMFIELD_FOR_DBFIELD_DEFAULTS.update({
-    rest_fields.DateTimeField: {
-        # 'form_class': forms.SplitDateTimeField,
-        'widget': widgets.AdminSplitDateTime
-    },
-    rest_fields.DateField: {'widget': widgets.AdminDateWidget},
-    # rest_fields.TimeField: {'widget': widgets.AdminTimeWidget},
-    rest_fields.TextField: {'widget': widgets.AdminTextareaWidget},
-    rest_fields.URLField: {'widget': widgets.AdminURLFieldWidget},
-    rest_fields.IntegerField: {'widget': widgets.AdminIntegerFieldWidget},
-    # rest_fields.BigIntegerField: {'widget': widgets.AdminBigIntegerFieldWidget},
-    rest_fields.CharField: {'widget': widgets.AdminTextInputWidget},
-    rest_fields.JSONField: {'widget': widgets.AdminTextareaWidget},
-    # rest_fields.ImageField: {'widget': widgets.AdminFileWidget},
-    # rest_fields.FileField: {'widget': widgets.AdminFileWidget},
-    # rest_fields.EmailField: {'widget': widgets.AdminEmailInputWidget},
-})
-
+LOOKUP_FORMAT_VAR = '_format'
 
 class RestAdminBase(object):
+    # Send only the changed fields of existing resources in a PATCH request
+    # and skip unchanged inline rows. With ``use_etags`` the ETag the resource
+    # was fetched with (see ``rest_admin.clients.ETagClientMixin``) is sent
+    # in an If-Match header.
+    partial_updates = False
+    use_etags = False
+    # Fetch the choices of a relation once per request and share them among
+    # the selects of every form, e.g. of every row of an inline.
+    share_relation_choices = True
+    # Text and JSON fields rendered as their size, with a link loading them
+    # on demand, when their value is ``lazy_field_min_size`` bytes or more.
+    # Unless loaded they are left out of the data sent upstream.
+    lazy_fields = ()
+    lazy_field_min_size = 64 * 1024
+
+    def _memoize(self, request, name, obj, func):
+        """
+        Returns ``func(request, obj)``, computed once per request for the
+        admin and ``obj``. Callers get a deep copy they may modify, e.g.
+        the options dicts of fieldsets.
+        """
+        if request is None:
+            return func(request, obj)
+        if obj is None:
+            obj_key = None
+        elif obj.pk is not None:
+            obj_key = (obj.__class__, obj.pk)
+        else:
+            obj_key = id(obj)
+        cache = get_request_cache(request, 'admin_hooks')
+        key = (self, name, obj_key)
+        if key not in cache:
+            cache[key] = func(request, obj)
+        return copy.deepcopy(cache[key])
+
+    def get_fieldsets(self, request, obj=None):
+        # Builds the form class (or formset class for inlines) to find the
+        # fields, the nested views ask for it for every form.
+        return self._memoize(
+            request, 'fieldsets', obj, super(RestAdminBase, self).get_fieldsets)
+
+    def get_readonly_fields(self, request, obj=None):
+        return self._memoize(
+            request, 'readonly_fields', obj, super(RestAdminBase, self).get_readonly_fields)
+
+    def get_prepopulated_fields(self, request, obj=None):
+        return self._memoize(
+            request, 'prepopulated_fields', obj,
+            super(RestAdminBase, self).get_prepopulated_fields)
+
+    def share_choices(self, request, db_field, form_field, shared=True):
+        """
+        Makes the copies of ``form_field`` made for each form share its
+        choices. With ``shared`` the choices are also shared by every field
+        for ``db_field`` built during ``request`` that selects the same
+        objects, see ``get_choices_key``.
+        """
+        if not self.share_relation_choices or not isinstance(form_field, ModelChoiceField):
+            return form_field
+        if shared and request is not None:
+            cache = get_request_cache(request, 'relation_choices')
+            choices = cache.setdefault(self.get_choices_key(db_field, form_field), {})
+        else:
+            choices = {}
+        form_field = with_choices_iterator(form_field)
+        form_field.iterator = partial(SharedModelChoiceIterator, shared=choices)
+        # Reset the widget's choices to go through the new iterator.
+        form_field.queryset = form_field.queryset
+        return form_field
+
+    def get_choices_key(self, db_field, form_field):
+        """
+        Returns the key of the choices of ``form_field`` among the choices
+        shared during a request: its model field, the filters and ordering
+        of its queryset and its ``limit_choices_to``, which the form applies
+        later on. Fields whose querysets can't be told apart get keys of
+        their own.
+        """
+        queryset = form_field.queryset
+        query = getattr(queryset, 'query', None)
+        try:
+            query_key = force_text(query) if query is not None else id(queryset)
+        except Exception:
+            # e.g. EmptyResultSet, for a query that can't match anything.
+            query_key = id(queryset)
+        limit_choices_to = None
+        if hasattr(form_field, 'get_limit_choices_to'):
+            limit_choices_to = form_field.get_limit_choices_to()
+        if isinstance(limit_choices_to, dict):
+            limit_choices_to = tuple(sorted(
+                (key, force_text(value)) for key, value in limit_choices_to.items()))
+        elif limit_choices_to is not None:
+            limit_choices_to = force_text(limit_choices_to)
+        return (type(self), db_field.name, query_key, limit_choices_to)
+
+    def get_partial_update_data(self, obj, changed_data):
+        """
+        Returns the upstream representation of the ``changed_data`` fields of
+        ``obj``.
+        """
+        opts = obj._meta
+        data = {}
+        for name in changed_data:
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            data[field.name] = obj.data.get(field.name)
+        return data
+
+    def full_update(self, request, obj, exclude=()):
+        """
+        Saves ``obj`` upstream, leaving the ``exclude`` fields out of the
+        request, e.g. lazy fields that weren't loaded and may not hold their
+        upstream value.
+        """
+        removed = dict((name, obj.data.pop(name)) for name in exclude if name in obj.data)
+        try:
+            obj.save()
+        finally:
+            obj.data.update(removed)
+
+    def partial_update(self, request, obj, changed_data):
+        """
+        Sends the ``changed_data`` fields of ``obj`` upstream in a PATCH
+        request.
+        """
+        data = self.get_partial_update_data(obj, changed_data)
+        if not data:
+            return
+        headers = {}
+        if self.use_etags and hasattr(obj.client, 'get_etag'):
+            etag = obj.client.get_etag(obj.absolute_url)
+            if etag:
+                headers['If-Match'] = etag
+        response = obj.client.request(
+            obj.absolute_url, 'PATCH', body=data, headers=headers)
+        if response.status == 412:
+            raise ResourceConflict(
+                _('%(name)s "%(obj)s" was changed by someone else. Reload the '
+                  'page and try again.') % {
+                    'name': force_text(obj._meta.verbose_name),
+                    'obj': force_text(obj)}, status=response.status)
+        if response.status in (400, 422):
+            raise ResourceValidationError.from_response(response)
+        if response.status >= 400:
+            raise UpstreamError(
+                _('%(name)s "%(obj)s" could not be saved, the API answered with '
+                  'status %(status)s.') % {
+                    'name': force_text(obj._meta.verbose_name),
+                    'obj': force_text(obj), 'status': response.status},
+                status=response.status)
+
     def formfield_for_dbfield(self, db_field, **kwargs):
         with patch('django.db.models.ForeignKey', ToOneField):
             with patch('django.db.models.ManyToManyField', ToManyField):
-                return super(RestAdminBase, self).formfield_for_dbfield(
+                form_field = super(RestAdminBase, self).formfield_for_dbfield(
                     db_field, **kwargs)
+        if (form_field is not None and db_field.name in self.lazy_fields and
+                isinstance(form_field.widget, forms.Textarea)):
+            form_field.widget = rest_admin_widgets.LazyTextarea(
+                form_field.widget.attrs, min_size=self.lazy_field_min_size)
+        return form_field
+
+    def get_lazy_form(self, form):
+        """
+        Returns ``form`` set up to load its ``lazy_fields`` on demand.
+        """
+        if not self.lazy_fields:
+            return form
+        return type(form.__name__, (LazyFieldsFormMixin, form), {
+            '__module__': form.__module__, 'admin_site': self.admin_site})
 
     def formfield_for_foreignkey(self, db_field, request=None, **kwargs):
         """
@@ -79,12 +247,14 @@ class RestAdminBase(object):
             })
             kwargs['empty_label'] = _('None') if db_field.blank else None
 
-        if 'queryset' not in kwargs:
+        shared = 'queryset' not in kwargs
+        if shared:
             queryset = self.get_field_queryset(db, db_field, request)
             if queryset is not None:
                 kwargs['queryset'] = queryset
 
-        return db_field.formfield(**kwargs)
+        form_field = db_field.formfield(**kwargs)
+        return self.share_choices(request, db_field, form_field, shared)
 
     def formfield_for_manytomany(self, db_field, request=None, **kwargs):
         """
@@ -106,12 +276,14 @@ class RestAdminBase(object):
                 db_field.name in self.filter_vertical
             )
 
-        if 'queryset' not in kwargs:
+        shared = 'queryset' not in kwargs
+        if shared:
             queryset = self.get_field_queryset(db, db_field, request)
             if queryset is not None:
                 kwargs['queryset'] = queryset
 
-        form_field = db_field.formfield(**kwargs)
+        form_field = self.share_choices(
+            request, db_field, db_field.formfield(**kwargs), shared)
         if isinstance(form_field.widget, SelectMultiple) and \
                 not isinstance(form_field.widget, CheckboxSelectMultiple):
             msg = _('Hold down "Control", or "Command" on a Mac, to select more than one.')
@@ -123,12 +295,196 @@ class RestAdminBase(object):
 class RestAdmin(RestAdminBase, ModelAdmin):
     form = RestForm
 
+    # Field projection. When enabled, only the fields the changelist or the
+    # change form are going to render are requested from the upstream API,
+    # passed as a comma separated ``sparse_fields_param`` query parameter.
+    # Only enable ``sparse_changeform`` if the API leaves fields missing from
+    # the save body untouched.
+    sparse_changelist = False
+    sparse_changeform = False
+    sparse_fields_param = 'fields'
+    # Maps admin field names (e.g. methods in ``list_display``) to the
+    # upstream field name(s) they need.
+    sparse_fields_map = {}
+    sparse_fields_extra = ()
+    # Render the changelist from read-only rows built from the raw upstream
+    # data instead of full resources. Ignored when ``list_editable`` is set.
+    changelist_rows = False
+    # Delete the resources owned by a resource along with it, see
+    # rest_admin.deletion.DeletePlanner.
+    delete_cascade = True
+    delete_concurrency = 4
+    # Run the upstream writes of validated saves and of deletes as background
+    # jobs (see rest_admin.jobs) and redirect to a page following the job.
+    # The default job backend only works with a single process per host.
+    background_jobs = False
+    # Path of the API's facet endpoint, relative to the client's root uri,
+    # for the list filters of rest_admin.filters.
+    facets_endpoint = None
+    # Serve the changelist's list, search, sorting and counts from a local
+    # copy of the resource, see rest_admin.mirror. ``mirror_options`` are
+    # passed on to ResourceMirror. Ignored when ``list_editable`` is set.
+    mirror = False
+    mirror_options = {}
+    # Fetch the next changelist page in the background while the current one
+    # is displayed, see rest_admin.prefetch.
+    prefetch_next_page = False
+    # Bulk imports, see rest_admin.importer. Rows are validated and written
+    # ``import_chunk_size`` at a time, in one request to
+    # ``import_batch_endpoint`` (relative to the client's root uri) when set,
+    # otherwise with up to ``import_concurrency`` requests in flight.
+    import_chunk_size = 100
+    import_concurrency = 4
+    import_batch_endpoint = None
+    import_max_errors = 100
+    # Seconds the views of the admin have for their upstream calls, see
+    # rest_admin.deadlines.
+    request_deadline = None
+    # The raw id widgets of relations to the resource look it up in a
+    # compact list (see lookup_view) instead of the changelist. It shows
+    # ``lookup_fields``, or the resource itself, ``lookup_per_page`` at a
+    # time.
+    raw_id_lookup = True
+    lookup_fields = None
+    lookup_per_page = 50
+
+    def get_mirror(self):
+        """
+        Returns the ``ResourceMirror`` of the admin's resource, or None.
+        """
+        if not self.mirror or self.list_editable:
+            return None
+        if '_mirror' not in self.__dict__:
+            fields = self.get_changelist_sparse_fields(
+                None, self.list_display, self.list_display_links, self.search_fields)
+            indexed_fields = [name for name in self.list_display if not callable(name)]
+            indexed_fields.extend(name.lstrip('^=@') for name in self.search_fields)
+            self.__dict__.setdefault('_mirror', ResourceMirror(
+                self.model, fields, indexed_fields, **self.mirror_options))
+        return self._mirror
+
+    def get_model_mirror(self, model):
+        """
+        Returns the ``ResourceMirror`` of the admin of ``model`` on the same
+        site, e.g. for the resources of an inline, or None.
+        """
+        model_admin = self.admin_site._registry.get(model)
+        get_mirror = getattr(model_admin, 'get_mirror', None)
+        return get_mirror() if get_mirror is not None else None
+
+    def get_urls(self):
+        from django.conf.urls import url
+
+        def wrap(view):
+            def wrapper(*args, **kwargs):
+                return self.admin_site.admin_view(view)(*args, **kwargs)
+            return update_wrapper(wrapper, view)
+
+        info = self.model._meta.app_label, self.model._meta.model_name
+
+        urlpatterns = [
+            url(r'^job/(?P<job_id>[0-9a-f]{32})/$', wrap(self.job_view),
+                name='%s_%s_job' % info),
+            url(r'^job/(?P<job_id>[0-9a-f]{32})/status/$', wrap(self.job_status_view),
+                name='%s_%s_job_status' % info),
+            url(r'^import/$', wrap(self.import_view), name='%s_%s_import' % info),
+            url(r'^lookup/$', wrap(self.lookup_view), name='%s_%s_lookup' % info),
+            url(r'^(?P<object_id>.+)/inline/(?P<prefix>[\w-]+)/$', wrap(self.inline_view),
+                name='%s_%s_inline' % info),
+        ]
+        return urlpatterns + super(RestAdmin, self).get_urls()
+
     def get_actions(self, request):
         return None
 
+    def get_sparse_fields(self, request, field_names):
+        """
+        Returns the sorted list of upstream field names needed to render
+        ``field_names``. Names that are neither mapped in
+        ``sparse_fields_map`` nor resource fields are ignored.
+        """
+        opts = self.model._meta
+        fields = set([opts.pk.name])
+        fields.update(self.sparse_fields_extra)
+        for name in field_names:
+            if callable(name):
+                continue
+            if name in self.sparse_fields_map:
+                mapped = self.sparse_fields_map[name]
+                if isinstance(mapped, six.string_types):
+                    mapped = [mapped]
+                fields.update(mapped)
+                continue
+            try:
+                field = opts.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            fields.add(field.name)
+        return sorted(fields)
+
+    def get_changelist_sparse_fields(self, request, list_display,
+                                     list_display_links, search_fields):
+        field_names = list(list_display)
+        field_names.extend(list_display_links or ())
+        field_names.extend(name.lstrip('^=@') for name in search_fields or ())
+        return self.get_sparse_fields(request, field_names)
+
+    def get_changeform_sparse_fields(self, request, obj=None):
+        field_names = flatten_fieldsets(self.get_fieldsets(request, obj))
+        field_names.extend(self.get_readonly_fields(request, obj))
+        return self.get_sparse_fields(request, field_names)
+
+    def apply_sparse_fields(self, queryset, fields):
+        """
+        Restricts ``queryset`` to ``fields`` using the upstream projection
+        parameter.
+        """
+        if not fields:
+            return queryset
+        return queryset.filter(**{self.sparse_fields_param: ','.join(fields)})
+
+    def get_facets(self, request, field_name):
+        """
+        Returns the ``[(value, label, count)]`` facets of ``field_name`` from
+        the facet endpoint, which is expected to answer a ``field`` query
+        parameter with a list of ``{"value", "label", "count"}`` objects.
+        """
+        if self.facets_endpoint is None:
+            raise ImproperlyConfigured(
+                "%s needs a facets_endpoint for its facet list filters."
+                % self.__class__.__name__)
+        client = self.model._meta.client
+        uri = '%s%s?%s' % (client.root_uri, self.facets_endpoint,
+                           urlencode({'field': field_name}))
+        response = client.request(uri, 'GET')
+        return self.parse_facets(response.content)
+
+    def parse_facets(self, content):
+        return [(facet['value'], facet.get('label', facet['value']), facet.get('count'))
+                for facet in content]
+
+    def get_object(self, request, object_id, from_field=None):
+        """
+        Returns an instance matching the field and value provided, the primary
+        key is used if no field is provided. Returns ``None`` if no match is
+        found or the object_id fails validation.
+        """
+        queryset = self.get_queryset(request)
+        if self.sparse_changeform:
+            queryset = self.apply_sparse_fields(
+                queryset, self.get_changeform_sparse_fields(request))
+        model = queryset.model
+        field = model._meta.pk if from_field is None else model._meta.get_field(from_field)
+        try:
+            object_id = field.to_python(object_id)
+            return queryset.get(**{field.name: object_id})
+        except (model.DoesNotExist, ValidationError, ValueError):
+            return None
+
     def get_form(self, request, obj=None, **kwargs):
         with patch('django.forms.models.modelform_factory', restform_factory):
-            return super(RestAdmin, self).get_form(request, obj, **kwargs)
+            form = super(RestAdmin, self).get_form(request, obj, **kwargs)
+        return self.get_lazy_form(form)
 
     def get_changelist(self, request, **kwargs):
         """
@@ -151,6 +507,273 @@ class RestAdmin(RestAdminBase, ModelAdmin):
                 get_content_type_for_model):
             return super(RestAdmin, self).render_change_form(*args, **kwargs)
 
+    def save_model(self, request, obj, form, change):
+        """
+        Given a resource instance save it upstream.
+        """
+        if change and self.partial_updates:
+            self.partial_update(request, obj, form.changed_data)
+        else:
+            self.full_update(request, obj, getattr(form, 'unloaded_fields', ()))
+        mirror = self.get_mirror()
+        if mirror is not None:
+            mirror.update_object(obj)
+
+    def delete_model(self, request, obj):
+        """
+        Given a resource instance delete it upstream.
+        """
+        obj.delete()
+        mirror = self.get_mirror()
+        if mirror is not None:
+            mirror.remove_object(obj)
+
+    def save_formset(self, request, form, formset, change):
+        """
+        Given an inline formset save it upstream.
+        """
+        unloaded_fields = dict(
+            (id(form.instance), form.unloaded_fields) for form in formset.forms
+            if getattr(form, 'unloaded_fields', None))
+        if not self.partial_updates and not unloaded_fields:
+            instances = formset.save()
+        else:
+            instances = formset.save(commit=False)
+            for obj in formset.deleted_objects:
+                obj.delete()
+            for obj in formset.new_objects:
+                obj.save()
+            for obj, changed_data in formset.changed_objects:
+                if self.partial_updates:
+                    self.partial_update(request, obj, changed_data)
+                else:
+                    self.full_update(request, obj, unloaded_fields.get(id(obj), ()))
+        mirror = self.get_model_mirror(formset.model)
+        if mirror is not None:
+            for obj in formset.deleted_objects:
+                mirror.remove_object(obj)
+            for obj in instances:
+                mirror.update_object(obj)
+        return instances
+
+    def submit_job(self, request, description, func, *args, **kwargs):
+        """
+        Queues ``func(job, *args, **kwargs)`` on the job backend and returns
+        a redirect to the page following the job. The job returns to the
+        changelist when it finishes.
+        """
+        info = self.model._meta.app_label, self.model._meta.model_name
+        job = Job(
+            description, user_id=request.user.pk,
+            redirect_url=reverse('admin:%s_%s_changelist' % info,
+                                 current_app=self.admin_site.name))
+        job.capture_context()
+        get_job_backend().submit(job, func, *args, **kwargs)
+        return HttpResponseRedirect(reverse(
+            'admin:%s_%s_job' % info, args=(job.id,), current_app=self.admin_site.name))
+
+    def save_job(self, job, request, obj, form, formsets, change):
+        """
+        Saves a validated change form as a background job.
+        """
+        try:
+            self.save_model(request, obj, form, change)
+            self.save_related(request, form, formsets, change)
+        except (RestValidationException, UpstreamError) as err:
+            raise ValueError(_('The %(name)s "%(obj)s" could not be saved: %(error)s') % {
+                'name': force_text(self.model._meta.verbose_name),
+                'obj': force_text(obj), 'error': force_text(err)})
+        return _('The %(name)s "%(obj)s" was saved successfully.') % {
+            'name': force_text(self.model._meta.verbose_name), 'obj': force_text(obj)}
+
+    def save_in_background(self, request, obj, form, formsets, change):
+        description = _('Saving %(name)s "%(obj)s"') % {
+            'name': force_text(self.model._meta.verbose_name), 'obj': force_text(obj)}
+        return self.submit_job(
+            request, description, self.save_job, request, obj, form, formsets, change)
+
+    def get_job(self, request, job_id):
+        job = get_job_backend().get(job_id)
+        if job is None or job.user_id != request.user.pk:
+            raise Http404(_('Job %(id)r does not exist.') % {'id': escape(job_id)})
+        return job
+
+    def job_view(self, request, job_id, extra_context=None):
+        """
+        Shows the progress of a background job until it finishes, then
+        redirects to the job's ``redirect_url`` with its outcome as a message.
+        """
+        job = self.get_job(request, job_id)
+        if job.finished:
+            level = messages.SUCCESS if job.state == Job.DONE else messages.ERROR
+            self.message_user(request, job.message, level)
+            for error in job.errors:
+                self.message_user(request, error, messages.WARNING)
+            return HttpResponseRedirect(job.redirect_url)
+
+        opts = self.model._meta
+        context = dict(
+            self.admin_site.each_context(request),
+            title=job.description,
+            job=job,
+            opts=opts,
+            app_label=opts.app_label,
+            status_url=reverse(
+                'admin:%s_%s_job_status' % (opts.app_label, opts.model_name),
+                args=(job.id,), current_app=self.admin_site.name),
+        )
+        context.update(extra_context or {})
+        request.current_app = self.admin_site.name
+        return TemplateResponse(request, 'admin/rest_admin/job.html', context)
+
+    def get_importer(self, request, path, file_format, start_row=1, skip_rows=()):
+        return ResourceImporter(
+            self, request, path, file_format, start_row=start_row,
+            chunk_size=self.import_chunk_size, concurrency=self.import_concurrency,
+            batch_endpoint=self.import_batch_endpoint, max_errors=self.import_max_errors,
+            skip_rows=skip_rows)
+
+    def import_job(self, job, importer):
+        """
+        Runs ``importer`` as a background job.
+        """
+        try:
+            return importer.run(job)
+        finally:
+            job.errors = importer.errors
+            importer.cleanup()
+
+    def import_view(self, request, extra_context=None):
+        """
+        Imports an uploaded CSV or JSON lines file as a background job.
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        opts = self.model._meta
+        if request.method == 'POST':
+            form = ImportForm(request.POST, request.FILES)
+            if form.is_valid():
+                # The upload is removed at the end of the request, keep a
+                # copy for the job.
+                fd, path = tempfile.mkstemp(prefix='rest_admin_import_')
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in form.cleaned_data['file'].chunks():
+                        f.write(chunk)
+                importer = self.get_importer(
+                    request, path, form.cleaned_data['format'],
+                    form.cleaned_data['start_row'], form.cleaned_data['skip_rows'])
+                description = _('Importing %(name)s from %(file)s') % {
+                    'name': force_text(opts.verbose_name_plural),
+                    'file': form.cleaned_data['file'].name}
+                return self.submit_job(request, description, self.import_job, importer)
+        else:
+            form = ImportForm()
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title=_('Import %s') % force_text(opts.verbose_name_plural),
+            form=form,
+            opts=opts,
+            app_label=opts.app_label,
+        )
+        context.update(extra_context or {})
+        request.current_app = self.admin_site.name
+        return TemplateResponse(request, 'admin/rest_admin/import.html', context)
+
+    def get_lookup_sparse_fields(self, request, to_field=None):
+        search_fields = [name.lstrip('^=@') for name in self.get_search_fields(request)]
+        # The lookup returns the value of the relation's ``to_field``.
+        if to_field:
+            search_fields.append(to_field)
+        if self.lookup_fields is not None:
+            return self.get_sparse_fields(request, list(self.lookup_fields) + search_fields)
+        if self.sparse_changelist:
+            return self.get_changelist_sparse_fields(
+                request, self.list_display, self.list_display_links, search_fields)
+        return None
+
+    def get_lookup_label(self, obj):
+        if self.lookup_fields is None:
+            return force_text(obj)
+        return ', '.join(force_text(getattr(obj, name)) for name in self.lookup_fields
+                         if getattr(obj, name, None) not in (None, ''))
+
+    def lookup_view(self, request, extra_context=None):
+        """
+        Lists the resources by id and label for the lookup popup of raw id
+        widgets, as JSON with ``_format=json``. Only the fields of the labels
+        are fetched and pages aren't counted, there's a next page as long as
+        the current one is full.
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+
+        to_field = request.GET.get(TO_FIELD_VAR)
+        if to_field and not self.to_field_allowed(request, to_field):
+            raise DisallowedModelAdminToField(
+                "The field %s cannot be referenced." % to_field)
+        search_term = request.GET.get(SEARCH_VAR, '')
+        try:
+            page_num = max(int(request.GET.get(PAGE_VAR, 0)), 0)
+        except ValueError:
+            page_num = 0
+        # Remaining parameters come from the relation's limit_choices_to.
+        lookups = dict(
+            (key, value) for key, value in request.GET.items()
+            if key not in IGNORED_PARAMS and key not in (PAGE_VAR, LOOKUP_FORMAT_VAR))
+        for key, value in lookups.items():
+            if not self.lookup_allowed(key, value):
+                raise DisallowedModelAdminLookup("Filtering by %s not allowed" % key)
+
+        queryset = self.apply_sparse_fields(
+            self.get_queryset(request), self.get_lookup_sparse_fields(request, to_field))
+        if lookups:
+            queryset = queryset.filter(**lookups)
+        if search_term:
+            queryset = self.get_search_results(request, queryset, search_term)[0]
+        offset = page_num * self.lookup_per_page
+        objs = list(queryset[offset:offset + self.lookup_per_page])
+        results = [
+            (force_text(getattr(obj, to_field) if to_field else obj.pk), self.get_lookup_label(obj))
+            for obj in objs]
+        has_next = len(objs) == self.lookup_per_page
+
+        if request.GET.get(LOOKUP_FORMAT_VAR) == 'json':
+            return JsonResponse({
+                'results': [{'id': value, 'label': label} for value, label in results],
+                'page': page_num,
+                'has_next': has_next,
+            })
+
+        params = dict(request.GET.items())
+        params.pop(LOOKUP_FORMAT_VAR, None)
+
+        def page_url(num):
+            return '?%s' % urlencode(dict(params, **{PAGE_VAR: num}))
+
+        opts = self.model._meta
+        context = dict(
+            self.admin_site.each_context(request),
+            title=_('Select %s') % force_text(opts.verbose_name),
+            opts=opts,
+            app_label=opts.app_label,
+            is_popup=True,
+            results=results,
+            search_term=search_term,
+            search_var=SEARCH_VAR,
+            hidden_params=[(key, value) for key, value in params.items()
+                           if key not in (SEARCH_VAR, PAGE_VAR)],
+            previous_url=page_url(page_num - 1) if page_num else None,
+            next_url=page_url(page_num + 1) if has_next else None,
+        )
+        context.update(extra_context or {})
+        request.current_app = self.admin_site.name
+        return TemplateResponse(request, 'admin/rest_admin/lookup.html', context)
+
+    def job_status_view(self, request, job_id):
+        return JsonResponse(self.get_job(request, job_id).as_dict())
+
     def log_addition(self, *args, **kwargs):
         pass
 
@@ -202,17 +825,26 @@ class RestAdmin(RestAdminBase, ModelAdmin):
 
             formsets, inline_instances = self._create_formsets(request, new_object, change=not add)
             if all_valid(formsets) and form_validated:
+                if self.background_jobs:
+                    return self.save_in_background(
+                        request, new_object, form, formsets, not add)
                 server_errors = False
                 try:
                     self.save_model(request, new_object, form, not add)
                 except RestValidationException as err:
                     form = err.add_errors_to_form(form)
                     server_errors = True
+                except UpstreamError as err:
+                    form.add_error(None, force_text(err))
+                    server_errors = True
                 if not server_errors:
                     try:
                         self.save_related(request, form, formsets, not add)
                     except RestValidationException:
                         server_errors = True
+                    except UpstreamError as err:
+                        form.add_error(None, force_text(err))
+                        server_errors = True
                 if not server_errors:
                     if add:
                         self.log_addition(request, new_object)
@@ -263,10 +895,7 @@ class RestAdmin(RestAdminBase, ModelAdmin):
         return self.render_change_form(
             request, context, add=add, change=not add, obj=obj, form_url=form_url)
 
-    def _create_formsets(self, request, obj, change):
-        "Helper function to generate formsets for add/change_view."
-        formsets = []
-        inline_instances = []
+    def _get_formsets_with_prefixes(self, request, obj, change):
         prefixes = {}
         get_formsets_args = [request]
         if change:
@@ -276,26 +905,152 @@ class RestAdmin(RestAdminBase, ModelAdmin):
             prefixes[prefix] = prefixes.get(prefix, 0) + 1
             if prefixes[prefix] != 1 or not prefix:
                 prefix = "%s-%s" % (prefix, prefixes[prefix])
-            formset_params = {
-                'instance': obj,
-                'prefix': prefix,
-                'queryset': inline.get_queryset(request),
-            }
-            if request.method == 'POST':
-                formset_params.update({
-                    'data': request.POST,
-                    'files': request.FILES,
-                    'save_as_new': '_saveasnew' in request.POST
-                })
-
-            formset = FormSet(**formset_params)
-            formsets.append(formset)
+            yield FormSet, inline, prefix
+
+    def _create_formset(self, request, FormSet, inline, prefix, obj):
+        formset_params = {
+            'instance': obj,
+            'prefix': prefix,
+            'queryset': inline.get_queryset(request),
+        }
+        if request.method == 'POST':
+            formset_params.update({
+                'data': request.POST,
+                'files': request.FILES,
+                'save_as_new': '_saveasnew' in request.POST
+            })
+        return FormSet(**formset_params)
+
+    def _create_formsets(self, request, obj, change):
+        """
+        Helper function to generate formsets for add/change_view. The inlines
+        rendered without a formset on the change form are set aside for
+        ``add_deferred_inlines``.
+        """
+        formsets = []
+        inline_instances = []
+        deferred = get_request_cache(request, 'deferred_inlines')[self] = []
+        for FormSet, inline, prefix in self._get_formsets_with_prefixes(request, obj, change):
+            if change:
+                inline_rows = self.get_inline_rows(request, FormSet, inline, prefix, obj)
+                if inline_rows is not None:
+                    deferred.append((len(formsets) + len(deferred), inline_rows))
+                    continue
+            formsets.append(self._create_formset(request, FormSet, inline, prefix, obj))
             inline_instances.append(inline)
         return formsets, inline_instances
 
+    def get_inline_rows(self, request, FormSet, inline, prefix, obj, collapse=True):
+        """
+        Returns an ``InlineRows`` when ``inline`` doesn't need a formset on the
+        change form of ``obj``, i.e. when it's collapsed and wasn't expanded
+        before submitting, or when the user can't change anything in it.
+        """
+        if not isinstance(inline, InlineRestAdmin):
+            return None
+        if collapse and inline.collapsed and '%s-TOTAL_FORMS' % prefix not in request.POST:
+            opts = self.model._meta
+            load_url = reverse(
+                'admin:%s_%s_inline' % (opts.app_label, opts.model_name),
+                args=(quote(obj.pk), prefix), current_app=self.admin_site.name)
+            return InlineRows(inline, prefix, load_url=load_url, form_class=FormSet.form)
+        # Nested inlines are left to their formset, which renders the children.
+        if inline.is_read_only(request, obj) and not getattr(inline, 'inlines', None):
+            fields = [name for name in flatten_fieldsets(inline.get_fieldsets(request, obj))
+                      if name != FormSet.fk.name]
+            rows = self.get_inline_row_data(request, inline, FormSet.fk, obj, fields)
+            return InlineRows(inline, prefix, rows=rows, fields=fields)
+        return None
+
+    def get_inline_row_data(self, request, inline, fk, obj, fields):
+        """
+        Fetches the resources of ``inline`` related to ``obj`` as read-only
+        rows holding the resource fields among ``fields``.
+        """
+        from rest_admin.views import row_class_factory
+        opts = inline.model._meta
+        names = set([opts.pk.name])
+        for name in fields:
+            try:
+                names.add(opts.get_field(name).name)
+            except FieldDoesNotExist:
+                continue
+        names = sorted(names)
+        queryset = inline.get_queryset(request).filter(**{fk.name: obj.pk})
+        row_class = row_class_factory(inline.model, names)
+        return [row_class(data) for data in queryset.values(*names)]
+
+    def get_inline_formsets(self, request, formsets, inline_instances, obj=None):
+        inline_admin_formsets = super(RestAdmin, self).get_inline_formsets(
+            request, formsets, inline_instances, obj)
+        return self.add_deferred_inlines(request, inline_admin_formsets)
+
+    def add_deferred_inlines(self, request, inline_admin_formsets):
+        """
+        Puts the inlines ``_create_formsets`` didn't build a formset for back
+        in their place among ``inline_admin_formsets``.
+        """
+        inline_admin_formsets = list(inline_admin_formsets)
+        for position, inline_rows in get_request_cache(request, 'deferred_inlines').pop(self, ()):
+            inline_admin_formsets.insert(position, inline_rows)
+        return inline_admin_formsets
+
+    def inline_view(self, request, object_id, prefix):
+        """
+        Returns the markup of the collapsed inline with ``prefix`` as JSON,
+        for the change form to show when the user expands it.
+        """
+        opts = self.model._meta
+        obj = self.get_object(request, unquote(object_id))
+
+        if not self.has_change_permission(request, obj):
+            raise PermissionDenied
+
+        if obj is None:
+            raise Http404(_('%(name)s object with primary key %(key)r does not exist.') % {
+                'name': force_text(opts.verbose_name), 'key': escape(object_id)})
+
+        for FormSet, inline, inline_prefix in self._get_formsets_with_prefixes(request, obj, True):
+            if inline_prefix != prefix:
+                continue
+            inline_admin_formset = self.get_inline_rows(
+                request, FormSet, inline, prefix, obj, collapse=False)
+            if inline_admin_formset is None:
+                formset = self._create_formset(request, FormSet, inline, prefix, obj)
+                inline_admin_formset = self.get_inline_formsets(
+                    request, [formset], [inline], obj)[0]
+            html = render_to_string(
+                inline_admin_formset.opts.template,
+                {'inline_admin_formset': inline_admin_formset}, request=request)
+            return JsonResponse({'html': html})
+        raise Http404(_('Inline %(prefix)r does not exist.') % {'prefix': escape(prefix)})
+
     def log_deletion(self, *args, **kwargs):
         pass
 
+    def delete_job(self, job, planner, request, obj):
+        """
+        Deletes ``obj`` and the resources it owns as a background job.
+        """
+        obj_display = force_text(obj)
+        planner.progress = job.report_progress
+        planner.delete()
+        self.delete_model(request, obj)
+        return _('The %(name)s "%(obj)s" was deleted successfully.') % {
+            'name': force_text(self.model._meta.verbose_name), 'obj': obj_display}
+
+    def get_delete_planner(self, request, **kwargs):
+        """
+        Returns the DeletePlanner used to find and delete the resources
+        owned by the ones being deleted.
+        """
+        defaults = {
+            'cascade': self.delete_cascade,
+            'concurrency': self.delete_concurrency,
+        }
+        defaults.update(kwargs)
+        return DeletePlanner(self, request, **defaults)
+
     @csrf_protect_m
     def delete_view(self, request, object_id, extra_context=None):
         "The 'delete' admin view for this model."
@@ -317,12 +1072,13 @@ class RestAdmin(RestAdminBase, ModelAdmin):
                 {'name': force_text(opts.verbose_name), 'key': escape(object_id)}
             )
 
-        # using = router.db_for_write(self.model)
-
         # Populate deleted_objects, a data structure of all related objects that
         # will also be deleted.
-        deleted_objects, model_count, perms_needed, protected = (
-            [obj], {self.model.__name__: 1}, [], [])
+        planner = self.get_delete_planner(request)
+        planner.collect([obj])
+        deleted_objects = planner.nested()
+        model_count, perms_needed, protected = (
+            planner.model_count, planner.perms_needed, [])
 
         if request.POST:  # The user has already confirmed the deletion.
             if perms_needed:
@@ -331,6 +1087,17 @@ class RestAdmin(RestAdminBase, ModelAdmin):
             attr = str(to_field) if to_field else opts.pk.attname
             obj_id = obj.serializable_value(attr)
             # self.log_deletion(request, obj, obj_display)
+            if self.background_jobs:
+                return self.submit_job(
+                    request, _('Deleting %(name)s "%(obj)s"') % {
+                        'name': force_text(opts.verbose_name), 'obj': obj_display},
+                    self.delete_job, planner, request, obj)
+            try:
+                planner.delete()
+            except DeleteStopped as err:
+                # Back to the confirmation, listing what is left to delete.
+                self.message_user(request, force_text(err), messages.ERROR)
+                return HttpResponseRedirect(request.get_full_path())
             self.delete_model(request, obj)
 
             return self.response_delete(request, obj_display, obj_id)
@@ -387,6 +1154,8 @@ class RestAdmin(RestAdminBase, ModelAdmin):
 
         search_fields = self.get_search_fields(request)
         use_distinct = False
+        if isinstance(queryset, MirrorQuerySet):
+            return queryset.search(search_term, search_fields), use_distinct
         encoded = base64.b64encode(json.dumps({search_term: search_fields}))
         queryset = queryset.filter(query=encoded)
         return queryset, use_distinct
@@ -395,6 +1164,24 @@ class RestAdmin(RestAdminBase, ModelAdmin):
 class InlineRestAdmin(RestAdminBase, InlineModelAdmin):
     form = RestForm
     formset = BaseInlineRestFormSet
+    # Render the inline collapsed on the change form, its resources are only
+    # fetched and its forms built when the user expands it.
+    collapsed = False
+
+    def is_read_only(self, request, obj=None):
+        """
+        Returns True when the user can neither add, delete nor change any
+        field of the inline, which is then rendered without forms.
+        """
+        if self.has_add_permission(request):
+            return False
+        if self.can_delete and self.has_delete_permission(request, obj):
+            return False
+        if not self.has_change_permission(request, obj):
+            return True
+        readonly_fields = set(self.get_readonly_fields(request, obj))
+        return all(name in readonly_fields
+                   for name in flatten_fieldsets(self.get_fieldsets(request, obj)))
 
     def get_formset(self, request, obj=None, **kwargs):
         """Returns a BaseInlineFormSet class for use in admin add/change views."""
@@ -467,7 +1254,7 @@ class InlineRestAdmin(RestAdminBase, InlineModelAdmin):
                 self.hand_clean_DELETE()
                 return result
 
-        defaults['form'] = DeleteProtectedModelForm
+        defaults['form'] = self.get_lazy_form(DeleteProtectedModelForm)
 
         if defaults['fields'] is None and not modelform_defines_fields(defaults['form']):
             defaults['fields'] = forms.ALL_FIELDS
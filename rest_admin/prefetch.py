@@ -0,0 +1,112 @@
+"""
+Background prefetching of the next changelist page, see
+``RestAdmin.prefetch_next_page``. Pages are kept in memory, by session and
+query, until they're used or ``ttl`` seconds pass. Options are read from
+the ``REST_ADMIN_PREFETCH`` setting, a dict of ``PagePrefetcher`` arguments.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+
+from .ratelimit import BULK, priority
+
+logger = logging.getLogger(__name__)
+
+
+class PagePrefetcher(object):
+    """
+    Fetches pages on ``workers`` threads, with at most ``max_pending``
+    waiting, and keeps up to ``max_pages`` of them. Starting a prefetch for
+    another query of the same session cancels the previous one: if it
+    didn't start it won't, if it's running its page is dropped.
+
+    The current query of up to ``max_sessions`` sessions is remembered, for
+    ``ttl`` seconds after their last changelist page load.
+    """
+
+    def __init__(self, workers=2, max_pending=20, max_pages=100, ttl=30, max_sessions=1000):
+        self.pool = ThreadPool(workers)
+        self.max_pending = max_pending
+        self.max_pages = max_pages
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.pages = OrderedDict()
+        self.pending = set()
+        self.queries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def prefetch(self, session_key, query_key, page_num, fetch):
+        key = (session_key, query_key, page_num)
+        with self.lock:
+            self.set_query(session_key, query_key)
+            if key in self.pages or key in self.pending or len(self.pending) >= self.max_pending:
+                return
+            self.pending.add(key)
+        self.pool.apply_async(self.run, (key, fetch))
+
+    def set_query(self, session_key, query_key):
+        """
+        Records ``query_key`` as the current query of the session, dropping
+        the sessions that timed out or were used least recently.
+        """
+        now = time.time()
+        self.queries.pop(session_key, None)
+        self.queries[session_key] = (now + self.ttl, query_key)
+        while self.queries:
+            oldest_key, (expires, _) = next(iter(self.queries.items()))
+            if expires >= now and len(self.queries) <= self.max_sessions:
+                break
+            del self.queries[oldest_key]
+
+    def is_current(self, key):
+        session_key, query_key, page_num = key
+        entry = self.queries.get(session_key)
+        return entry is not None and entry[1] == query_key and entry[0] >= time.time()
+
+    def run(self, key, fetch):
+        try:
+            if not self.is_current(key):
+                return
+            with priority(BULK):
+                result_list = fetch()
+            with self.lock:
+                if not self.is_current(key):
+                    return
+                self.pages[key] = (time.time() + self.ttl, result_list)
+                now = time.time()
+                for other_key, (expires, _) in list(self.pages.items()):
+                    if expires < now or len(self.pages) > self.max_pages:
+                        del self.pages[other_key]
+        except Exception:
+            logger.warning("Prefetching page %d failed.", key[2] + 1, exc_info=True)
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+
+    def get(self, session_key, query_key, page_num):
+        """
+        Returns the prefetched page, once, or None.
+        """
+        with self.lock:
+            self.set_query(session_key, query_key)
+            entry = self.pages.pop((session_key, query_key, page_num), None)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry[1]
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    global _prefetcher
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = PagePrefetcher(**getattr(settings, 'REST_ADMIN_PREFETCH', {}))
+    return _prefetcher
@@ -0,0 +1,225 @@
+"""
+Token bucket rate limiting of the requests sent to the upstream APIs, see
+``rest_admin.clients.RateLimitClientMixin``. Buckets are shared by the
+clients of a process and looked up by name.
+
+Tokens are kept in memory unless the ``REST_ADMIN_RATE_LIMIT_DIR`` setting
+names a directory, in which case the processes of a host draw from the same
+buckets through files locked with ``flock``.
+
+Requests are either ``INTERACTIVE`` (page loads) or ``BULK`` (background
+jobs, imports, cascading deletes, prefetches). Waiting bulk requests only
+get a token when no interactive request of the process is waiting.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .exceptions import RateLimited
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+PRIORITIES = (INTERACTIVE, BULK)
+
+
+def _take(tokens, updated, rate, burst, now):
+    """
+    Refills a bucket holding ``tokens`` at ``updated`` and takes a token
+    from it. Returns the tokens left and how long to wait before retrying,
+    0 if a token was taken.
+    """
+    tokens = min(burst, tokens + max(now - updated, 0) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class LocalTokenStore(object):
+    """Buckets of the current process."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def take(self, name, rate, burst):
+        now = time.time()
+        with self.lock:
+            tokens, updated = self.buckets.get(name, (burst, now))
+            tokens, wait = _take(tokens, updated, rate, burst, now)
+            self.buckets[name] = (tokens, now)
+        return wait
+
+
+class FileTokenStore(object):
+    """Buckets shared by the processes of a host, one file each."""
+
+    def __init__(self, directory):
+        if fcntl is None:
+            raise ImproperlyConfigured(
+                "REST_ADMIN_RATE_LIMIT_DIR requires a platform with fcntl.")
+        self.directory = directory
+
+    def get_path(self, name):
+        digest = hashlib.md5(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, 'rest_admin_bucket_%s' % digest)
+
+    def take(self, name, rate, burst):
+        fd = os.open(self.get_path(name), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.time()
+            try:
+                tokens, updated = [float(value) for value in os.read(fd, 64).split()]
+            except ValueError:
+                tokens, updated = burst, now
+            tokens, wait = _take(tokens, updated, rate, burst, now)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, ('%r %r' % (tokens, now)).encode('ascii'))
+            return wait
+        finally:
+            os.close(fd)
+
+
+class TokenBucket(object):
+    """
+    Lets ``rate`` requests a second through, in bursts of up to ``burst``.
+    Waiting requests are served by priority, then in arrival order.
+    """
+
+    def __init__(self, name, rate, burst=None, store=None):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = burst or max(1, int(rate))
+        self.store = store or LocalTokenStore()
+        self.queues = dict((priority, deque()) for priority in PRIORITIES)
+        self.counters = dict((priority, {
+            'requests': 0, 'waited': 0, 'timeouts': 0,
+            'wait_time': 0.0, 'max_wait': 0.0,
+        }) for priority in PRIORITIES)
+        self._condition = threading.Condition()
+
+    def _is_next(self, ticket):
+        for priority in PRIORITIES:
+            if self.queues[priority]:
+                return self.queues[priority][0] is ticket
+        return False
+
+    def acquire(self, priority=INTERACTIVE, timeout=None):
+        """
+        Waits for a token, for at most ``timeout`` seconds, raising
+        ``RateLimited`` after that.
+        """
+        start = time.time()
+        ticket = object()
+        with self._condition:
+            queue = self.queues[priority]
+            queue.append(ticket)
+            try:
+                while True:
+                    wait = None
+                    if self._is_next(ticket):
+                        wait = self.store.take(self.name, self.rate, self.burst)
+                        if not wait:
+                            break
+                    if timeout is not None:
+                        remaining = start + timeout - time.time()
+                        if remaining <= 0:
+                            self.counters[priority]['timeouts'] += 1
+                            raise RateLimited(
+                                "%s: no request slot within %.1f seconds" % (self.name, timeout))
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._condition.wait(wait)
+            finally:
+                queue.remove(ticket)
+                self._condition.notify_all()
+            self.record(priority, time.time() - start)
+
+    def record(self, priority, waited):
+        counters = self.counters[priority]
+        counters['requests'] += 1
+        if waited > 0.001:
+            counters['waited'] += 1
+            counters['wait_time'] += waited
+            counters['max_wait'] = max(counters['max_wait'], waited)
+
+    def metrics(self):
+        with self._condition:
+            metrics = {'rate': self.rate, 'burst': self.burst}
+            for priority in PRIORITIES:
+                counters = dict(self.counters[priority])
+                counters['queued'] = len(self.queues[priority])
+                counters['mean_wait'] = (
+                    counters['wait_time'] / counters['requests'] if counters['requests'] else 0.0)
+                metrics[priority] = counters
+        return metrics
+
+
+_store = None
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _buckets_lock:
+            if _store is None:
+                directory = getattr(settings, 'REST_ADMIN_RATE_LIMIT_DIR', None)
+                _store = FileTokenStore(directory) if directory else LocalTokenStore()
+    return _store
+
+
+def get_bucket(name, rate, burst=None):
+    """
+    Returns the bucket called ``name``, creating it with ``rate`` and
+    ``burst``.
+    """
+    bucket = _buckets.get(name)
+    if bucket is None:
+        store = get_store()
+        with _buckets_lock:
+            bucket = _buckets.get(name)
+            if bucket is None:
+                bucket = _buckets[name] = TokenBucket(name, rate, burst, store)
+    return bucket
+
+
+def get_metrics():
+    """
+    Returns the request and queue wait counters of every bucket, keyed by
+    name.
+    """
+    return dict((name, bucket.metrics()) for name, bucket in list(_buckets.items()))
+
+
+_local = threading.local()
+
+
+def get_priority():
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+@contextmanager
+def priority(value):
+    """
+    Sends the requests made by the current thread in the block with
+    priority ``value``.
+    """
+    previous = get_priority()
+    _local.priority = value
+    try:
+        yield
+    finally:
+        _local.priority = previous
@@ -1,15 +1,114 @@
+import threading
+import time
+from functools import update_wrapper
+
 from django.db.models.base import ModelBase
-from django.conf import settings
-from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.contrib import messages
 from django.contrib.admin import AdminSite, ModelAdmin
-from django.contrib.admin.sites import AlreadyRegistered, system_check_errors
+from django.contrib.admin.sites import AlreadyRegistered
+from django.contrib.admin.utils import unquote
+from django.http import Http404, JsonResponse
+from django.template.response import TemplateResponse
+from django.utils.encoding import force_text
+from django.utils.translation import ugettext as _, ungettext
 
 from restorm.resource import ResourceBase
 
+from . import ratelimit
+from .circuits import get_metrics, get_stale, reset_stale
+from .deadlines import deadline, get_deadline
+from .exceptions import ResourceUnavailable
+
+
+class AdminRegistry(dict):
+    """
+    Maps models to their admin instances. Admin classes are only instantiated
+    the first time they are looked up, which keeps them out of the worker's
+    startup time.
+    """
+
+    def __init__(self, admin_site):
+        super(AdminRegistry, self).__init__()
+        self.admin_site = admin_site
+        self.timings = {}
+        self._lock = threading.Lock()
+        self._lazy_field_index = None
+
+    def __setitem__(self, model, value):
+        self._lazy_field_index = None
+        super(AdminRegistry, self).__setitem__(model, value)
+
+    def __delitem__(self, model):
+        self._lazy_field_index = None
+        super(AdminRegistry, self).__delitem__(model)
+
+    def __getitem__(self, model):
+        value = super(AdminRegistry, self).__getitem__(model)
+        if isinstance(value, type):
+            with self._lock:
+                value = super(AdminRegistry, self).__getitem__(model)
+                if isinstance(value, type):
+                    start = time.time()
+                    value = value(model, self.admin_site)
+                    self.timings.setdefault(model, {})['instantiate'] = time.time() - start
+                    super(AdminRegistry, self).__setitem__(model, value)
+        return value
+
+    def get_admin_class(self, model):
+        value = super(AdminRegistry, self).__getitem__(model)
+        return value if isinstance(value, type) else value.__class__
+
+    def get_lazy_field_model(self, app_label, model_name, field_name):
+        """
+        Returns the registered model whose admin, or one of its inlines,
+        renders ``field_name`` of the model lazily, or None. Looked up in an
+        index of the admin classes, which aren't instantiated for it.
+        """
+        index = self._lazy_field_index
+        if index is None:
+            index = {}
+            for model in list(self):
+                pending = [(model, self.get_admin_class(model))]
+                seen = set()
+                while pending:
+                    inline_model, admin_class = pending.pop()
+                    if admin_class in seen:
+                        continue
+                    seen.add(admin_class)
+                    opts = inline_model._meta
+                    for name in getattr(admin_class, 'lazy_fields', ()):
+                        index.setdefault((opts.app_label, opts.model_name, name), model)
+                    pending.extend((inline.model, inline)
+                                   for inline in getattr(admin_class, 'inlines', ()))
+            self._lazy_field_index = index
+        return index.get((app_label, model_name, field_name))
+
+    def get(self, model, default=None):
+        if model in self:
+            return self[model]
+        return default
+
+    def items(self):
+        return [(model, self[model]) for model in self]
+
+    def values(self):
+        return [self[model] for model in self]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def itervalues(self):
+        return iter(self.values())
+
 
 class RestAdminSite(AdminSite):
     site_header = 'Restful Django administration'
 
+    def __init__(self, *args, **kwargs):
+        super(RestAdminSite, self).__init__(*args, **kwargs)
+        self._registry = AdminRegistry(self)
+
     def register(self, model_or_iterable, admin_class=None, **options):
         """
         Registers the given model(s) with the given admin class.
@@ -43,6 +142,7 @@ class RestAdminSite(AdminSite):
             # Ignore the registration if the model has been
             # swapped out.
             if not model._meta.swapped:
+                start = time.time()
                 # If we got **options then dynamically construct a subclass of
                 # admin_class with those **options.
                 if options:
@@ -52,10 +152,179 @@ class RestAdminSite(AdminSite):
                     options['__module__'] = __name__
                     admin_class = type("%sAdmin" % model.__name__, (admin_class,), options)
 
-                if admin_class is not ModelAdmin and settings.DEBUG:
-                    system_check_errors.extend(admin_class.check(model))
+                # The admin class is instantiated on first use, see
+                # AdminRegistry. System checks are run by check().
+                self._registry[model] = admin_class
+                self._registry.timings[model] = {'register': time.time() - start}
 
-                # Instantiate the admin class to save in the registry
-                self._registry[model] = admin_class(model, self)
+    def admin_view(self, view, cacheable=False):
+        """
+        Turns upstream failures cut short by the circuit breakers or by the
+        request's deadline into an error page and warns when stale copies of
+        resources were shown. Views of admins with a ``request_deadline``
+        run with that deadline. Template responses are rendered within it,
+        their templates fetch resources too.
+        """
+        seconds = getattr(getattr(view, '__self__', None), 'request_deadline', None)
+
+        def inner(request, *args, **kwargs):
+            reset_stale()
+            try:
+                with deadline(seconds):
+                    response = view(request, *args, **kwargs)
+                    render_by = get_deadline() if seconds is not None else None
+            except ResourceUnavailable as err:
+                return self.unavailable_view(request, err)
+            warned = self.warn_stale(request)
+            if callable(getattr(response, 'render', None)):
+                self.defer_render(request, response, render_by, warned)
+            return response
+        update_wrapper(inner, view)
+        return super(RestAdminSite, self).admin_view(inner, cacheable)
+
+    def defer_render(self, request, response, render_by, warned):
+        """
+        Has the template response rendered by the handler, after the
+        template response middleware, before ``render_by`` and with the
+        error page if the upstream calls of its template fail.
+        """
+        render = response.render
+
+        def render_within_deadline():
+            # Rendered once, and the response stays picklable for caches.
+            del response.render
+            seconds = None if render_by is None else render_by - time.time()
+            try:
+                with deadline(seconds):
+                    rendered = render()
+            except ResourceUnavailable as err:
+                return self.unavailable_view(request, err).render()
+            if not warned:
+                # Stale copies only fetched by the template, the warning is
+                # shown on the next page.
+                self.warn_stale(request)
+            return rendered
+        response.render = render_within_deadline
+
+    def warn_stale(self, request):
+        """
+        Warns the user when stale copies of resources were fetched for the
+        request. Returns whether there were any.
+        """
+        stale = get_stale()
+        if stale:
+            messages.warning(request, ungettext(
+                "The API is unavailable, %(count)d resource is shown as it was last fetched.",
+                "The API is unavailable, %(count)d resources are shown as they were last fetched.",
+                len(stale)) % {'count': len(stale)})
+        return bool(stale)
+
+    def unavailable_view(self, request, error):
+        messages.error(request, _("The API is unavailable (%(error)s). Please try again "
+                                  "in a moment.") % {'error': force_text(error)})
+        context = dict(self.each_context(request), title=_('Service unavailable'))
+        request.current_app = self.name
+        return TemplateResponse(
+            request, 'admin/rest_admin/unavailable.html', context, status=503)
+
+    def circuits_view(self, request):
+        """
+        Returns the state and counters of the circuit breakers as JSON.
+        """
+        return JsonResponse(get_metrics())
+
+    def rate_limits_view(self, request):
+        """
+        Returns the request and queue wait counters of the rate limits as
+        JSON.
+        """
+        return JsonResponse(ratelimit.get_metrics())
+
+    def get_lazy_field_admin(self, request, app_label, model_name, field_name):
+        """
+        Returns the admin or inline, among the registered admins and their
+        inlines, rendering ``field_name`` of the model lazily, or None.
+        """
+        model = self._registry.get_lazy_field_model(app_label, model_name, field_name)
+        if model is None:
+            return None
+        model_admins = [self._registry[model]]
+        while model_admins:
+            model_admin = model_admins.pop()
+            opts = model_admin.model._meta
+            if ((opts.app_label, opts.model_name) == (app_label, model_name) and
+                    field_name in getattr(model_admin, 'lazy_fields', ())):
+                return model_admin
+            if hasattr(model_admin, 'get_inline_instances'):
+                model_admins.extend(model_admin.get_inline_instances(request))
+        return None
+
+    def lazy_field_view(self, request, app_label, model_name, object_id, field_name):
+        """
+        Returns the value of a field rendered by ``LazyTextarea`` as JSON.
+        """
+        model_admin = self.get_lazy_field_admin(request, app_label, model_name, field_name)
+        if model_admin is None:
+            raise Http404
+        if not model_admin.has_change_permission(request):
+            raise PermissionDenied
+        model = model_admin.model
+        try:
+            obj = model_admin.get_queryset(request).get(
+                **{model._meta.pk.name: unquote(object_id)})
+        except model.DoesNotExist:
+            raise Http404
+        form_field = model_admin.formfield_for_dbfield(
+            model._meta.get_field(field_name), request=request)
+        value = form_field.prepare_value(getattr(obj, field_name))
+        return JsonResponse({'value': '' if value is None else force_text(value)})
+
+    def get_urls(self):
+        from django.conf.urls import url
+        from .apps import setup
+
+        # Autodiscovers the admin modules, if not done at startup.
+        setup()
+        urlpatterns = [
+            url(r'^circuits/$', self.admin_view(self.circuits_view), name='circuits'),
+            url(r'^rate-limits/$', self.admin_view(self.rate_limits_view), name='rate_limits'),
+            url(r'^lazy-field/(?P<app_label>\w+)/(?P<model_name>\w+)/(?P<object_id>.+)/'
+                r'(?P<field_name>\w+)/$', self.admin_view(self.lazy_field_view),
+                name='rest_admin_lazy_field'),
+        ]
+        return urlpatterns + super(RestAdminSite, self).get_urls()
+
+    def check(self, app_configs=None, **kwargs):
+        """
+        Runs the system checks of the registered admin classes. Hooked into
+        Django's system check framework by RestAdminConfig so they run with
+        ``manage.py check`` rather than on every registration.
+        """
+        errors = []
+        for model in list(self._registry):
+            admin_class = self._registry.get_admin_class(model)
+            if admin_class is not ModelAdmin:
+                errors.extend(admin_class.check(model))
+        return errors
+
+    def get_startup_report(self):
+        """
+        Returns a list of ``(model, register_time, instantiate_time)`` tuples,
+        slowest first, instantiating every admin class that hasn't been used
+        yet.
+        """
+        report = []
+        for model in list(self._registry):
+            self._registry[model]
+            timings = self._registry.timings.get(model, {})
+            report.append((
+                model, timings.get('register', 0.0),
+                timings.get('instantiate', 0.0)))
+        report.sort(key=lambda row: row[1] + row[2], reverse=True)
+        return report
 
 site = RestAdminSite(name='REST Administation Site')
+
+
+def check_admin_site(app_configs, **kwargs):
+    return site.check(app_configs)
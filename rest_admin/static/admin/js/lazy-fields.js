@@ -0,0 +1,19 @@
+/**
+ * Loads the value of the fields rendered by rest_admin.widgets.LazyTextarea
+ * when their "Load" link is clicked.
+ */
+(function($) {
+    'use strict';
+    $(document).on('click', '.lazy-field-load', function(event) {
+        event.preventDefault();
+        var $link = $(this);
+        var $field = $link.closest('.lazy-field');
+        $link.hide();
+        $.getJSON($field.data('url'), function(data) {
+            $field.find('textarea').val(data.value).prop('disabled', false).show();
+            $field.find('input[type=hidden], .lazy-field-size').remove();
+        }).fail(function() {
+            $link.show();
+        });
+    });
+})(django.jQuery);
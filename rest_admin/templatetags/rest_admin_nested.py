@@ -0,0 +1,143 @@
+"""
+Template tags rendering nested inlines. With the admin's
+``cache_inline_fragments`` enabled, compiled templates are kept per process
+and the static parts of each inline (the table header and the empty form
+used as a template by the "Add another" link) are rendered once per inline
+configuration, parent and language instead of on every request. Empty forms with
+fields taking their choices from a queryset are only cached for the
+request, so they don't keep stale choices.
+"""
+from django import template
+from django.contrib.admin import helpers
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from rest_admin.utils import get_request_cache
+
+register = template.Library()
+
+PREFIX_PLACEHOLDER = '__rest_admin_prefix__'
+
+_templates = {}
+_fragments = {}
+
+
+def _caching(inline_admin_formset):
+    return getattr(inline_admin_formset.model_admin, 'cache_inline_fragments', False)
+
+
+def get_nested_template(template_name, cache=False):
+    if not cache:
+        return get_template(template_name).template
+    if template_name not in _templates:
+        _templates[template_name] = get_template(template_name).template
+    return _templates[template_name]
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def get_fragment_key(template_name, inline_admin_formset):
+    formset = inline_admin_formset.formset
+    # The empty form's hidden foreign key input holds the parent's pk.
+    parent_pk = getattr(getattr(formset, 'instance', None), 'pk', None)
+    return (
+        template_name, type(inline_admin_formset.opts), parent_pk, get_language(),
+        formset.can_delete, tuple(formset.form.base_fields),
+        _freeze(inline_admin_formset.fieldsets),
+        _freeze(inline_admin_formset.readonly_fields),
+        _freeze(inline_admin_formset.prepopulated_fields))
+
+
+def get_fragments(context, inline_admin_formset, per_request=False):
+    """
+    Returns the cache of rendered fragments, the request's one with
+    ``per_request``, or None if caching is disabled.
+    """
+    if not _caching(inline_admin_formset):
+        return None
+    if not per_request:
+        return _fragments
+    request = getattr(context, 'request', None)
+    if request is None:
+        return None
+    return get_request_cache(request, 'nested_fragments')
+
+
+@register.simple_tag(takes_context=True)
+def nested_inline(context, inline_admin_formset, **kwargs):
+    """
+    Renders ``inline_admin_formset`` with its inline's template.
+    """
+    template_name = inline_admin_formset.opts.template
+    nested_template = get_nested_template(template_name, _caching(inline_admin_formset))
+    kwargs['inline_admin_formset'] = inline_admin_formset
+    with context.push(**kwargs):
+        return mark_safe(nested_template.render(context))
+
+
+@register.simple_tag(takes_context=True)
+def nested_include(context, template_name, inline_admin_formset, **kwargs):
+    """
+    Like ``{% include %}`` but reuses the compiled template when caching is
+    enabled for the inline.
+    """
+    nested_template = get_nested_template(template_name, _caching(inline_admin_formset))
+    with context.push(**kwargs):
+        return mark_safe(nested_template.render(context))
+
+
+@register.simple_tag(takes_context=True)
+def nested_inline_header(context, template_name, inline_admin_formset):
+    """
+    Renders the part of an inline that only depends on its configuration.
+    """
+    fragments = get_fragments(context, inline_admin_formset)
+    key = get_fragment_key(template_name, inline_admin_formset)
+    if fragments is not None and key in fragments:
+        return fragments[key]
+    with context.push(recursive_formset=inline_admin_formset):
+        html = mark_safe(get_nested_template(
+            template_name, fragments is not None).render(context))
+    if fragments is not None:
+        fragments[key] = html
+    return html
+
+
+@register.simple_tag(takes_context=True)
+def nested_inline_empty_form(context, template_name, inline_admin_formset):
+    """
+    Renders the empty form of ``inline_admin_formset``. The cached markup is
+    rendered with a placeholder prefix that is swapped for the formset's own.
+    """
+    formset = inline_admin_formset.formset
+    per_request = any(
+        hasattr(field, 'queryset') for field in formset.form.base_fields.values())
+    fragments = get_fragments(context, inline_admin_formset, per_request)
+    cache = _caching(inline_admin_formset)
+    prefix = formset.prefix
+    key = get_fragment_key(template_name, inline_admin_formset)
+    if fragments is None or key not in fragments:
+        formset.prefix = PREFIX_PLACEHOLDER
+        try:
+            inline_admin_form = helpers.InlineAdminForm(
+                formset, formset.empty_form, inline_admin_formset.fieldsets,
+                inline_admin_formset.prepopulated_fields, None,
+                inline_admin_formset.readonly_fields,
+                model_admin=inline_admin_formset.opts)
+            with context.push(recursive_formset=inline_admin_formset,
+                              inline_admin_form=inline_admin_form,
+                              is_empty_form=True):
+                html = get_nested_template(template_name, cache).render(context)
+        finally:
+            formset.prefix = prefix
+        if fragments is None:
+            return mark_safe(html.replace(PREFIX_PLACEHOLDER, prefix))
+        fragments[key] = html
+    return mark_safe(fragments[key].replace(PREFIX_PLACEHOLDER, prefix))
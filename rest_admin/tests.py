@@ -1,3 +1,2207 @@
-from django.test import TestCase
+import copy
+import hashlib
+import json
+import os
+import subprocess
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
 
-# Create your tests here.
+from django import forms
+from django.contrib import messages
+from django.contrib.admin import ModelAdmin
+from django.contrib.admin.sites import AlreadyRegistered
+from django.core.cache import caches
+from django.contrib.admin.exceptions import (
+    DisallowedModelAdminLookup, DisallowedModelAdminToField
+)
+from django.core.exceptions import (
+    FieldDoesNotExist, ImproperlyConfigured, PermissionDenied, SuspiciousOperation
+)
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import NoReverseMatch
+from django.http import Http404, QueryDict
+from django.template import Context
+from django.template.response import SimpleTemplateResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils.encoding import force_text
+from restorm.resource import Resource
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import rest_admin
+from rest_admin import clients, deadlines, ratelimit
+from rest_admin.apps import RestAdminConfig
+from rest_admin.deletion import DeletePlanner, DeleteStopped
+from rest_admin.importer import ImportForm, ImportStopped, ResourceImporter
+from rest_admin.jobs import BaseJobBackend, Job, ThreadJobBackend
+from rest_admin.middleware import DeadlineMiddleware
+from rest_admin.mirror import MirrorNotReady, ResourceMirror, UnsupportedLookup
+from rest_admin.nested import (
+    NestedFormsetTree, NestedRestAdmin, NestedStackedInline, SubmittedDataIndex
+)
+from rest_admin.circuits import (
+    CircuitBreaker, add_stale, call_with_timeout, get_breaker, get_stale, reset_stale
+)
+from rest_admin.exceptions import (
+    CallTimedOut, DeadlineExceeded, RateLimited, ResourceConflict, ResourceUnavailable,
+    ResourceValidationError, TooManyCalls, UpstreamError
+)
+from rest_admin.filters import ChoicesFacetListFilter, FacetListFilter, facet_filter
+from rest_admin.forms import LazyFieldsFormMixin
+from rest_admin.helpers import InlineRows
+from rest_admin.options import InlineRestAdmin, RestAdmin
+from rest_admin.prefetch import PagePrefetcher
+from rest_admin.sites import RestAdminSite
+from rest_admin.templatetags import rest_admin_nested
+from rest_admin.views import row_class_factory
+from rest_admin.widgets import (
+    LAZY_SUFFIX, LazyTextarea, ToManyFieldRawIdWidget, ToOneFieldRawIdWidget
+)
+
+
+class FakeField(object):
+    is_relation = False
+
+    def __init__(self, name, **options):
+        self.name = self.attname = name
+        self.__dict__.update(options)
+
+    def to_python(self, value):
+        return value
+
+
+class FakeOptions(object):
+    abstract = False
+    auto_created = False
+    swapped = False
+    app_label = 'tests'
+
+    def __init__(self, model_name, field_names, client=None):
+        self.model_name = self.object_name = model_name
+        self.verbose_name = model_name
+        self.verbose_name_plural = '%ss' % model_name
+        self.fields = [name if isinstance(name, FakeField) else FakeField(name)
+                       for name in field_names]
+        self.pk = self.fields[0]
+        self.client = client
+
+    def get_field(self, name):
+        for field in self.fields:
+            if field.name == name:
+                return field
+        raise FieldDoesNotExist(name)
+
+
+class FakeResponse(dict):
+    def __init__(self, status=200, content=None, headers=None):
+        super(FakeResponse, self).__init__(headers or {})
+        self.status = status
+        self.content = content
+
+
+class FakeClient(object):
+    """
+    Answers requests with ``responses``, in order, and records them in
+    ``requests``. Responses may be exceptions to raise or functions
+    returning the response.
+    """
+    root_uri = 'http://api.example.com/'
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=5,
+                connection_type=None):
+        self.requests.append((uri, method, body, headers))
+        response = self.responses.pop(0) if self.responses else FakeResponse()
+        if isinstance(response, Exception):
+            raise response
+        if callable(response):
+            return response()
+        return response
+
+
+class FakeResource(object):
+    def __init__(self, model, data, client=None):
+        self._meta = model._meta
+        self.data = data
+        self.pk = data.get(model._meta.pk.name)
+        self.client = client
+        self.absolute_url = '%sprofiles/%s/' % (FakeClient.root_uri, self.pk)
+        for name, value in data.items():
+            setattr(self, name, value)
+
+    def __str__(self):
+        return 'Profile %s' % self.pk
+
+
+def fake_model(name, field_names, client=None):
+    """
+    Returns a class standing in for a resource, with the ``_meta`` the
+    admin reads. The first field is the primary key.
+    """
+    model = type(str(name), (object,), {})
+    model._meta = FakeOptions(name.lower(), field_names, client)
+    return model
+
+
+class RestAdminTestMixin(object):
+    fields = ('id', 'email', 'first_name', 'last_name', 'modified_at')
+
+    def setUp(self):
+        super(RestAdminTestMixin, self).setUp()
+        self.factory = RequestFactory()
+        self.site = RestAdminSite(name='tests')
+        self.model = fake_model('Profile', self.fields)
+
+    def get_admin(self, admin_class=RestAdmin, **options):
+        admin_class = type(str('ProfileAdmin'), (admin_class,), options)
+        return admin_class(self.model, self.site)
+
+    def get_request(self, method='get', path='/', data=None, perms=True):
+        request = getattr(self.factory, method)(path, data or {})
+        request.user = mock.Mock(is_active=True, is_staff=True)
+        request.user.has_perm.return_value = perms
+        return request
+
+
+class SparseFieldsTests(RestAdminTestMixin, SimpleTestCase):
+    def test_changelist_fields(self):
+        def full_name(obj):
+            return obj.first_name
+
+        model_admin = self.get_admin(sparse_fields_extra=('modified_at',))
+        fields = model_admin.get_changelist_sparse_fields(
+            None, ['email', full_name, 'unknown'], ['email'], ['^first_name'])
+        self.assertEqual(fields, ['email', 'first_name', 'id', 'modified_at'])
+
+    def test_mapped_fields(self):
+        model_admin = self.get_admin(sparse_fields_map={'name': ['first_name', 'last_name']})
+        self.assertEqual(model_admin.get_sparse_fields(None, ['name']),
+                         ['first_name', 'id', 'last_name'])
+
+    def test_changeform_fields(self):
+        model_admin = self.get_admin(
+            fieldsets=[(None, {'fields': ['email', ('first_name', 'last_name')]})],
+            readonly_fields=['modified_at'])
+        self.assertEqual(model_admin.get_changeform_sparse_fields(None),
+                         ['email', 'first_name', 'id', 'last_name', 'modified_at'])
+
+    def test_apply_sparse_fields(self):
+        model_admin = self.get_admin(sparse_fields_param='only')
+        queryset = mock.Mock()
+        model_admin.apply_sparse_fields(queryset, ['email', 'id'])
+        queryset.filter.assert_called_once_with(only='email,id')
+        self.assertIs(model_admin.apply_sparse_fields(queryset, []), queryset)
+
+
+class FastJSONTests(SimpleTestCase):
+    class Client(clients.FastJSONClientMixin, object):
+        def create_response_content(self, response_content):
+            return 'decoded by the client'
+
+    def test_decoding(self):
+        client = self.Client()
+        if clients.fast_json is not None:
+            self.assertEqual(client.create_response_content('{"id": 1}'), {'id': 1})
+            self.assertEqual(client.create_response_content('not json'), 'not json')
+        with mock.patch.object(clients, 'fast_json', None):
+            self.assertEqual(client.create_response_content('{"id": 1}'),
+                             'decoded by the client')
+
+
+class ResourceRowTests(SimpleTestCase):
+    def setUp(self):
+        self.model = fake_model('Profile', [FakeField('id', to_python=int), 'email'])
+        self.model.__str__ = self.model.__unicode__ = lambda obj: u'Profile %s' % obj.id
+
+    def test_rows(self):
+        row_class = row_class_factory(self.model, ['email', 'id'])
+        self.assertIs(row_class_factory(self.model, ['email', 'id']), row_class)
+        row = row_class({'id': '3', 'email': 'a@example.com', 'first_name': 'Ann'})
+        self.assertEqual(row.pk, 3)
+        self.assertEqual(row.email, 'a@example.com')
+        self.assertEqual(str(row), 'Profile 3')
+        self.assertFalse(hasattr(row, 'first_name'))
+        with self.assertRaises(AttributeError):
+            row.email = 'b@example.com'
+
+    def test_missing_values(self):
+        row = row_class_factory(self.model, ['email', 'id'])({'id': 1})
+        self.assertIsNone(row.email)
+
+
+class ETagClient(clients.ETagClientMixin, FakeClient):
+    pass
+
+
+class PartialUpdateTests(RestAdminTestMixin, SimpleTestCase):
+    def setUp(self):
+        super(PartialUpdateTests, self).setUp()
+        self.request = self.factory.post('/')
+        clients.set_etags({})
+
+    def get_resource(self, *responses):
+        return FakeResource(self.model, {
+            'id': 1, 'email': 'a@example.com', 'first_name': 'Ann', 'last_name': 'Lee',
+        }, ETagClient(*responses))
+
+    def test_changed_fields_only(self):
+        obj = self.get_resource(FakeResponse(headers={'etag': '"v1"'}), FakeResponse())
+        obj.client.request(obj.absolute_url + '?fields=id,email')
+        self.get_admin(partial_updates=True, use_etags=True).partial_update(
+            self.request, obj, ['first_name', 'full_name'])
+        uri, method, body, headers = obj.client.requests[-1]
+        self.assertEqual((uri, method), (obj.absolute_url, 'PATCH'))
+        self.assertEqual(body, {'first_name': 'Ann'})
+        self.assertEqual(headers, {'If-Match': '"v1"'})
+
+    def test_nothing_changed(self):
+        obj = self.get_resource()
+        self.get_admin(partial_updates=True).partial_update(self.request, obj, [])
+        self.assertEqual(obj.client.requests, [])
+
+    def test_conflict(self):
+        obj = self.get_resource(FakeResponse(status=412))
+        with self.assertRaises(ResourceConflict) as cm:
+            self.get_admin().partial_update(self.request, obj, ['email'])
+        self.assertEqual(cm.exception.status, 412)
+
+    def test_rejected(self):
+        obj = self.get_resource(FakeResponse(status=422, content={
+            'email': ['Enter a valid email address.'], 'detail': 'Invalid profile.'}))
+        with self.assertRaises(ResourceValidationError) as cm:
+            self.get_admin().partial_update(self.request, obj, ['email'])
+
+        class ProfileForm(forms.Form):
+            email = forms.CharField()
+
+        form = ProfileForm({'email': 'a@example.com'})
+        form.is_valid()
+        cm.exception.add_errors_to_form(form)
+        self.assertEqual(form.errors['email'], ['Enter a valid email address.'])
+        self.assertEqual(form.non_field_errors(), ['Invalid profile.'])
+
+    def test_upstream_error(self):
+        obj = self.get_resource(FakeResponse(status=503))
+        with self.assertRaises(UpstreamError) as cm:
+            self.get_admin().partial_update(self.request, obj, ['email'])
+        self.assertNotIsInstance(cm.exception, ResourceConflict)
+        self.assertEqual(cm.exception.status, 503)
+
+    def test_save_model(self):
+        model_admin = self.get_admin(partial_updates=True)
+        obj = self.get_resource()
+        form = mock.Mock(changed_data=['email'])
+        model_admin.save_model(self.request, obj, form, change=True)
+        self.assertEqual(obj.client.requests[0][1:3], ('PATCH', {'email': 'a@example.com'}))
+
+
+class NestedAddViewTests(RestAdminTestMixin, SimpleTestCase):
+    # The view runs in a transaction.
+    allow_database_queries = True
+
+    def test_upstream_error(self):
+        class ProfileForm(forms.Form):
+            email = forms.CharField()
+
+        model_admin = self.get_admin(NestedRestAdmin)
+        request = self.get_request('post', '/admin/tests/profile/add/', {'email': 'a@b.com'})
+        request._dont_enforce_csrf_checks = True
+        tree = mock.Mock(media=forms.Media(), admin_formsets=[])
+        tree.is_valid.return_value = True
+        error = UpstreamError('the API answered with status 503', status=503)
+        with mock.patch.multiple(
+                model_admin, get_form=mock.Mock(return_value=ProfileForm),
+                save_form=mock.DEFAULT, _create_formsets=mock.Mock(return_value=([], [])),
+                get_nested_formset_tree=mock.Mock(return_value=tree),
+                save_model=mock.Mock(side_effect=error),
+                render_change_form=mock.DEFAULT) as patched:
+            model_admin.add_view(request)
+        context = patched['render_change_form'].call_args[0][1]
+        self.assertEqual(context['adminform'].form.non_field_errors(),
+                         ['the API answered with status 503'])
+
+
+class ETagClientTests(SimpleTestCase):
+    def setUp(self):
+        clients.set_etags({})
+
+    def test_etags(self):
+        client = ETagClient(FakeResponse(headers={'etag': '"v1"'}))
+        uri = '%sprofiles/1/' % client.root_uri
+        client.request(uri + '?fields=id')
+        self.assertEqual(client.get_etag(uri), '"v1"')
+        self.assertIsNone(ETagClient().get_etag(uri))
+
+    def test_thread_local(self):
+        client = ETagClient(FakeResponse(headers={'etag': '"v1"'}))
+        uri = '%sprofiles/1/' % client.root_uri
+        client.request(uri)
+        etags = clients.get_etags()
+        clients.set_etags({})
+        self.assertIsNone(client.get_etag(uri))
+        clients.set_etags(etags)
+        self.assertEqual(client.get_etag(uri), '"v1"')
+
+
+class AdminRegistryTests(RestAdminTestMixin, SimpleTestCase):
+    def test_lazy_instantiation(self):
+        admin_class = type(str('ProfileAdmin'), (RestAdmin,), {})
+        with mock.patch.object(admin_class, '__init__', return_value=None) as init:
+            self.site.register([self.model], admin_class)
+            self.assertFalse(init.called)
+            self.assertIs(self.site._registry.get_admin_class(self.model), admin_class)
+            model_admin = self.site._registry[self.model]
+            self.assertIs(self.site._registry[self.model], model_admin)
+        init.assert_called_once_with(self.model, self.site)
+        self.assertIsInstance(model_admin, admin_class)
+
+    def test_options(self):
+        self.site.register([self.model], RestAdmin, list_per_page=20)
+        self.assertEqual(self.site._registry[self.model].list_per_page, 20)
+        with self.assertRaises(AlreadyRegistered):
+            self.site.register([self.model], RestAdmin)
+
+    def test_check_does_not_instantiate(self):
+        admin_class = type(str('ProfileAdmin'), (RestAdmin,), {})
+        self.site.register([self.model], admin_class)
+        with mock.patch.object(admin_class, 'check', return_value=['error']) as check:
+            self.assertEqual(self.site.check(), ['error'])
+        check.assert_called_once_with(self.model)
+        self.assertIsInstance(dict.__getitem__(self.site._registry, self.model), type)
+
+    def test_lazy_field_admin(self):
+        attachment_model = fake_model('Attachment', ('id', 'note', 'content'))
+        inline_class = type(str('AttachmentInline'), (NestedStackedInline,), {
+            'model': attachment_model, 'lazy_fields': ('content',)})
+        note_model = fake_model('Note', ('id', 'body'))
+        note_admin_class = type(str('NoteAdmin'), (NestedRestAdmin,), {
+            'inlines': [inline_class], 'lazy_fields': ('body',)})
+        self.site.register([note_model], note_admin_class)
+        self.site.register([self.model], RestAdmin)
+        request = self.get_request()
+
+        inline = self.site.get_lazy_field_admin(request, 'tests', 'attachment', 'content')
+        self.assertIsInstance(inline, inline_class)
+        note_admin = self.site.get_lazy_field_admin(request, 'tests', 'note', 'body')
+        self.assertIs(note_admin, self.site._registry[note_model])
+        self.assertIsNone(self.site.get_lazy_field_admin(request, 'tests', 'note', 'id'))
+        # Only the admin of the field was instantiated.
+        self.assertIsInstance(dict.__getitem__(self.site._registry, self.model), type)
+
+        self.site.unregister([note_model])
+        self.assertIsNone(self.site.get_lazy_field_admin(request, 'tests', 'note', 'body'))
+
+    def test_startup_report(self):
+        self.site.register([self.model], RestAdmin)
+        [(model, register_time, instantiate_time)] = self.site.get_startup_report()
+        self.assertIs(model, self.model)
+        self.assertGreaterEqual(instantiate_time, 0)
+        self.assertIsInstance(self.site._registry[self.model], RestAdmin)
+
+
+class LazySetupTests(SimpleTestCase):
+    def test_lazy_names(self):
+        from rest_admin import options
+        self.assertIs(rest_admin.RestAdmin, options.RestAdmin)
+        self.assertIn('NestedRestAdmin', dir(rest_admin))
+        with self.assertRaises(AttributeError):
+            rest_admin.Unknown
+
+    def test_import_is_light(self):
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys, rest_admin; '
+            'print(sorted(name for name, module in sys.modules.items() if module and '
+            'name.startswith(("rest_admin.", "restorm", "django.contrib.admin"))))'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(rest_admin.__file__))))
+        self.assertEqual(output.strip(), b'[]')
+
+    def get_config(self):
+        config = RestAdminConfig('rest_admin', rest_admin)
+        names = ('patch_default_admin_site', 'patch_formfield_defaults', 'patch_system_checks')
+        patchers = [mock.patch.object(config, name) for name in names]
+        patchers.append(mock.patch.object(rest_admin, 'autodiscover'))
+        mocks = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        return config, mocks
+
+    def test_setup_runs_once(self):
+        config, mocks = self.get_config()
+        # The admin modules autodiscovered may use the site.
+        rest_admin.autodiscover.side_effect = config.setup
+        config.setup()
+        config.setup()
+        for patched in mocks:
+            patched.assert_called_once_with()
+
+    def test_setup_retried(self):
+        config, mocks = self.get_config()
+        rest_admin.autodiscover.side_effect = [ImportError('no module named admin'), None]
+        with self.assertRaises(ImportError):
+            config.setup()
+        config.setup()
+        self.assertEqual(rest_admin.autodiscover.call_count, 2)
+        config.setup()
+        self.assertEqual(rest_admin.autodiscover.call_count, 2)
+
+    def test_setup_waited_for(self):
+        config, mocks = self.get_config()
+        started, resume = threading.Event(), threading.Event()
+        rest_admin.autodiscover.side_effect = lambda: started.set() or resume.wait(5)
+        events = []
+        thread = threading.Thread(target=config.setup)
+        thread.start()
+        started.wait(5)
+        waiter = threading.Thread(target=lambda: config.setup() or events.append('set up'))
+        waiter.start()
+        waiter.join(0.05)
+        events.append('discovered')
+        resume.set()
+        for t in (thread, waiter):
+            t.join(5)
+        self.assertEqual(events, ['discovered', 'set up'])
+        rest_admin.autodiscover.assert_called_once_with()
+
+
+class InlineInstancesTests(RestAdminTestMixin, SimpleTestCase):
+    def setUp(self):
+        super(InlineInstancesTests, self).setUp()
+        inline = type(str('SubscriptionInline'), (NestedStackedInline,), {
+            'model': fake_model('Subscription', ('id', 'profile', 'vendor_slug'))})
+        self.model_admin = self.get_admin(NestedRestAdmin, inlines=[inline])
+
+    def test_memoized_per_request(self):
+        request = self.get_request()
+        obj = FakeResource(self.model, {'id': 1})
+        inlines = self.model_admin.get_inline_instances(request, obj)
+        self.assertEqual(len(inlines), 1)
+        self.assertIs(self.model_admin.get_inline_instances(request, obj), inlines)
+        self.assertIsNot(self.model_admin.get_inline_instances(request), inlines)
+        self.assertIsNot(self.model_admin.get_inline_instances(self.get_request(), obj),
+                         inlines)
+
+    def test_permissions(self):
+        self.assertEqual(self.model_admin.get_inline_instances(self.get_request(perms=False)), [])
+        request = self.get_request()
+        request.user.has_perm.side_effect = lambda perm: not perm.startswith('tests.add_')
+        inline, = self.model_admin.get_inline_instances(request)
+        self.assertEqual(inline.max_num, 0)
+
+
+class FakeForm(object):
+    error_class = list
+
+    def __init__(self, prefix, instance=None, cleaned_data=None):
+        self.prefix = prefix
+        self.instance = instance
+        self.cleaned_data = cleaned_data
+        self._errors = {}
+
+
+class FakeFormSet(object):
+    """
+    Stands in for an inline formset class, with ``size`` forms bound to
+    the slice of data given for its prefix.
+    """
+    default_prefix = 'items'
+    size = 2
+
+    def __init__(self, instance=None, prefix=None, queryset=None, data=None, files=None):
+        self.instance = instance
+        self.prefix = prefix or self.default_prefix
+        self.data = data
+        self.is_bound = data is not None
+        self.forms = [FakeForm('%s-%d' % (self.prefix, i), instance='%s-%d' % (self.prefix, i))
+                      for i in range(self.size)]
+
+    @classmethod
+    def get_default_prefix(cls):
+        return cls.default_prefix
+
+    def total_form_count(self):
+        return len(self.forms)
+
+    def is_valid(self):
+        return True
+
+
+def fake_inline(prefix, inlines=()):
+    formset_class = type(str('FormSet'), (FakeFormSet,), {'default_prefix': prefix})
+    inline = mock.Mock(inlines=list(inlines))
+    inline.get_inline_instances.return_value = list(inlines)
+    inline.get_formset.return_value = formset_class
+    return inline
+
+
+class NestedFormsetTreeTests(RestAdminTestMixin, SimpleTestCase):
+    def setUp(self):
+        super(NestedFormsetTreeTests, self).setUp()
+        self.model_admin = mock.Mock(max_nesting_depth=7, max_nested_forms=1000)
+        self.options = fake_inline('options')
+        self.items = fake_inline('items', [self.options])
+        self.visit_patch = mock.patch.object(
+            NestedFormsetTree, 'visit', side_effect=lambda inline, formset, obj=None: formset)
+        self.visit = self.visit_patch.start()
+        self.addCleanup(self.visit_patch.stop)
+
+    def build(self, request):
+        tree = NestedFormsetTree(self.model_admin, request)
+        return tree.build([(self.items, FakeFormSet())])
+
+    def test_breadth_first(self):
+        tree = self.build(self.get_request())
+        prefixes = [call[0][1].prefix for call in self.visit.call_args_list]
+        self.assertEqual(prefixes, ['items', 'items-0-options', 'items-1-options'])
+        form = tree.admin_formsets[0].forms[1]
+        self.assertEqual([formset.prefix for formset in form.nested_formsets],
+                         ['items-1-options'])
+        self.assertEqual(form.nested_formsets, form.nested_admin_formsets)
+        self.assertEqual(self.visit.call_args_list[1][0][2], 'items-0')
+        self.items.get_inline_instances.assert_called_once_with(tree.request)
+
+    def test_submitted_data(self):
+        tree = self.build(self.get_request('post', data={
+            'items-1-options-TOTAL_FORMS': '1', 'items-1-options-0-name': 'red', 'name': 'x'}))
+        form_0, form_1 = tree.admin_formsets[0].forms
+        self.assertFalse(form_0.nested_formsets[0].is_bound)
+        data = form_1.nested_formsets[0].data
+        self.assertEqual(sorted(data), ['items-1-options-0-name', 'items-1-options-TOTAL_FORMS'])
+
+    def test_nesting_depth(self):
+        self.model_admin.max_nesting_depth = 2
+        self.options.inlines = [fake_inline('values')]
+        self.options.get_inline_instances.return_value = self.options.inlines
+        with self.assertRaises(ImproperlyConfigured):
+            self.build(self.get_request())
+
+    def test_nesting_depth_check(self):
+        values = type(str('ValueInline'), (NestedStackedInline,), {'inlines': []})
+        options = type(str('OptionInline'), (NestedStackedInline,), {'inlines': [values]})
+        items = type(str('ItemInline'), (NestedStackedInline,), {'inlines': [options]})
+        model_admin = self.get_admin(NestedRestAdmin, inlines=[items], max_nesting_depth=3)
+        checker = model_admin.checks_class()
+        self.assertEqual(checker._check_nesting_depth(model_admin), [])
+        model_admin.max_nesting_depth = 2
+        errors = checker._check_nesting_depth(model_admin)
+        self.assertEqual([error.id for error in errors], ['rest_admin.E001'])
+        # Inlines nesting themselves.
+        options.inlines = [options]
+        self.assertEqual(len(checker._check_nesting_depth(model_admin)), 1)
+
+    def test_parents_with_nested_data(self):
+        tree = self.build(self.get_request('post'))
+        form_0, form_1 = tree.admin_formsets[0].forms
+        form_1.nested_formsets[0].forms[0].cleaned_data = {'name': 'red'}
+        tree._formsets = [tree.admin_formsets[0]] + [
+            form.nested_formsets[0] for form in (form_0, form_1)]
+        tree.validate_parents()
+        self.assertFalse(tree.is_valid())
+        self.assertEqual(form_0._errors, {})
+        self.assertEqual(len(form_1._errors['__all__']), 1)
+
+    def test_too_many_forms(self):
+        self.visit_patch.stop()
+        self.model_admin.max_nested_forms = 1
+        tree = NestedFormsetTree(self.model_admin, self.get_request('post'))
+        with self.assertRaises(SuspiciousOperation):
+            tree.visit(self.items, FakeFormSet(data={}))
+        self.visit_patch.start()
+
+
+class NestedMediaTests(RestAdminTestMixin, SimpleTestCase):
+    class OptionForm(forms.Form):
+        name = forms.CharField()
+
+    def get_admin_formset(self, inline, form=OptionForm, js='options.js'):
+        admin_formset = mock.Mock(opts=inline, formset=mock.Mock(form=form))
+        admin_formset.media = forms.Media(js=[js])
+        return admin_formset
+
+    def test_media_key(self):
+        class TextareaForm(forms.Form):
+            name = forms.CharField(widget=forms.Textarea)
+
+        tree = NestedFormsetTree(mock.Mock(), self.get_request())
+        inline = fake_inline('options')
+        key = tree.get_media_key(self.get_admin_formset(inline))
+        self.assertEqual(key, tree.get_media_key(self.get_admin_formset(inline)))
+        self.assertNotEqual(key, tree.get_media_key(self.get_admin_formset(inline, TextareaForm)))
+
+    def test_media_cached_on_admin(self):
+        model_admin = mock.Mock(_nested_media={})
+        tree = NestedFormsetTree(model_admin, self.get_request())
+        inline = fake_inline('options')
+        for js in ('options.js', 'ignored.js'):
+            admin_formset = self.get_admin_formset(inline, js=js)
+            tree._media_formsets.setdefault(tree.get_media_key(admin_formset), admin_formset)
+        self.assertEqual(tree.media._js, ['options.js'])
+        self.assertEqual(len(model_admin._nested_media), 1)
+
+        tree = NestedFormsetTree(model_admin, self.get_request())
+        admin_formset = self.get_admin_formset(inline, js='other.js')
+        tree._media_formsets[tree.get_media_key(admin_formset)] = admin_formset
+        self.assertEqual(tree.media._js, ['options.js'])
+
+    def test_inline_media(self):
+        inline_class = type(str('OptionInline'), (NestedStackedInline,), {
+            'model': fake_model('Option', ('id', 'name'))})
+        inline = inline_class(self.model, self.site)
+        self.assertIs(inline.media, inline_class(self.model, self.site).media)
+        inline.prepopulated_fields = {'slug': ('name',)}
+        self.assertTrue(any('urlify' in js for js in inline.media._js))
+
+    def test_inline_media_settings(self):
+        inline_class = type(str('OptionInline'), (NestedStackedInline,), {
+            'model': fake_model('Option', ('id', 'name'))})
+        inline = inline_class(self.model, self.site)
+        with override_settings(DEBUG=False, STATIC_URL='/static/'):
+            self.assertIn('/static/admin/js/jquery.min.js', inline.media._js)
+        with override_settings(DEBUG=True, STATIC_URL='/assets/'):
+            self.assertIn('/assets/admin/js/jquery.js', inline.media._js)
+
+
+class SubmittedDataIndexTests(SimpleTestCase):
+    def test_prefixes(self):
+        data = QueryDict('a-0-b-1-name=x&a-0-b-1-tags=1&a-0-b-1-tags=2&a-1-name=y&name=z')
+        index = SubmittedDataIndex(data)
+        for prefix in ('a', 'a-0', 'a-0-b', 'a-0-b-1', 'a-1'):
+            self.assertIn(prefix, index)
+        self.assertNotIn('a-0-b-2', index)
+        self.assertNotIn('name', index)
+
+        nested = index.get_data('a-0-b')
+        self.assertEqual(sorted(nested), ['a-0-b-1-name', 'a-0-b-1-tags'])
+        self.assertEqual(nested.getlist('a-0-b-1-tags'), ['1', '2'])
+        self.assertFalse(nested._mutable)
+        self.assertEqual(len(index.get_data('c')), 0)
+
+
+class DeletePlannerTests(RestAdminTestMixin, SimpleTestCase):
+    def setUp(self):
+        super(DeletePlannerTests, self).setUp()
+        self.deleted = []
+        self.subscription_model = fake_model('Subscription', ('id', 'profile'))
+        self.option_model = fake_model('Option', ('id', 'subscription'))
+        self.profile = self.make(self.model, 1)
+        self.subscriptions = [self.make(self.subscription_model, pk, profile=1)
+                              for pk in (10, 11)]
+        self.option = self.make(self.option_model, 20, subscription=10)
+        self.subscription_model.objects = mock.Mock()
+        self.subscription_model.objects.filter.return_value = self.subscriptions
+        self.option_model.objects = mock.Mock()
+        self.option_model.objects.filter.return_value = [self.option]
+
+    def make(self, model, pk, **data):
+        obj = model()
+        obj.pk = pk
+        obj.__dict__.update(data)
+        obj.delete = lambda: self.deleted.append(obj)
+        return obj
+
+    def get_planner(self, **kwargs):
+        relations = {
+            self.model: [(self.subscription_model, FakeField('profile'))],
+            self.subscription_model: [(self.option_model, FakeField('subscription'))],
+        }
+        planner = DeletePlanner(self.get_admin(), self.get_request(), **kwargs)
+        planner.get_relations = lambda model: relations.get(model, [])
+        return planner.collect([self.profile])
+
+    def test_collect(self):
+        planner = self.get_planner()
+        self.assertEqual(planner.levels, [[self.profile], self.subscriptions, [self.option]])
+        self.subscription_model.objects.filter.assert_called_once_with(profile__in='1')
+        self.option_model.objects.filter.assert_called_once_with(subscription__in='10,11')
+        self.assertEqual(planner.model_count, {'profiles': 1, 'subscriptions': 2, 'options': 1})
+        nested = planner.nested()
+        self.assertEqual(len(nested), 2)
+        self.assertTrue(nested[0].startswith('Profile: '))
+        self.assertEqual(len(nested[1]), 3)
+        self.assertTrue(nested[1][1][0].startswith('Option: '))
+
+    def test_delete_deepest_first(self):
+        progress = mock.Mock()
+        planner = self.get_planner(progress=progress)
+        planner.delete()
+        self.assertEqual(self.deleted[0], self.option)
+        self.assertEqual(set(self.deleted[1:]), set(self.subscriptions))
+        self.assertNotIn(self.profile, self.deleted)
+        progress.assert_called_with(3, 3)
+
+    def test_failing_child(self):
+        def fail():
+            raise UpstreamError('upstream down')
+
+        self.subscriptions[0].delete = fail
+        planner = self.get_planner(concurrency=1)
+        with self.assertRaises(DeleteStopped) as cm:
+            planner.delete()
+        # The cascade stops, the other subscription and the profile are kept.
+        self.assertEqual(self.deleted, [self.option])
+        self.assertEqual(cm.exception.deleted, [self.option])
+        message = force_text(cm.exception)
+        self.assertTrue(message.startswith('subscription "'))
+        self.assertIn('could not be deleted (upstream down), the deletion stopped after '
+                      'deleting option "', message)
+
+    def test_delete_view_stopped(self):
+        model_admin = self.get_admin()
+        planner = mock.Mock(perms_needed=set(), model_count={})
+        planner.delete.side_effect = DeleteStopped('option could not be deleted')
+        request = self.get_request('post', '/admin/tests/profile/1/delete/', {'post': 'yes'})
+        request._dont_enforce_csrf_checks = True
+        with mock.patch.multiple(
+                model_admin, get_object=mock.Mock(return_value=mock.Mock()),
+                get_delete_planner=mock.Mock(return_value=planner),
+                delete_model=mock.DEFAULT, message_user=mock.DEFAULT) as patched:
+            response = model_admin.delete_view(request, '1')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], '/admin/tests/profile/1/delete/')
+        patched['message_user'].assert_called_once_with(
+            request, 'option could not be deleted', messages.ERROR)
+        self.assertFalse(patched['delete_model'].called)
+
+    def test_perms_needed(self):
+        self.site._registry[self.subscription_model] = mock.Mock(
+            **{'has_delete_permission.return_value': False})
+        planner = self.get_planner()
+        planner.nested()
+        self.assertEqual(planner.perms_needed, {'subscription'})
+
+    def test_no_cascade(self):
+        planner = DeletePlanner(self.get_admin(), self.get_request(), cascade=False)
+        self.assertEqual(planner.get_relations(self.model), [])
+
+
+class JobTests(RestAdminTestMixin, SimpleTestCase):
+    def tearDown(self):
+        clients.set_etags({})
+        deadlines.clear_deadline()
+        super(JobTests, self).tearDown()
+
+    def test_run_context(self):
+        clients.set_etags({'api': {'/profiles/1/': '"v1"'}})
+        deadlines.set_deadline(1)
+        with override_settings(REST_ADMIN_JOB_DEADLINE=30):
+            job = Job('Change profile')
+        job.capture_context()
+        clients.set_etags({})
+        deadlines.clear_deadline()
+        context = {}
+
+        def func(job, value):
+            context.update(etags=clients.get_etags(), priority=ratelimit.get_priority(),
+                           remaining=deadlines.remaining())
+            return 'Changed %s.' % value
+
+        BaseJobBackend().run(job, func, ('profile',), {})
+        self.assertEqual(job.state, Job.DONE)
+        self.assertEqual(job.message, 'Changed profile.')
+        self.assertEqual(context['etags'], {'api': {'/profiles/1/': '"v1"'}})
+        self.assertEqual(context['priority'], ratelimit.BULK)
+        # The job's own deadline, not what was left of the request's one.
+        self.assertTrue(1 < context['remaining'] <= 30)
+        self.assertEqual(clients.get_etags(), {})
+        self.assertIsNone(deadlines.get_deadline())
+        self.assertEqual(ratelimit.get_priority(), ratelimit.INTERACTIVE)
+
+    def test_no_deadline(self):
+        deadlines.set_deadline(1)
+        job = Job('Delete profile')
+        job.capture_context()
+        deadlines.clear_deadline()
+        remaining = []
+        BaseJobBackend().run(job, lambda job: remaining.append(deadlines.remaining()), (), {})
+        self.assertEqual(remaining, [None])
+
+    def test_failed_job(self):
+        def func(job):
+            raise UpstreamError('upstream down')
+
+        job = Job('Change profile')
+        with mock.patch('rest_admin.jobs.logger') as logger:
+            BaseJobBackend().run(job, func, (), {})
+        self.assertTrue(logger.exception.called)
+        self.assertTrue(job.finished)
+        self.assertEqual(job.state, Job.FAILED)
+        self.assertEqual(job.as_dict()['message'], 'upstream down')
+
+    def test_thread_backend(self):
+        backend = ThreadJobBackend(workers=1, max_jobs=2)
+        jobs = [backend.submit(Job('Job %d' % i), lambda job: 'done') for i in range(3)]
+        backend.pool.close()
+        backend.pool.join()
+        self.assertIsNone(backend.get(jobs[0].id))
+        self.assertIs(backend.get(jobs[2].id), jobs[2])
+        self.assertEqual([job.state for job in jobs], [Job.DONE] * 3)
+
+    def test_job_of_other_user(self):
+        job = Job('Change profile', user_id=1)
+        backend = mock.Mock(**{'get.return_value': job})
+        request = self.get_request()
+        request.user.pk = 2
+        model_admin = self.get_admin()
+        with mock.patch('rest_admin.options.get_job_backend', return_value=backend):
+            with self.assertRaises(Http404):
+                model_admin.job_status_view(request, job.id)
+            request.user.pk = 1
+            response = model_admin.job_status_view(request, job.id)
+        self.assertIn(b'"state": "pending"', response.content)
+
+
+class FragmentTemplate(object):
+    """Counts its renders and shows the prefix of the rendered formset."""
+
+    def __init__(self):
+        self.renders = 0
+
+    def render(self, context):
+        self.renders += 1
+        return '<div id="%s-empty"></div>' % context['recursive_formset'].formset.prefix
+
+
+class NestedFragmentTests(SimpleTestCase):
+    class OptionForm(forms.Form):
+        name = forms.CharField()
+
+    def setUp(self):
+        self.template = FragmentTemplate()
+        patches = [
+            mock.patch.dict(rest_admin_nested._fragments, clear=True),
+            mock.patch.object(rest_admin_nested, 'get_nested_template',
+                              return_value=self.template),
+            mock.patch.object(rest_admin_nested.helpers, 'InlineAdminForm'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def get_inline_admin_formset(self, prefix='items-0-options', cache=True, form=OptionForm,
+                                 parent_pk=42, **options):
+        formset = mock.Mock(prefix=prefix, can_delete=True, form=form,
+                            instance=mock.Mock(pk=parent_pk))
+        defaults = {
+            'fieldsets': [(None, {'fields': ['name']})],
+            'readonly_fields': [],
+            'prepopulated_fields': {},
+        }
+        defaults.update(options)
+        return mock.Mock(
+            formset=formset, opts=mock.sentinel.inline,
+            model_admin=mock.Mock(cache_inline_fragments=cache), **defaults)
+
+    def render_empty_form(self, context, inline_admin_formset):
+        return rest_admin_nested.nested_inline_empty_form(
+            context, 'tabular-nested-row.html', inline_admin_formset)
+
+    def test_fragment_key(self):
+        key = rest_admin_nested.get_fragment_key('row.html', self.get_inline_admin_formset())
+        self.assertEqual(key, rest_admin_nested.get_fragment_key(
+            'row.html', self.get_inline_admin_formset(prefix='items-1-options')))
+        self.assertNotEqual(key, rest_admin_nested.get_fragment_key(
+            'row.html', self.get_inline_admin_formset(readonly_fields=['name'])))
+
+    def test_empty_form_cached(self):
+        context = Context()
+        html = self.render_empty_form(context, self.get_inline_admin_formset())
+        self.assertEqual(html, '<div id="items-0-options-empty"></div>')
+        inline_admin_formset = self.get_inline_admin_formset('items-1-options')
+        html = self.render_empty_form(context, inline_admin_formset)
+        self.assertEqual(html, '<div id="items-1-options-empty"></div>')
+        self.assertEqual(inline_admin_formset.formset.prefix, 'items-1-options')
+        self.assertEqual(self.template.renders, 1)
+
+    def test_empty_form_per_parent(self):
+        self.template.render = lambda context: '<input name="%s-0-item" value="%s">' % (
+            context['recursive_formset'].formset.prefix,
+            context['recursive_formset'].formset.instance.pk)
+        html = [self.render_empty_form(Context(), self.get_inline_admin_formset(
+            'items-%s-options' % num, parent_pk=parent_pk))
+            for num, parent_pk in enumerate((42, 43))]
+        self.assertEqual(html, ['<input name="items-0-options-0-item" value="42">',
+                                '<input name="items-1-options-0-item" value="43">'])
+
+    def test_empty_form_not_cached(self):
+        for prefix in ('items-0-options', 'items-1-options'):
+            html = self.render_empty_form(
+                Context(), self.get_inline_admin_formset(prefix, cache=False))
+            self.assertEqual(html, '<div id="%s-empty"></div>' % prefix)
+        self.assertEqual(self.template.renders, 2)
+        self.assertEqual(rest_admin_nested._fragments, {})
+
+    def test_empty_form_with_choices_cached_per_request(self):
+        class ChoiceForm(forms.Form):
+            vendor = forms.ModelChoiceField(queryset=mock.MagicMock())
+
+        for request in (RequestFactory().get('/'), RequestFactory().get('/')):
+            context = Context()
+            context.request = request
+            for prefix in ('items-0-options', 'items-1-options'):
+                self.render_empty_form(
+                    context, self.get_inline_admin_formset(prefix, form=ChoiceForm))
+        self.assertEqual(self.template.renders, 2)
+        self.assertEqual(rest_admin_nested._fragments, {})
+
+    def test_header_cached(self):
+        for prefix in ('items-0-options', 'items-1-options'):
+            rest_admin_nested.nested_inline_header(
+                Context(), 'tabular-nested-header.html', self.get_inline_admin_formset(prefix))
+        self.assertEqual(self.template.renders, 1)
+
+
+class InlineRowsTests(RestAdminTestMixin, SimpleTestCase):
+    class SubscriptionForm(forms.Form):
+        started_on = forms.DateField(widget=type(str('CalendarInput'), (forms.DateInput,), {
+            'Media': type(str('Media'), (), {'js': ('calendar.js',)})}))
+
+        class Media:
+            js = ('subscription.js',)
+
+        def __init__(self, *args, **kwargs):
+            raise AssertionError("collapsed inlines don't build forms")
+
+    def setUp(self):
+        super(InlineRowsTests, self).setUp()
+        self.subscription_model = fake_model('Subscription', [
+            'id', 'profile', FakeField('vendor_slug', verbose_name='vendor'),
+            FakeField('status', verbose_name='status', flatchoices=[('a', 'Active')])])
+        self.FormSet = mock.Mock(fk=FakeField('profile'), form=self.SubscriptionForm)
+        self.obj = FakeResource(self.model, {'id': 1})
+        self.queryset = mock.Mock()
+        self.queryset.filter.return_value.values.return_value = [
+            {'id': 10, 'vendor_slug': 'acme', 'status': 'a'},
+            {'id': 11, 'vendor_slug': None, 'status': 'x'},
+        ]
+
+    def get_inline(self, **options):
+        options.setdefault('fieldsets', [(None, {'fields': ['profile', 'vendor_slug', 'status']})])
+        inline_class = type(str('SubscriptionInline'), (InlineRestAdmin,), dict(
+            model=self.subscription_model, **options))
+        inline = inline_class(self.model, self.site)
+        inline.get_queryset = lambda request: self.queryset
+        return inline
+
+    def get_inline_rows(self, inline, request):
+        with mock.patch('rest_admin.options.reverse', return_value='/load/'):
+            return self.get_admin().get_inline_rows(
+                request, self.FormSet, inline, 'subscriptions', self.obj)
+
+    def test_collapsed(self):
+        inline = self.get_inline(collapsed=True)
+        inline_rows = self.get_inline_rows(inline, self.get_request())
+        self.assertEqual(inline_rows.load_url, '/load/')
+        self.assertEqual(inline_rows.opts.template, InlineRows.collapsed_template)
+        self.assertIn('subscription.js', inline_rows.media._js)
+        self.assertIn('calendar.js', inline_rows.media._js)
+        self.assertEqual(list(inline_rows), [])
+
+        request = self.get_request('post', data={'subscriptions-TOTAL_FORMS': '1'})
+        self.assertIsNone(self.get_inline_rows(inline, request))
+
+    def test_read_only(self):
+        inline_rows = self.get_inline_rows(self.get_inline(), self.get_request(perms=False))
+        self.assertEqual(inline_rows.opts.template, InlineRows.readonly_template)
+        self.assertEqual(inline_rows.fields, ['vendor_slug', 'status'])
+        self.assertEqual(inline_rows.headers, ['vendor', 'status'])
+        self.queryset.filter.assert_called_once_with(profile=1)
+        self.queryset.filter.return_value.values.assert_called_once_with(
+            'id', 'status', 'vendor_slug')
+        self.assertEqual(list(inline_rows.results()), [['acme', 'Active'], ['-', '-']])
+
+    def test_formsets(self):
+        self.assertIsNone(self.get_inline_rows(self.get_inline(), self.get_request()))
+        inline = self.get_inline(inlines=[mock.Mock()])
+        self.assertIsNone(self.get_inline_rows(inline, self.get_request(perms=False)))
+        self.assertIsNone(self.get_inline_rows(mock.Mock(), self.get_request(perms=False)))
+
+
+class SingleFlightClient(clients.SingleFlightClientMixin, FakeClient):
+    pass
+
+
+class SingleFlightTests(SimpleTestCase):
+    uri = FakeClient.root_uri + 'profiles/1/'
+    key = (uri, ())
+
+    def setUp(self):
+        self.client = SingleFlightClient(FakeResponse(content={'id': 1}))
+
+    def follow(self, flight):
+        """
+        Requests the uri while ``flight`` is in progress for it and returns
+        the thread and a list receiving its response or error.
+        """
+        flights, lock = self.client._single_flight
+        flights[self.key] = flight
+        wait = flight.event.wait
+        flight.followed = threading.Event()
+        flight.event.wait = lambda: flight.followed.set() or wait()
+        result = []
+
+        def request():
+            try:
+                result.append(self.client.request(self.uri))
+            except Exception as err:
+                result.append(err)
+
+        thread = threading.Thread(target=request)
+        thread.start()
+        return thread, result
+
+    def test_leader(self):
+        response = self.client.request(self.uri)
+        self.assertEqual(response.content, {'id': 1})
+        self.assertEqual(len(self.client.requests), 1)
+        self.assertEqual(self.client._single_flight[0], {})
+
+    def test_follower_gets_copy(self):
+        flight = clients._Flight()
+        thread, result = self.follow(flight)
+        flight.response = FakeResponse(content={'id': 2})
+        flight.event.set()
+        thread.join(5)
+        self.assertEqual(result[0].content, {'id': 2})
+        self.assertIsNot(result[0], flight.response)
+        self.assertEqual(self.client.requests, [])
+
+    def land(self, flight):
+        """
+        Ends ``flight`` as its leader would once a follower waits for it.
+        """
+        flight.followed.wait(5)
+        with self.client._single_flight[1]:
+            del self.client._single_flight[0][self.key]
+        flight.event.set()
+
+    def test_follower_gets_error(self):
+        flight = clients._Flight()
+        thread, result = self.follow(flight)
+        flight.error = UpstreamError('upstream down', status=503)
+        self.land(flight)
+        thread.join(5)
+        self.assertIsNot(result[0], flight.error)
+        self.assertIsInstance(result[0], UpstreamError)
+        self.assertEqual((str(result[0]), result[0].status), ('upstream down', 503))
+        self.assertEqual(self.client.requests, [])
+
+    def test_follower_retries_after_leader_deadline(self):
+        for error in (DeadlineExceeded('the request ran out of time'),
+                      CallTimedOut('no response within 0.1 seconds')):
+            self.client.responses = [FakeResponse(content={'id': 1})]
+            self.client.requests = []
+            flight = clients._Flight()
+            thread, result = self.follow(flight)
+            flight.error = error
+            self.land(flight)
+            thread.join(5)
+            self.assertEqual(result[0].content, {'id': 1})
+            self.assertEqual(len(self.client.requests), 1)
+
+    def test_other_methods(self):
+        self.client._single_flight[0][self.key] = clients._Flight()
+        self.client.request(self.uri, 'PUT', '{}')
+        self.assertEqual(len(self.client.requests), 1)
+
+    def test_cross_process(self):
+        cache = caches['default']
+        digest = hashlib.md5(repr(self.key).encode('utf-8')).hexdigest()
+        self.addCleanup(cache.clear)
+        self.client.single_flight_cache = 'default'
+        self.client.request(self.uri)
+        self.assertEqual(cache.get('rest_admin:flight:result:%s' % digest).content, {'id': 1})
+        self.assertIsNone(cache.get('rest_admin:flight:lock:%s' % digest))
+
+        # Another process holds the lock and shares its response.
+        cache.set('rest_admin:flight:lock:%s' % digest, 1)
+        cache.set('rest_admin:flight:result:%s' % digest, FakeResponse(content={'id': 3}))
+        self.assertEqual(self.client.request(self.uri).content, {'id': 3})
+        self.assertEqual(len(self.client.requests), 1)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_states(self):
+        breaker = CircuitBreaker('tests', failure_threshold=2, reset_timeout=30)
+        for _ in range(2):
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        breaker.opened_at -= 30
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+        breaker.record_failure(timeout=True)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        breaker.opened_at -= 30
+        self.assertTrue(breaker.allow())
+        breaker.record_success(0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        metrics = breaker.metrics()
+        self.assertEqual((metrics['calls'], metrics['failures'], metrics['timeouts'],
+                          metrics['rejected']), (4, 3, 1, 2))
+
+    def test_cancelled_trial(self):
+        breaker = CircuitBreaker('tests', failure_threshold=1)
+        breaker.record_failure()
+        breaker.opened_at -= breaker.reset_timeout
+        self.assertTrue(breaker.allow())
+        breaker.record_cancel()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+
+    def test_timeout(self):
+        breaker = CircuitBreaker('tests', min_timeout=0.5, max_timeout=10)
+        self.assertEqual(breaker.timeout, 10)
+        breaker.record_success(1.0)
+        self.assertEqual(breaker.timeout, 3.0)
+        breaker.record_success(0.01)
+        self.assertEqual(breaker.latency, 1.0 - 0.99 / 8)
+        for _ in range(50):
+            breaker.record_success(0.01)
+        self.assertEqual(breaker.timeout, 0.5)
+
+
+class CallWithTimeoutTests(SimpleTestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def test_result(self):
+        self.assertEqual(call_with_timeout(lambda: 'result', 1), 'result')
+        with self.assertRaises(ResourceConflict):
+            call_with_timeout(mock.Mock(side_effect=ResourceConflict('conflict')), 1)
+
+    def test_timed_out(self):
+        with self.assertRaises(CallTimedOut):
+            call_with_timeout(self.release.wait, 0.01)
+
+    def test_slots(self):
+        slots = threading.BoundedSemaphore(1)
+        with self.assertRaises(CallTimedOut):
+            call_with_timeout(self.release.wait, 0.01, slots)
+        with self.assertRaises(TooManyCalls):
+            call_with_timeout(lambda: 'result', 1, slots)
+        self.release.set()
+        for _ in range(100):
+            if slots.acquire(False):
+                break
+            time.sleep(0.01)
+        else:
+            self.fail("the slot wasn't released")
+
+
+class CircuitBreakerClient(clients.CircuitBreakerClientMixin, FakeClient):
+    circuit_failure_threshold = 1
+    stale_responses = 2
+
+
+class CircuitBreakerClientTests(SimpleTestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.addCleanup(deadlines.clear_deadline)
+        reset_stale()
+        # Breakers are shared by name, give each test a resource of its own.
+        self.uri = '%s%s/1/' % (FakeClient.root_uri, uuid.uuid4().hex)
+        self.client = CircuitBreakerClient()
+
+    @property
+    def breaker(self):
+        return get_breaker(self.client.get_circuit_name(self.uri))
+
+    def hang(self):
+        self.release.wait(5)
+        return FakeResponse()
+
+    def test_stale_response(self):
+        self.client.responses = [FakeResponse(content={'id': 1}), UpstreamError('down')]
+        self.client.request(self.uri)
+        response = self.client.request(self.uri)
+        self.assertEqual(response.content, {'id': 1})
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(get_stale(), [self.uri])
+
+        # The open circuit answers without calling the resource.
+        self.assertEqual(self.client.request(self.uri).content, {'id': 1})
+        self.assertEqual(len(self.client.requests), 2)
+        with self.assertRaises(ResourceUnavailable):
+            self.client.request(self.uri, 'PUT', '{}')
+        self.assertEqual(self.breaker.metrics()['stale'], 2)
+
+    def test_server_errors(self):
+        self.client.responses = [FakeResponse(status=503)]
+        self.assertEqual(self.client.request(self.uri).status, 503)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_inner_unavailable(self):
+        self.client.responses = [ResourceUnavailable('rate limited')]
+        with self.assertRaises(ResourceUnavailable):
+            self.client.request(self.uri)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.failures, 0)
+
+    def test_too_many_calls(self):
+        self.client.circuit_max_calls = 1
+        self.client.circuit_max_timeout = 0.01
+        self.client.responses = [self.hang, FakeResponse()]
+        with self.assertRaises(CallTimedOut):
+            self.client.request(self.uri)
+        self.breaker.state = CircuitBreaker.CLOSED
+        with self.assertRaises(TooManyCalls):
+            self.client.request(self.uri)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_deadline(self):
+        self.client.responses = [self.hang]
+        deadlines.set_deadline(0.01)
+        with self.assertRaises(DeadlineExceeded):
+            self.client.request(self.uri)
+        self.assertEqual(self.breaker.failures, 0)
+        with self.assertRaises(DeadlineExceeded):
+            self.client.request(self.uri)
+
+
+class FakeQuerySet(object):
+    """Counts how many times its objects are fetched."""
+    _prefetch_related_lookups = ()
+
+    def __init__(self, objs, query='SELECT profiles'):
+        self.objs = objs
+        self.query = query
+        self.fetches = 0
+
+    def all(self):
+        return self
+
+    def __iter__(self):
+        self.fetches += 1
+        return iter(self.objs)
+
+    def __len__(self):
+        self.fetches += 1
+        return len(self.objs)
+
+    iterator = __iter__
+
+
+class SharedChoicesTests(RestAdminTestMixin, SimpleTestCase):
+    def setUp(self):
+        super(SharedChoicesTests, self).setUp()
+        self.objs = [FakeResource(self.model, {'id': pk}) for pk in (1, 2)]
+        self.queryset = FakeQuerySet(self.objs)
+        self.db_field = FakeField('profile')
+
+    def get_field(self, model_admin, request, queryset=None, **kwargs):
+        if queryset is None:
+            queryset = self.queryset
+        form_field = forms.ModelChoiceField(queryset, **kwargs)
+        return model_admin.share_choices(request, self.db_field, form_field)
+
+    def test_copies_share_choices(self):
+        form_field = self.get_field(self.get_admin(), self.get_request())
+        for field in (copy.deepcopy(form_field), copy.deepcopy(form_field)):
+            self.assertEqual([value for value, label in field.choices], ['', 1, 2])
+        self.assertEqual(len(form_field.choices), 3)
+        self.assertEqual(self.queryset.fetches, 1)
+
+    def test_shared_per_request(self):
+        model_admin = self.get_admin()
+        request = self.get_request()
+        fields = [self.get_field(model_admin, request) for _ in range(2)]
+        fields.append(self.get_field(model_admin, self.get_request()))
+        for field in fields:
+            list(field.choices)
+        self.assertEqual(self.queryset.fetches, 2)
+
+    def test_different_choices(self):
+        model_admin = self.get_admin()
+        request = self.get_request()
+        other = FakeQuerySet(self.objs[:1], query='SELECT profiles WHERE id = 1')
+        limited = self.get_field(model_admin, request, limit_choices_to={'active': True})
+        self.assertEqual(len(self.get_field(model_admin, request).choices), 3)
+        self.assertEqual(len(self.get_field(model_admin, request, other).choices), 2)
+        self.assertEqual(len(limited.choices), 3)
+        self.assertEqual(self.queryset.fetches, 2)
+        self.assertNotEqual(
+            model_admin.get_choices_key(self.db_field, limited),
+            model_admin.get_choices_key(self.db_field, self.get_field(model_admin, request)))
+
+    def test_disabled(self):
+        model_admin = self.get_admin(share_relation_choices=False)
+        form_field = self.get_field(model_admin, self.get_request())
+        for field in (form_field, copy.deepcopy(form_field)):
+            [choice for choice in field.choices]
+        self.assertEqual(self.queryset.fetches, 2)
+
+
+class FacetFilterTests(RestAdminTestMixin, SimpleTestCase):
+    def setUp(self):
+        super(FacetFilterTests, self).setUp()
+        self.addCleanup(caches['default'].clear)
+        self.addCleanup(deadlines.clear_deadline)
+        self.client = FakeClient(FakeResponse(content=[
+            {'value': 'en', 'label': 'English', 'count': 3},
+            {'value': 'nl', 'count': 1},
+        ]))
+        self.model = fake_model('Profile', [
+            'id', FakeField('language', verbose_name='language',
+                            flatchoices=[('en', 'English'), ('fr', 'French')])],
+            client=self.client)
+        self.model_admin = self.get_admin(facets_endpoint='profiles/facets/')
+
+    def get_filter(self, filter_class, params=None):
+        return filter_class(self.get_request(), dict(params or {}), self.model, self.model_admin)
+
+    def test_get_facets(self):
+        self.assertEqual(self.model_admin.get_facets(None, 'language'),
+                         [('en', 'English', 3), ('nl', 'nl', 1)])
+        self.assertEqual(self.client.requests[0][:2],
+                         ('http://api.example.com/profiles/facets/?field=language', 'GET'))
+        with self.assertRaises(ImproperlyConfigured):
+            self.get_admin().get_facets(None, 'language')
+
+    def test_lookups(self):
+        filter_class = facet_filter('language', show_counts=True)
+        self.assertEqual(filter_class.__name__, 'LanguageFacetListFilter')
+        self.assertTrue(issubclass(filter_class, FacetListFilter))
+        list_filter = self.get_filter(filter_class)
+        self.assertEqual(list_filter.title, 'language')
+        self.assertEqual(list_filter.lookup_choices, [('en', 'English (3)'), ('nl', 'nl (1)')])
+        # Cached for the next changelist loads.
+        self.get_filter(filter_class)
+        self.assertEqual(len(self.client.requests), 1)
+
+    def test_choices_lookups(self):
+        filter_class = facet_filter('language', title='spoken', choices_filter=True)
+        self.assertTrue(issubclass(filter_class, ChoicesFacetListFilter))
+        list_filter = self.get_filter(filter_class)
+        self.assertEqual(list_filter.title, 'spoken')
+        self.assertEqual(list_filter.lookup_choices, [('en', 'English'), ('fr', 'French')])
+        self.assertEqual(self.client.requests, [])
+
+        filter_class.show_counts = True
+        self.assertEqual(self.get_filter(filter_class).lookup_choices,
+                         [('en', 'English (3)'), ('fr', 'French')])
+
+    def test_queryset(self):
+        filter_class = facet_filter('country')
+        queryset = mock.Mock()
+        self.assertIs(self.get_filter(filter_class).queryset(None, queryset), queryset)
+        list_filter = self.get_filter(filter_class, {'country': 'nl'})
+        self.assertEqual(list_filter.title, 'country')
+        list_filter.queryset(None, queryset)
+        queryset.filter.assert_called_once_with(country='nl')
+
+    def test_no_budget(self):
+        deadlines.set_deadline(0.5)
+        self.assertEqual(self.get_filter(facet_filter('language')).lookup_choices, [])
+        self.assertEqual(self.client.requests, [])
+
+
+class IntegerField(FakeField):
+    pass
+
+
+class ResourceMirrorTests(SimpleTestCase):
+    profiles = [
+        {'id': 1, 'email': 'ann@example.com', 'zip_code': '0123', 'age': 30,
+         'modified_at': '2016-01-01', 'tags': ['a']},
+        {'id': 2, 'email': 'bob@example.com', 'zip_code': '123', 'age': 9,
+         'modified_at': '2016-01-03', 'tags': None},
+        {'id': 3, 'email': 'cy_d@example.com', 'zip_code': None, 'age': 41,
+         'modified_at': '2016-01-02', 'tags': []},
+    ]
+
+    def setUp(self):
+        self.model = fake_model('Profile', [
+            IntegerField('id'), 'email', 'zip_code', IntegerField('age'), 'modified_at', 'tags'])
+        self.queryset = mock.Mock()
+        self.queryset.filter.return_value = self.queryset
+        self.queryset.values.return_value = self.profiles
+        self.model.objects = mock.Mock(**{'all.return_value': self.queryset})
+        self.mirror = ResourceMirror(
+            self.model, ['email', 'zip_code', 'age', 'tags'], indexed_fields=['email'])
+
+    def get_pks(self, queryset):
+        return [row.pk for row in queryset]
+
+    def test_columns(self):
+        self.assertEqual(self.mirror.columns, [
+            ('age', 'NUMERIC'), ('email', 'TEXT'), ('id', 'NUMERIC'),
+            ('modified_at', 'TEXT'), ('tags', 'TEXT'), ('zip_code', 'TEXT')])
+        self.assertTrue(self.mirror.table.startswith('tests_profile_'))
+        other = ResourceMirror(self.model, ['email'])
+        self.assertNotEqual(other.table, self.mirror.table)
+
+    def test_lookups(self):
+        self.mirror.sync()
+        self.queryset.values.assert_called_once_with(*self.mirror.fields)
+        queryset = self.mirror.queryset()
+        self.assertEqual(queryset.count(), 3)
+        self.assertEqual(self.get_pks(queryset.filter(zip_code='123')), [2])
+        self.assertEqual(self.get_pks(queryset.filter(age__gte=30).order_by('-age')), [3, 1])
+        self.assertEqual(self.get_pks(queryset.filter(pk__in='1,3').order_by('id')), [1, 3])
+        self.assertEqual(queryset.filter(id__in=[]).count(), 0)
+        self.assertEqual(self.get_pks(queryset.filter(email__icontains='Y_D')), [3])
+        self.assertEqual(self.get_pks(queryset.filter(email__icontains='_')), [3])
+        self.assertEqual(self.get_pks(queryset.filter(zip_code__isnull=True)), [3])
+        self.assertEqual(len(queryset.filter(zip_code__isnull='False')), 2)
+        self.assertEqual(self.get_pks(queryset.search('bob example', ['^email'])), [2])
+        with self.assertRaises(UnsupportedLookup):
+            queryset.filter(first_name='Ann')
+        with self.assertRaises(UnsupportedLookup):
+            queryset.filter(email__regex='.*')
+
+    def test_rows(self):
+        self.mirror.sync()
+        queryset = self.mirror.queryset().order_by('email', 'unknown')
+        self.assertEqual(queryset.query.order_by, ['email'])
+        row = queryset[0]
+        self.assertEqual((row.email, row.tags), ('ann@example.com', ['a']))
+        self.assertEqual([row.pk for row in queryset[1:3]], [2, 3])
+        with self.assertRaises(IndexError):
+            queryset[3]
+
+    def test_sync(self):
+        self.mirror.sync()
+        self.assertEqual(self.mirror.get_state('last_modified'), '2016-01-03')
+        self.queryset.values.return_value = [dict(self.profiles[0], modified_at='2016-01-04')]
+        self.mirror.sync()
+        self.queryset.filter.assert_called_once_with(modified_since='2016-01-03')
+        self.assertEqual(self.mirror.get_state('last_modified'), '2016-01-04')
+        self.assertEqual(self.mirror.queryset().count(), 3)
+
+        self.mirror.sync(full=True)
+        self.assertEqual(self.mirror.queryset().count(), 1)
+
+    def test_refresh(self):
+        self.mirror.refresh()
+        self.mirror.refresh()
+        self.assertEqual(self.queryset.values.call_count, 1)
+        self.mirror.invalidate()
+        self.assertTrue(self.mirror.is_stale())
+        self.mirror.refresh()
+        self.assertEqual(self.queryset.filter.call_count, 1)
+        self.mirror.full_sync_interval = 0
+        self.mirror.invalidate()
+        self.mirror.refresh()
+        self.assertEqual(self.queryset.filter.call_count, 1)
+
+    def test_not_ready(self):
+        backend = mock.Mock()
+        with mock.patch('rest_admin.mirror.get_job_backend', return_value=backend):
+            for _ in range(2):
+                with self.assertRaises(MirrorNotReady):
+                    self.mirror.queryset()
+        self.assertEqual(backend.submit.call_count, 1)
+        job, func = backend.submit.call_args[0]
+        func(job)
+        self.assertEqual(self.mirror.queryset().count(), 3)
+        self.assertFalse(self.mirror._sync_scheduled)
+
+    def test_writes(self):
+        self.mirror.sync()
+        obj = FakeResource(self.model, dict(self.profiles[1], email='bo@example.com'))
+        self.mirror.update_object(obj)
+        self.assertEqual(self.get_pks(self.mirror.queryset().filter(email='bo@example.com')), [2])
+        self.mirror.remove_object(obj)
+        self.assertEqual(self.mirror.queryset().count(), 2)
+
+    @override_settings(REST_ADMIN_MIRROR_DIR=None)
+    def test_sync_command_needs_shared_mirrors(self):
+        with self.assertRaises(CommandError):
+            call_command('sync_mirrors')
+
+
+class PagePrefetcherTests(SimpleTestCase):
+    def setUp(self):
+        self.prefetcher = PagePrefetcher(workers=1)
+        self.addCleanup(self.prefetcher.pool.terminate)
+
+    def wait(self):
+        self.prefetcher.pool.close()
+        self.prefetcher.pool.join()
+
+    def test_prefetch(self):
+        priorities = []
+
+        def fetch():
+            priorities.append(ratelimit.get_priority())
+            return ['row']
+
+        self.prefetcher.prefetch('session', 'query', 1, fetch)
+        self.wait()
+        self.assertEqual(priorities, [ratelimit.BULK])
+        self.assertIsNone(self.prefetcher.get('session', 'other query', 1))
+        self.assertIsNone(self.prefetcher.get('session', 'query', 2))
+        self.assertEqual(self.prefetcher.get('session', 'query', 1), ['row'])
+        self.assertIsNone(self.prefetcher.get('session', 'query', 1))
+
+    def test_cancelled_by_other_query(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        self.prefetcher.prefetch('session', 'query', 1, lambda: release.wait(5) and ['row'])
+        self.prefetcher.prefetch('session', 'query', 2, mock.Mock())
+        self.prefetcher.get('session', 'other query', 0)
+        release.set()
+        self.wait()
+        self.assertEqual(self.prefetcher.pages, {})
+        self.assertEqual(self.prefetcher.pending, set())
+
+    def test_sessions(self):
+        self.prefetcher.max_sessions = 2
+        for session_key in ('a', 'b', 'c'):
+            self.prefetcher.set_query(session_key, 'query')
+        self.assertEqual(list(self.prefetcher.queries), ['b', 'c'])
+        self.assertTrue(self.prefetcher.is_current(('b', 'query', 1)))
+        later = time.time() + self.prefetcher.ttl + 1
+        with mock.patch('rest_admin.prefetch.time.time', return_value=later):
+            self.assertFalse(self.prefetcher.is_current(('b', 'query', 1)))
+            self.prefetcher.set_query('d', 'query')
+        self.assertEqual(list(self.prefetcher.queries), ['d'])
+
+    def test_pending_limit(self):
+        self.prefetcher.max_pending = 0
+        fetch = mock.Mock()
+        self.prefetcher.prefetch('session', 'query', 1, fetch)
+        self.wait()
+        self.assertFalse(fetch.called)
+
+    def test_failure(self):
+        with mock.patch('rest_admin.prefetch.logger') as logger:
+            self.prefetcher.prefetch('session', 'query', 1, mock.Mock(side_effect=UpstreamError))
+            self.wait()
+        self.assertTrue(logger.warning.called)
+        self.assertIsNone(self.prefetcher.get('session', 'query', 1))
+
+
+class ImporterTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.saved = []
+        self.failures = {}
+        test = self
+
+        class ImportedObject(object):
+            def __init__(self, data):
+                self.data = data
+
+            def save(self):
+                failure = test.failures.get(self.data['email'])
+                if failure is not None:
+                    failure()
+                test.saved.append(self.data['email'])
+
+        class ProfileForm(object):
+            def __init__(self, data):
+                self.data = data
+                self.errors = {}
+
+            def is_valid(self):
+                if '@' not in self.data['email']:
+                    self.errors['email'] = ['Enter a valid email address.']
+                return not self.errors
+
+            def save(self, commit=True):
+                return ImportedObject(self.data)
+
+        self.client = FakeClient()
+        self.model_admin = mock.Mock(model=fake_model('Profile', ('id', 'email'), self.client))
+        self.model_admin.get_form.return_value = ProfileForm
+        self.mirror = self.model_admin.get_mirror.return_value
+
+    def write_file(self, emails, file_format='jsonl'):
+        path = os.path.join(self.directory, 'profiles.%s' % file_format)
+        with open(path, 'w') as f:
+            if file_format == 'csv':
+                f.write('email,name\n')
+                f.writelines('%s,\n' % email for email in emails)
+            else:
+                f.writelines('{"email": "%s"}\n\n' % email for email in emails)
+        return path
+
+    def get_importer(self, emails, file_format='jsonl', **options):
+        return ResourceImporter(
+            self.model_admin, None, self.write_file(emails, file_format), file_format, **options)
+
+    def test_import(self):
+        importer = self.get_importer(['a@example.com', 'b', 'c@example.com', 'd@example.com'],
+                                     'csv', chunk_size=2, start_row=2, skip_rows=[4])
+        job = Job('Import')
+        message = importer.run(job)
+        self.assertEqual(self.saved, ['c@example.com'])
+        self.assertEqual(importer.errors, ['Row 2: email: Enter a valid email address.'])
+        self.assertEqual(message, '1 profiles were imported, 1 rows had errors.')
+        self.assertEqual((job.done, job.total), (2, 2))
+        self.assertTrue(self.mirror.invalidate.called)
+
+    def test_stopped(self):
+        self.failures['c@example.com'] = mock.Mock(side_effect=UpstreamError('upstream down'))
+        importer = self.get_importer(
+            ['a@example.com', 'b@example.com', 'c@example.com', 'd@example.com'],
+            chunk_size=2, concurrency=1)
+        with self.assertRaises(ImportStopped) as cm:
+            importer.run()
+        self.assertEqual(cm.exception.row, 3)
+        self.assertEqual(cm.exception.skip_rows, [])
+        self.assertIn('after 2 rows were imported', force_text(cm.exception))
+        self.assertEqual(self.saved, ['a@example.com', 'b@example.com'])
+
+    def test_rows_written_after_failure(self):
+        written = threading.Semaphore(0)
+
+        def fail():
+            # Fails once the other rows of the chunk are written.
+            for _ in range(2):
+                written.acquire()
+            raise UpstreamError('upstream down')
+
+        def save():
+            written.release()
+
+        self.failures.update({
+            'a@example.com': fail, 'b@example.com': save, 'c@example.com': save})
+        importer = self.get_importer(
+            ['a@example.com', 'b@example.com', 'c@example.com', 'd@example.com'],
+            chunk_size=3, concurrency=3, skip_rows=[7])
+        with self.assertRaises(ImportStopped) as cm:
+            importer.run()
+        self.assertEqual(cm.exception.row, 1)
+        self.assertEqual(cm.exception.skip_rows, [2, 3, 7])
+        self.assertIn('skipping rows 2, 3, 7', force_text(cm.exception))
+        self.assertEqual(sorted(self.saved), ['b@example.com', 'c@example.com'])
+        self.assertTrue(self.mirror.invalidate.called)
+
+    def test_batch(self):
+        self.client.responses = [FakeResponse(), FakeResponse(status=500)]
+        importer = self.get_importer(
+            ['a@example.com', 'b@example.com', 'c@example.com'], chunk_size=2,
+            batch_endpoint='profiles/batch/')
+        with self.assertRaises(ImportStopped) as cm:
+            importer.run()
+        self.assertEqual(cm.exception.row, 3)
+        uri, method, body, headers = self.client.requests[0]
+        self.assertEqual((uri, method), ('http://api.example.com/profiles/batch/', 'POST'))
+        self.assertEqual(body, [{'email': 'a@example.com'}, {'email': 'b@example.com'}])
+        self.assertEqual(importer.imported, 2)
+
+    def test_form_skip_rows(self):
+        form = ImportForm(data={'format': 'csv', 'start_row': '1', 'skip_rows': '7, 3,7'})
+        form.is_valid()
+        self.assertEqual(form.cleaned_data['skip_rows'], [3, 7])
+        form = ImportForm(data={'format': 'csv', 'start_row': '1', 'skip_rows': '3-7'})
+        self.assertIn('skip_rows', form.errors)
+
+
+class MemoizedHooksTests(RestAdminTestMixin, SimpleTestCase):
+    def setUp(self):
+        super(MemoizedHooksTests, self).setUp()
+        patch = mock.patch.object(ModelAdmin, 'get_readonly_fields', autospec=True,
+                                  side_effect=lambda model_admin, request, obj=None: ['email'])
+        self.get_readonly_fields = patch.start()
+        self.addCleanup(patch.stop)
+        self.model_admin = self.get_admin(
+            fieldsets=[(None, {'fields': ['email', 'first_name']})])
+
+    def test_memoized_per_request_and_object(self):
+        request = self.get_request()
+        obj = FakeResource(self.model, {'id': 1})
+        for _ in range(2):
+            self.assertEqual(self.model_admin.get_readonly_fields(request, obj), ['email'])
+            self.model_admin.get_readonly_fields(request, FakeResource(self.model, {'id': 1}))
+        self.assertEqual(self.get_readonly_fields.call_count, 1)
+        self.model_admin.get_readonly_fields(request)
+        self.model_admin.get_readonly_fields(request, FakeResource(self.model, {'id': 2}))
+        self.model_admin.get_readonly_fields(self.get_request(), obj)
+        self.model_admin.get_readonly_fields(None, obj)
+        self.assertEqual(self.get_readonly_fields.call_count, 5)
+
+    def test_unsaved_objects(self):
+        request = self.get_request()
+        new_objects = [FakeResource(self.model, {'id': None}) for _ in range(2)]
+        for obj in new_objects + new_objects:
+            self.model_admin.get_readonly_fields(request, obj)
+        self.assertEqual(self.get_readonly_fields.call_count, 2)
+
+    def test_copies(self):
+        request = self.get_request()
+        fieldsets = self.model_admin.get_fieldsets(request)
+        fieldsets[0][1]['fields'].append('last_name')
+        self.assertEqual(self.model_admin.get_fieldsets(request),
+                         [(None, {'fields': ['email', 'first_name']})])
+        self.model_admin.get_readonly_fields(request).append('first_name')
+        self.assertEqual(self.model_admin.get_readonly_fields(request), ['email'])
+
+
+class NoteForm(LazyFieldsFormMixin, forms.Form):
+    admin_site = rest_admin.site
+    title = forms.CharField()
+    body = forms.CharField(widget=LazyTextarea(min_size=10), required=False)
+
+    def __init__(self, data=None, instance=None, **kwargs):
+        self.instance = instance
+        super(NoteForm, self).__init__(data, **kwargs)
+
+
+class LazyFieldsTests(SimpleTestCase):
+    def setUp(self):
+        self.instance = FakeResource(fake_model('Note', ('id', 'title', 'body')), {'id': 7})
+        self.initial = {'title': 'Minutes', 'body': 'x' * 20}
+
+    def test_unloaded(self):
+        data = QueryDict('', mutable=True)
+        data.update({'title': 'Notes', 'body' + LAZY_SUFFIX: '1'})
+        data._mutable = False
+        form = NoteForm(data, instance=self.instance, initial=self.initial)
+        self.assertEqual(form.unloaded_fields, set(['body']))
+        self.assertNotIn('body', data)
+        self.assertEqual(form.data['body'], 'x' * 20)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.changed_data, ['title'])
+        self.assertNotIn('body', form.cleaned_data)
+
+    def test_loaded(self):
+        data = QueryDict('title=Minutes&body=short&body%s=1' % LAZY_SUFFIX)
+        form = NoteForm(data, instance=self.instance, initial=self.initial)
+        self.assertIs(form.data, data)
+        self.assertEqual(form.unloaded_fields, set())
+        self.assertEqual(form.changed_data, ['body'])
+
+    def test_render(self):
+        form = NoteForm(instance=self.instance, initial=self.initial)
+        widget = form.fields['body'].widget
+        self.assertEqual(widget.load_url, '/admin/lazy-field/tests/note/7/body/')
+        html = widget.render('body', 'x' * 20)
+        self.assertIn('data-url="/admin/lazy-field/tests/note/7/body/"', html)
+        self.assertIn('name="body%s"' % LAZY_SUFFIX, html)
+        self.assertIn('disabled', html)
+        self.assertNotIn('x' * 20, html)
+        self.assertIn('short</textarea>', widget.render('body', 'short'))
+
+        new_form = NoteForm(instance=FakeResource(self.instance, {'id': None}))
+        self.assertIsNone(new_form.fields['body'].widget.load_url)
+
+    def get_saved_instance(self, saved):
+        instance = FakeResource(self.instance, {'id': 7, 'title': 'Notes', 'body': None})
+        instance.save = lambda: saved.append(dict(instance.data))
+        return instance
+
+    def test_full_update(self):
+        saved = []
+        instance = self.get_saved_instance(saved)
+        model_admin = RestAdmin(fake_model('Note', ('id', 'title', 'body')), rest_admin.site)
+        form = mock.Mock(unloaded_fields=set(['body']))
+        model_admin.save_model(None, instance, form, change=True)
+        self.assertEqual(saved, [{'id': 7, 'title': 'Notes'}])
+        self.assertEqual(instance.data['body'], None)
+
+    def test_full_update_of_inline_rows(self):
+        saved = []
+        instance = self.get_saved_instance(saved)
+        formset = mock.Mock(
+            forms=[mock.Mock(instance=instance, unloaded_fields=set(['body']))],
+            deleted_objects=[], new_objects=[], changed_objects=[(instance, ['title'])])
+        formset.save.return_value = [instance]
+        model_admin = RestAdmin(fake_model('Note', ('id', 'title', 'body')), rest_admin.site)
+        model_admin.save_formset(None, None, formset, change=True)
+        formset.save.assert_called_once_with(commit=False)
+        self.assertEqual(saved, [{'id': 7, 'title': 'Notes'}])
+
+
+class ManualTokenStore(object):
+    """Hands out the tokens the test adds."""
+
+    def __init__(self):
+        self.tokens = 0
+        self.lock = threading.Lock()
+
+    def take(self, name, rate, burst):
+        with self.lock:
+            if self.tokens:
+                self.tokens -= 1
+                return 0
+        return 0.01
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_take(self):
+        self.assertEqual(ratelimit._take(0.5, 100, 2.0, 3, 100.25), (0.0, 0.0))
+        self.assertEqual(ratelimit._take(0, 100, 2.0, 3, 100), (0, 0.5))
+        self.assertEqual(ratelimit._take(3, 100, 2.0, 3, 200), (2, 0.0))
+
+    def test_burst(self):
+        bucket = ratelimit.TokenBucket('tests', rate=0.01, burst=2)
+        bucket.acquire()
+        bucket.acquire(ratelimit.BULK)
+        with self.assertRaises(RateLimited):
+            bucket.acquire(timeout=0.01)
+        metrics = bucket.metrics()
+        self.assertEqual((metrics['rate'], metrics['burst']), (0.01, 2))
+        self.assertEqual(metrics[ratelimit.INTERACTIVE]['requests'], 1)
+        self.assertEqual(metrics[ratelimit.INTERACTIVE]['timeouts'], 1)
+        self.assertEqual(metrics[ratelimit.BULK]['requests'], 1)
+        self.assertEqual(metrics[ratelimit.BULK]['queued'], 0)
+
+    def test_interactive_first(self):
+        store = ManualTokenStore()
+        bucket = ratelimit.TokenBucket('tests', rate=1, store=store)
+        served = []
+
+        def acquire(priority):
+            bucket.acquire(priority, timeout=5)
+            served.append(priority)
+
+        def wait_for(condition):
+            for _ in range(500):
+                if condition():
+                    return
+                time.sleep(0.01)
+            self.fail("timed out")
+
+        threads = []
+        for priority in (ratelimit.BULK, ratelimit.INTERACTIVE):
+            threads.append(threading.Thread(target=acquire, args=(priority,)))
+            threads[-1].start()
+            wait_for(lambda: bucket.queues[priority])
+        store.tokens = 1
+        wait_for(lambda: served)
+        self.assertEqual(served, [ratelimit.INTERACTIVE])
+        store.tokens = 1
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(served, [ratelimit.INTERACTIVE, ratelimit.BULK])
+        self.assertEqual(bucket.metrics()[ratelimit.BULK]['waited'], 1)
+
+    def test_file_store(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.assertEqual(ratelimit.FileTokenStore(directory).take('tests', 0.01, 2), 0)
+        self.assertEqual(ratelimit.FileTokenStore(directory).take('tests', 0.01, 2), 0)
+        self.assertGreater(ratelimit.FileTokenStore(directory).take('tests', 0.01, 2), 0)
+        self.assertEqual(ratelimit.FileTokenStore(directory).take('other', 0.01, 2), 0)
+
+    def test_priority(self):
+        self.assertEqual(ratelimit.get_priority(), ratelimit.INTERACTIVE)
+        with ratelimit.priority(ratelimit.BULK):
+            self.assertEqual(ratelimit.get_priority(), ratelimit.BULK)
+        self.assertEqual(ratelimit.get_priority(), ratelimit.INTERACTIVE)
+
+
+class RateLimitClient(clients.RateLimitClientMixin, FakeClient):
+    rate_limit = 0.01
+    rate_limit_burst = 1
+    rate_limit_timeout = 0
+
+
+class RateLimitClientTests(SimpleTestCase):
+    def setUp(self):
+        # Buckets are shared by name, give each test an API of its own.
+        self.client = RateLimitClient()
+        self.client.root_uri = 'http://%s.example.com/' % uuid.uuid4().hex
+
+    def test_rate_limit(self):
+        self.client.request(self.client.root_uri + 'profiles/')
+        with self.assertRaises(RateLimited):
+            self.client.request(self.client.root_uri + 'subscriptions/')
+        self.assertEqual(len(self.client.requests), 1)
+        metrics = ratelimit.get_metrics()[self.client.root_uri]
+        self.assertEqual(metrics[ratelimit.INTERACTIVE]['timeouts'], 1)
+
+    def test_per_resource(self):
+        self.client.rate_limit_per_resource = True
+        self.client.request(self.client.root_uri + 'profiles/')
+        self.client.request(self.client.root_uri + 'subscriptions/')
+        with self.assertRaises(RateLimited):
+            self.client.request(self.client.root_uri + 'profiles/1/')
+
+    def test_disabled(self):
+        self.client.rate_limit = None
+        for _ in range(3):
+            self.client.request(self.client.root_uri + 'profiles/')
+        self.assertNotIn(self.client.root_uri, ratelimit.get_metrics())
+
+
+class DeadlineTests(SimpleTestCase):
+    def tearDown(self):
+        deadlines.clear_deadline()
+
+    def test_earliest_wins(self):
+        self.assertIsNone(deadlines.remaining())
+        self.assertIsNone(deadlines.set_deadline(10))
+        first = deadlines.get_deadline()
+        self.assertEqual(deadlines.set_deadline(20), first)
+        self.assertEqual(deadlines.get_deadline(), first)
+        with deadlines.deadline(5):
+            self.assertLessEqual(deadlines.remaining(), 5)
+            with deadlines.deadline(None):
+                self.assertLessEqual(deadlines.remaining(), 5)
+        self.assertEqual(deadlines.get_deadline(), first)
+
+    def test_check(self):
+        self.assertIsNone(deadlines.check())
+        deadlines.set_deadline(10)
+        self.assertTrue(0 < deadlines.check() <= 10)
+        deadlines.clear_deadline()
+        deadlines.set_deadline(-1)
+        with self.assertRaises(DeadlineExceeded):
+            deadlines.check()
+
+    def test_has_budget(self):
+        self.assertTrue(deadlines.has_budget())
+        deadlines.set_deadline(0.5)
+        self.assertFalse(deadlines.has_budget())
+        self.assertTrue(deadlines.has_budget(0.1))
+        with self.settings(REST_ADMIN_OPTIONAL_WORK_BUDGET=0.1):
+            self.assertTrue(deadlines.has_budget())
+
+    def test_middleware(self):
+        middleware = DeadlineMiddleware()
+        request = RequestFactory().get('/')
+        deadlines.set_deadline(-1)
+        middleware.process_request(request)
+        self.assertIsNone(deadlines.get_deadline())
+        with self.settings(REST_ADMIN_REQUEST_DEADLINE=10):
+            middleware.process_request(request)
+        self.assertLessEqual(deadlines.remaining(), 10)
+        response = object()
+        self.assertIs(middleware.process_response(request, response), response)
+        self.assertIsNone(deadlines.get_deadline())
+        deadlines.set_deadline(10)
+        middleware.process_exception(request, UpstreamError('upstream down'))
+        self.assertIsNone(deadlines.get_deadline())
+
+
+class FakeTemplateResponse(SimpleTemplateResponse):
+    """Calls ``on_render`` when rendered."""
+
+    def __init__(self, on_render=lambda: None):
+        super(FakeTemplateResponse, self).__init__('page.html')
+        self.on_render = on_render
+        self.renders = 0
+
+    @property
+    def rendered_content(self):
+        self.renders += 1
+        self.on_render()
+        return 'page %d' % self.renders
+
+
+class AdminViewTests(RestAdminTestMixin, SimpleTestCase):
+    class Views(object):
+        request_deadline = 10
+
+        def __init__(self, get_response):
+            self.get_response = get_response
+
+        def view(self, request):
+            return self.get_response()
+
+    def setUp(self):
+        super(AdminViewTests, self).setUp()
+        patch = mock.patch('rest_admin.sites.messages')
+        self.messages = patch.start()
+        self.addCleanup(patch.stop)
+        self.addCleanup(deadlines.clear_deadline)
+
+    def get_response(self, get_response):
+        view = self.site.admin_view(self.Views(get_response).view)
+        return view(self.get_request())
+
+    def test_rendered_within_deadline(self):
+        remaining = []
+        response = self.get_response(lambda: FakeTemplateResponse(
+            lambda: remaining.append(deadlines.remaining())))
+        # Rendered by the handler, after the template response middleware.
+        self.assertEqual(response.renders, 0)
+        self.assertIsNone(deadlines.get_deadline())
+        callback = mock.Mock(return_value=None)
+        response.add_post_render_callback(callback)
+        response = response.render()
+        self.assertEqual(response.content, b'page 1')
+        self.assertTrue(0 < remaining[0] <= 10)
+        self.assertIsNone(deadlines.get_deadline())
+        callback.assert_called_once_with(response)
+        self.assertNotIn('render', response.__dict__)
+        self.assertIs(response.render(), response)
+        self.assertEqual(response.renders, 1)
+
+    def test_render_past_deadline(self):
+        self.Views = type(str('Views'), (self.Views,), {'request_deadline': 0.01})
+        response = self.get_response(lambda: FakeTemplateResponse(deadlines.check))
+        time.sleep(0.02)
+        with mock.patch.object(self.site, 'unavailable_view') as unavailable_view:
+            rendered = response.render()
+        self.assertIs(rendered, unavailable_view.return_value.render.return_value)
+        self.assertIsInstance(unavailable_view.call_args[0][1], DeadlineExceeded)
+
+    def test_unavailable(self):
+        def unavailable():
+            raise ResourceUnavailable('profiles are unavailable')
+
+        response = self.get_response(unavailable)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.template_name, 'admin/rest_admin/unavailable.html')
+        response = self.get_response(lambda: FakeTemplateResponse(unavailable))
+        with mock.patch.object(self.site, 'unavailable_view') as unavailable_view:
+            rendered = response.render()
+        self.assertIs(rendered, unavailable_view.return_value.render.return_value)
+        self.assertEqual(str(unavailable_view.call_args[0][1]), 'profiles are unavailable')
+        self.assertEqual(self.messages.error.call_count, 1)
+
+    def test_stale_warning(self):
+        uri = FakeClient.root_uri + 'profiles/1/'
+        response = self.get_response(lambda: FakeTemplateResponse(lambda: add_stale(uri)))
+        self.assertEqual(self.messages.warning.call_count, 0)
+        self.assertEqual(response.render().content, b'page 1')
+        self.assertEqual(self.messages.warning.call_count, 1)
+
+        def view_stale():
+            add_stale(uri)
+            return FakeTemplateResponse(lambda: add_stale(uri))
+
+        response = self.get_response(view_stale)
+        self.assertEqual(self.messages.warning.call_count, 2)
+        self.assertEqual(response.render().content, b'page 1')
+        self.assertEqual(self.messages.warning.call_count, 2)
+
+
+class LookupQuerySet(list):
+    def __init__(self, objs):
+        super(LookupQuerySet, self).__init__(objs)
+        self.filters = []
+
+    def filter(self, **kwargs):
+        self.filters.append(kwargs)
+        return self
+
+
+class LookupTests(RestAdminTestMixin, SimpleTestCase):
+    def setUp(self):
+        super(LookupTests, self).setUp()
+        self.addCleanup(deadlines.clear_deadline)
+        self.objs = [
+            FakeResource(self.model, {'id': pk, 'email': 'p%s@example.com' % pk,
+                                      'first_name': 'Ann', 'last_name': ''})
+            for pk in range(1, 4)]
+        self.queryset = LookupQuerySet(self.objs)
+        self.model_admin = self.get_admin(
+            lookup_fields=['first_name', 'last_name'], lookup_per_page=2,
+            sparse_fields_param='only')
+        for name in ('to_field_allowed', 'lookup_allowed'):
+            patch = mock.patch.object(self.model_admin, name, return_value=True)
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.model_admin.get_queryset = lambda request: self.queryset
+
+    def get_json(self, **params):
+        params['_format'] = 'json'
+        response = self.model_admin.lookup_view(self.get_request(data=params))
+        return json.loads(force_text(response.content))
+
+    def test_sparse_fields(self):
+        self.assertEqual(self.model_admin.get_lookup_sparse_fields(None, 'email'),
+                         ['email', 'first_name', 'id', 'last_name'])
+        self.assertIsNone(self.get_admin().get_lookup_sparse_fields(None))
+
+    def test_labels(self):
+        self.assertEqual(self.model_admin.get_lookup_label(self.objs[0]), 'Ann')
+        self.assertEqual(self.get_admin().get_lookup_label(self.objs[0]), 'Profile 1')
+
+    def test_json_pages(self):
+        self.assertEqual(self.get_json(), {
+            'results': [{'id': '1', 'label': 'Ann'}, {'id': '2', 'label': 'Ann'}],
+            'page': 0,
+            'has_next': True,
+        })
+        self.assertEqual(self.queryset.filters, [{'only': 'first_name,id,last_name'}])
+        self.assertEqual(self.get_json(p='1'), {
+            'results': [{'id': '3', 'label': 'Ann'}],
+            'page': 1,
+            'has_next': False,
+        })
+        self.assertEqual(self.get_json(p='x')['page'], 0)
+
+    def test_json_to_field(self):
+        data = self.get_json(_to_field='email', is_active='1')
+        self.assertEqual([result['id'] for result in data['results']],
+                         ['p1@example.com', 'p2@example.com'])
+        self.assertEqual(self.queryset.filters, [
+            {'only': 'email,first_name,id,last_name'}, {'is_active': '1'}])
+        self.model_admin.lookup_allowed.assert_called_once_with('is_active', '1')
+
+    def test_permissions(self):
+        with self.assertRaises(PermissionDenied):
+            self.model_admin.lookup_view(self.get_request(perms=False))
+        self.model_admin.to_field_allowed.return_value = False
+        with self.assertRaises(DisallowedModelAdminToField):
+            self.model_admin.lookup_view(self.get_request(data={'_to_field': 'email'}))
+        self.model_admin.lookup_allowed.return_value = False
+        with self.assertRaises(DisallowedModelAdminLookup):
+            self.model_admin.lookup_view(self.get_request(data={'password': 'x'}))
+
+
+class RawIdWidgetTests(RestAdminTestMixin, SimpleTestCase):
+    def setUp(self):
+        super(RawIdWidgetTests, self).setUp()
+        self.addCleanup(deadlines.clear_deadline)
+        self.site._registry[self.model] = mock.Mock(raw_id_lookup=True)
+        self.rel = mock.Mock(to=self.model, limit_choices_to={'is_active': True})
+        self.rel.get_related_field.return_value = self.model._meta.get_field('email')
+        patch = mock.patch('rest_admin.widgets.reverse', return_value='/admin/tests/profile/lookup/')
+        self.reverse = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_lookup_url(self):
+        widget = ToOneFieldRawIdWidget(self.rel, self.site)
+        self.assertEqual(widget.get_lookup_url(),
+                         '/admin/tests/profile/lookup/?_to_field=email&is_active=1')
+        self.reverse.assert_called_once_with('admin:tests_profile_lookup', current_app='tests')
+
+        self.reverse.side_effect = NoReverseMatch
+        self.assertIsNone(widget.get_lookup_url())
+        self.site._registry[self.model].raw_id_lookup = False
+        self.assertIsNone(widget.get_lookup_url())
+
+    def test_to_one(self):
+        widget = ToOneFieldRawIdWidget(self.rel, self.site)
+        output = widget.render('owner', None)
+        self.assertIn('class="vForeignKeyRawIdAdminField"', output)
+        self.assertIn('href="/admin/tests/profile/lookup/?_to_field=email&amp;is_active=1"',
+                      output)
+        self.assertIn('id="lookup_id_owner"', output)
+
+        # The label of the value is left out when short on time.
+        deadlines.set_deadline(0.5)
+        output = widget.render('owner', mock.Mock(spec=Resource, pk=7))
+        self.assertIn('value="7"', output)
+        self.assertTrue(output.endswith('</a>'))
+
+    def test_to_many(self):
+        widget = ToManyFieldRawIdWidget(self.rel, self.site)
+        output = widget.render('members', [1, 2], {'id': 'id_members'})
+        self.assertIn('class="vManyToManyRawIdAdminField"', output)
+        self.assertIn('value="1,2"', output)
+        self.assertIn('href="/admin/tests/profile/lookup/?is_active=1"', output)
+        self.assertNotIn('value=', widget.render('members', None))
+
+    def test_no_lookup(self):
+        self.site._registry[self.model].raw_id_lookup = False
+        with mock.patch('django.contrib.admin.widgets.ForeignKeyRawIdWidget.render',
+                        return_value='changelist') as render:
+            widget = ToOneFieldRawIdWidget(self.rel, self.site)
+            self.assertEqual(widget.render('owner', None), 'changelist')
+        render.assert_called_once_with('owner', None, None)
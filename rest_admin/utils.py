@@ -28,3 +28,12 @@ def lookup_field(name, obj, model_admin=None):
         attr = None
         value = getattr(obj, name)
     return f, attr, value
+
+
+def get_request_cache(request, namespace):
+    """
+    Returns a dict living as long as ``request`` for memoizing ``namespace``
+    lookups.
+    """
+    cache = request.__dict__.setdefault('_rest_admin_cache', {})
+    return cache.setdefault(namespace, {})
@@ -1,6 +1,72 @@
+from django.core.exceptions import (
+    FieldDoesNotExist, ImproperlyConfigured, SuspiciousOperation
+)
 from django.contrib.admin.views.main import (
-    ChangeList, InvalidPage, IncorrectLookupParameters, SEARCH_VAR
+    ChangeList, InvalidPage, IncorrectLookupParameters, PAGE_VAR, SEARCH_VAR
 )
+from django.utils import six
+from django.utils.encoding import python_2_unicode_compatible
+
+from . import deadlines
+from .mirror import MirrorQuerySet, UnsupportedLookup
+from .prefetch import get_prefetcher
+
+
+class ResourceRow(object):
+    """
+    Read-only stand-in for a resource on the changelist. Rows are built from
+    the raw upstream data and only hold the fields that are displayed.
+    """
+    __slots__ = ()
+    _meta = None
+
+    def __init__(self, data):
+        for name in self.__slots__:
+            value = data.get(name)
+            try:
+                field = self._meta.get_field(name)
+            except FieldDoesNotExist:
+                pass
+            else:
+                if value is not None and not getattr(field, 'is_relation', False):
+                    value = field.to_python(value)
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is read-only." % type(self).__name__)
+
+    @property
+    def pk(self):
+        return getattr(self, self._meta.pk.attname)
+
+    def serializable_value(self, field_name):
+        return getattr(self, field_name)
+
+
+_row_classes = {}
+
+
+def row_class_factory(model, fields):
+    """
+    Returns a ``ResourceRow`` subclass for ``model`` with a slot for each one
+    of ``fields``. Classes are cached per model and field set.
+    """
+    key = (model, tuple(fields))
+    if key not in _row_classes:
+        attrs = {
+            '__slots__': tuple(fields),
+            '__module__': model.__module__,
+            '_meta': model._meta,
+        }
+        # Borrow the resource's string representation.
+        str_method = getattr(model, '__unicode__' if six.PY2 else '__str__', None)
+        if str_method is not None:
+            attrs['__str__'] = six.get_unbound_function(str_method)
+        row_class = type(str('%sRow' % model.__name__), (ResourceRow,), attrs)
+        if '__str__' in attrs:
+            row_class = python_2_unicode_compatible(row_class)
+        _row_classes[key] = row_class
+    return _row_classes[key]
 
 
 class RestChangeList(ChangeList):
@@ -15,9 +81,17 @@ class RestChangeList(ChangeList):
         # Perform a slight optimization:
         # full_result_count is equal to paginator.count if no filters
         # were applied
-        if self.model_admin.show_full_result_count:
-            if self.get_filters_params() or self.params.get(SEARCH_VAR):
-                full_result_count = self.root_queryset.count()
+        show_full_result_count = self.model_admin.show_full_result_count
+        filtered = bool(self.get_filters_params() or self.params.get(SEARCH_VAR))
+        if filtered and not isinstance(self.queryset, MirrorQuerySet) and \
+                not deadlines.has_budget():
+            show_full_result_count = False
+        if show_full_result_count:
+            if filtered:
+                if isinstance(self.queryset, MirrorQuerySet):
+                    full_result_count = MirrorQuerySet(self.queryset.mirror).count()
+                else:
+                    full_result_count = self.root_queryset.count()
             else:
                 full_result_count = result_count
         else:
@@ -26,16 +100,28 @@ class RestChangeList(ChangeList):
         multi_page = result_count > self.list_per_page
 
         # Get the list of objects to display on this page.
+        prefetch = self.model_admin.prefetch_next_page and not isinstance(
+            self.queryset, MirrorQuerySet)
         if (self.show_all and can_show_all) or not multi_page:
-            result_list = self.queryset._clone()
+            result_list = self.prepare_results(request, self.queryset._clone())
         else:
-            try:
-                result_list = paginator.page(self.page_num + 1).object_list
-            except InvalidPage:
-                raise IncorrectLookupParameters
+            result_list = None
+            if prefetch:
+                result_list = get_prefetcher().get(
+                    self.get_prefetch_session_key(request), self.get_prefetch_query_key(),
+                    self.page_num)
+            if result_list is None:
+                try:
+                    result_list = paginator.page(self.page_num + 1).object_list
+                except InvalidPage:
+                    raise IncorrectLookupParameters
+                result_list = self.prepare_results(request, result_list)
+            if prefetch and self.page_num + 1 < paginator.num_pages and \
+                    deadlines.has_budget():
+                self.prefetch_page(request, paginator, self.page_num + 1)
 
         self.result_count = result_count
-        self.show_full_result_count = self.model_admin.show_full_result_count
+        self.show_full_result_count = show_full_result_count
         # Admin actions are shown if there is at least one entry
         # or if entries are not counted because show_full_result_count is disabled
         # self.show_admin_actions = not self.show_full_result_count or \
@@ -47,14 +133,81 @@ class RestChangeList(ChangeList):
         self.multi_page = multi_page
         self.paginator = paginator
 
+    def prepare_results(self, request, result_list):
+        if (self.model_admin.changelist_rows and not self.list_editable and
+                not isinstance(self.queryset, MirrorQuerySet)):
+            return self.get_result_rows(request, result_list)
+        return result_list
+
+    def get_prefetch_session_key(self, request):
+        session_key = getattr(getattr(request, 'session', None), 'session_key', None)
+        return session_key or 'user:%s' % request.user.pk
+
+    def get_prefetch_query_key(self):
+        opts = self.model._meta
+        params = sorted((k, v) for k, v in self.params.items() if k != PAGE_VAR)
+        return (opts.app_label, opts.model_name, tuple(params))
+
+    def prefetch_page(self, request, paginator, page_num):
+        """
+        Fetches page ``page_num`` (0-based) in the background for the next
+        request of the session with the same query.
+        """
+        def fetch():
+            return list(self.prepare_results(
+                request, paginator.page(page_num + 1).object_list))
+
+        get_prefetcher().prefetch(
+            self.get_prefetch_session_key(request), self.get_prefetch_query_key(),
+            page_num, fetch)
+
+    def get_result_rows(self, request, result_list):
+        """
+        Turns ``result_list`` into a list of lightweight read-only rows
+        holding only the displayed fields.
+        """
+        fields = self.model_admin.get_changelist_sparse_fields(
+            request, self.list_display, self.list_display_links,
+            self.search_fields)
+        row_class = row_class_factory(self.model, fields)
+        return [row_class(data) for data in result_list.values(*fields)]
 
     def get_queryset(self, request):
+        mirror = self.model_admin.get_mirror()
+        if mirror is not None:
+            try:
+                return self.get_mirror_queryset(request, mirror)
+            except UnsupportedLookup:
+                # Filter on a field that isn't mirrored, ask upstream.
+                pass
+        return self.get_upstream_queryset(request)
+
+    def get_mirror_queryset(self, request, mirror):
+        (self.filter_specs, self.has_filters, remaining_lookup_params,
+         filters_use_distinct) = self.get_filters(request)
+
+        qs = mirror.queryset()
+        for filter_spec in self.filter_specs:
+            new_qs = filter_spec.queryset(request, qs)
+            if new_qs is not None:
+                qs = new_qs
+        qs = qs.filter(**remaining_lookup_params)
+        qs, search_use_distinct = self.model_admin.get_search_results(
+            request, qs, self.query)
+        return qs.order_by(*self.get_ordering(request, qs))
+
+    def get_upstream_queryset(self, request):
         # First, we collect all the declared list filters.
         (self.filter_specs, self.has_filters, remaining_lookup_params,
          filters_use_distinct) = self.get_filters(request)
 
         # Then, we let every list filter modify the queryset to its liking.
         qs = self.root_queryset
+        if self.model_admin.sparse_changelist:
+            qs = self.model_admin.apply_sparse_fields(
+                qs, self.model_admin.get_changelist_sparse_fields(
+                    request, self.list_display, self.list_display_links,
+                    self.search_fields))
         for filter_spec in self.filter_specs:
             new_qs = filter_spec.queryset(request, qs)
             if new_qs is not None:
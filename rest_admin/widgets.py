@@ -1,13 +1,115 @@
-from django.contrib.admin.widgets import ForeignKeyRawIdWidget, ManyToManyRawIdWidget
+from django.contrib.admin.widgets import (
+    AdminTextareaWidget, ForeignKeyRawIdWidget, ManyToManyRawIdWidget
+)
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.forms.widgets import TextInput
+from django.template.defaultfilters import filesizeformat
+from django.utils.encoding import force_text
+from django.utils.html import format_html
+from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
+from django.utils.translation import ugettext as _
 from restorm.resource import Resource
 
+from .deadlines import has_budget
 
-class ToOneFieldRawIdWidget(ForeignKeyRawIdWidget):
+# Suffix of the hidden input telling a lazy field was submitted unloaded.
+LAZY_SUFFIX = '__lazy'
+
+
+class LookupRawIdWidgetMixin(object):
+    """
+    Points the lookup link to the related admin's compact lookup list (see
+    ``RestAdmin.lookup_view``) instead of its changelist.
+    """
+    # The JavaScript code looks for this hook.
+    input_class = 'vForeignKeyRawIdAdminField'
+
+    def get_lookup_url(self):
+        """
+        Returns the url of the related admin's lookup list, with the widget's
+        url parameters, or None if it has none.
+        """
+        rel_to = self.rel.to
+        model_admin = self.admin_site._registry.get(rel_to)
+        if not getattr(model_admin, 'raw_id_lookup', False):
+            return None
+        try:
+            url = reverse('admin:%s_%s_lookup' % (rel_to._meta.app_label, rel_to._meta.model_name),
+                          current_app=self.admin_site.name)
+        except NoReverseMatch:
+            return None
+        params = self.url_parameters()
+        if params:
+            url = '%s?%s' % (url, urlencode(sorted(params.items())))
+        return url
+
+    def format_lookup_value(self, value):
+        return value
+
+    def render(self, name, value, attrs=None):
+        lookup_url = self.get_lookup_url()
+        if lookup_url is None:
+            return super(LookupRawIdWidgetMixin, self).render(name, value, attrs)
+        attrs = dict(attrs or {})
+        attrs.setdefault('class', self.input_class)
+        # The markup of ForeignKeyRawIdWidget.render, with the lookup url.
+        output = [
+            TextInput.render(self, name, self.format_lookup_value(value), attrs),
+            format_html(u'<a href="{}" class="related-lookup" id="lookup_id_{}" title="{}"></a>',
+                        lookup_url, name, _('Lookup')),
+        ]
+        if value:
+            output.append(self.label_for_value(value))
+        return mark_safe(''.join(output))
+
+
+class ToOneFieldRawIdWidget(LookupRawIdWidgetMixin, ForeignKeyRawIdWidget):
     def render(self, name, value, attrs=None):
         if isinstance(value, Resource):
             value = value.pk
         return super(ToOneFieldRawIdWidget, self).render(name, value, attrs)
 
+    def label_for_value(self, value):
+        # The label costs an upstream call, leave it out when short on time.
+        if not has_budget():
+            return ''
+        return super(ToOneFieldRawIdWidget, self).label_for_value(value)
 
-class ToManyFieldRawIdWidget(ManyToManyRawIdWidget):
-    pass
+
+class ToManyFieldRawIdWidget(LookupRawIdWidgetMixin, ManyToManyRawIdWidget):
+    input_class = 'vManyToManyRawIdAdminField'
+
+    def format_lookup_value(self, value):
+        return ','.join(force_text(v) for v in value) if value else ''
+
+
+class LazyTextarea(AdminTextareaWidget):
+    """
+    Textarea rendering values of ``min_size`` bytes or more as their size
+    and a link loading them from ``load_url``, which is set per form by
+    ``rest_admin.forms.LazyFieldsFormMixin``.
+    """
+
+    class Media:
+        js = ('admin/js/lazy-fields.js',)
+
+    def __init__(self, attrs=None, min_size=64 * 1024):
+        super(LazyTextarea, self).__init__(attrs)
+        self.min_size = min_size
+        self.load_url = None
+
+    def render(self, name, value, attrs=None):
+        size = len(force_text(value).encode('utf-8')) if value is not None else 0
+        if self.load_url is None or size < self.min_size:
+            return super(LazyTextarea, self).render(name, value, attrs)
+        # Disabled, the empty textarea isn't submitted until it's loaded.
+        attrs = dict(attrs or {}, disabled='disabled', style='display: none')
+        return format_html(
+            u'<div class="lazy-field" data-url="{}">'
+            u'<input type="hidden" name="{}{}" value="1">'
+            u'<span class="lazy-field-size">{}</span> '
+            u'<a href="#" class="lazy-field-load">{}</a>{}</div>',
+            self.load_url, name, LAZY_SUFFIX,
+            _('%(size)s, not loaded.') % {'size': filesizeformat(size)}, _('Load'),
+            super(LazyTextarea, self).render(name, None, attrs))
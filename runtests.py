@@ -0,0 +1,5 @@
+#!/usr/bin/env python
+from tests import runtests
+
+if __name__ == '__main__':
+    runtests()
@@ -25,7 +25,7 @@ def runtests():
         settings.INSTALLED_APPS = settings.INSTALLED_APPS + ('tests',)
 
     test_runner = TestRunner()
-    failures = test_runner.run_tests(["tests"])
+    failures = test_runner.run_tests(["rest_admin"])
     sys.exit(bool(failures))
 
 if __name__ == '__main__':
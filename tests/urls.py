@@ -0,0 +1,6 @@
+from django.conf.urls import include, url
+import rest_admin
+
+urlpatterns = [
+    url(r'^admin/', include(rest_admin.site.urls)),
+]